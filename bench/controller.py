@@ -0,0 +1,371 @@
+"""
+Offline benchmark of Toponizer and LoopDiscovery.
+
+Replays a discovery trace for a synthetic topology against the real
+components running on the stand-in POX core and reports per event
+handler latencies, convergence time, messages per switch and peak
+memory.
+
+  python -m bench.controller --topo fattree --size 8 --failures 10
+  python -m bench.controller --topo leafspine --size 16 --moves 20
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import logging
+import random
+import re
+import resource
+import struct
+import sys
+import time
+
+from bench import fakepox
+from playground import topologies
+
+
+class Fabric(object):
+    """
+    A Topology mapped to dpids, port numbers and host addresses the way
+    Mininet numbers them
+    """
+
+    @staticmethod
+    def number(name):
+        # Mininet takes the dpid from the digits in the switch name
+        return int(re.findall(r'\d+', name)[0])
+
+    def __init__(self, topo):
+        from pox.lib.addresses import EthAddr, IPAddr
+        self.topo = topo
+        self.dpids = dict((name, Fabric.number(name))
+                          for name in topo.switches)
+        # dpid -> list of port numbers
+        self.ports = dict((dpid, []) for dpid in self.dpids.itervalues())
+        # (dpid1, port1, dpid2, port2), one entry per direction pair
+        self.links = []
+        # (macaddr, ip, dpid, port)
+        self.hosts = []
+        host_index = dict((name, Fabric.number(name))
+                          for name in topo.hosts)
+        for (node1, node2) in topo.edges():
+            if node1 in host_index:
+                (node1, node2) = (node2, node1)
+            port1 = self.__next_port(node1)
+            if node2 in host_index:
+                i = host_index[node2]
+                macaddr = EthAddr(struct.pack('!HL', 0, i))
+                ip = IPAddr(struct.pack('!L', (10 << 24) + i))
+                self.hosts.append((macaddr, ip, self.dpids[node1], port1))
+            else:
+                port2 = self.__next_port(node2)
+                self.links.append((self.dpids[node1], port1,
+                                   self.dpids[node2], port2))
+
+    def __next_port(self, switch):
+        ports = self.ports[self.dpids[switch]]
+        ports.append(len(ports) + 1)
+        return ports[-1]
+
+
+def build_topology(args):
+    if args.edges:
+        with open(args.edges) as f:
+            return topologies.from_edge_list(f, name=args.edges)
+    if args.topo == 'ring':
+        return topologies.ring(args.size, args.hosts)
+    if args.topo == 'fattree':
+        return topologies.fat_tree(args.size)
+    if args.topo == 'leafspine':
+        return topologies.leaf_spine(args.size,
+                                     args.spines,
+                                     args.oversubscription)
+    return topologies.random_regular(args.size,
+                                     args.degree,
+                                     args.seed,
+                                     args.hosts)
+
+
+def percentiles(samples):
+    if not samples:
+        return {'count': 0}
+    samples = sorted(samples)
+
+    def at(fraction):
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+    return {'count': len(samples),
+            'mean_ms': 1000 * sum(samples) / len(samples),
+            'p50_ms': 1000 * at(0.5),
+            'p95_ms': 1000 * at(0.95),
+            'p99_ms': 1000 * at(0.99),
+            'max_ms': 1000 * samples[-1]}
+
+
+class Benchmark(object):
+
+    def __init__(self, args):
+        self.args = args
+        self.core = fakepox.install()
+        # Components can only be imported once the stand-in core is there
+        from playground.controller import metrics
+        from playground.controller.batch import Batcher
+        from playground.controller.convergence import ConvergenceTracker
+        from playground.controller.route_worker import RouteWorker
+        from playground.controller.toponizer import Toponizer
+        from playground.controller.loop_discovery import LoopDiscovery
+        self.metrics = metrics.enable() if args.metrics else None
+        self.core.registerNew(Batcher)
+        # Inline, the stand-in core's loop cannot wait for a thread
+        self.core.registerNew(RouteWorker, threaded=False)
+        self.core.registerNew(Toponizer, args.quiet_period, args.max_delay)
+        self.core.registerNew(LoopDiscovery,
+                              forwarding=args.forwarding,
+                              ecmp=args.ecmp)
+        self.convergence = self.core.registerNew(ConvergenceTracker,
+                                                 history=None)
+        if args.table_policy:
+            from playground.controller.table_capacity import TableCapacity
+            # Seeded on connect only, polling would keep the core busy
+            self.core.registerNew(TableCapacity,
+                                  policy=args.table_policy,
+                                  interval=0)
+        self.fabric = Fabric(build_topology(args))
+        self.rng = random.Random(args.seed)
+        self.phases = []
+        # Idle once only timers beyond the coalescing window are left
+        self.horizon = args.max_delay + args.quiet_period
+
+    def run(self):
+        self.phase('connect', self.connect)
+        self.phase('discovery', self.discover)
+        if self.args.failures:
+            self.phase('failures', self.fail_links)
+        if self.args.moves:
+            self.phase('moves', self.move_hosts)
+        if self.args.packet_ins:
+            self.phase('packet_in', self.packet_ins)
+        return self.report()
+
+    def phase(self, name, func):
+        before = self.__message_counts()
+        latencies_before = dict((key, len(samples)) for (key, samples)
+                                in self.core.latencies.iteritems())
+        changes_before = len(self.convergence.recent)
+        start = time.time()
+        func()
+        self.core.run(self.horizon)
+        duration = time.time() - start
+        after = self.__message_counts()
+        messages = {}
+        for (dpid, counts) in after.iteritems():
+            for (msg_type, count) in counts.iteritems():
+                delta = count - before.get(dpid, {}).get(msg_type, 0)
+                if delta:
+                    messages.setdefault(msg_type, []).append(delta)
+        handlers = dict(
+            (key, percentiles(samples[latencies_before.get(key, 0):]))
+            for (key, samples) in self.core.latencies.iteritems()
+            if len(samples) > latencies_before.get(key, 0))
+        changes = list(self.convergence.recent)[changes_before:]
+        self.phases.append({
+            'phase': name,
+            'convergence_s': duration,
+            'changes': percentiles([change['latency_ms'] / 1000
+                                    for change in changes]),
+            'handlers': handlers,
+            'messages': dict((msg_type, {'total': sum(counts),
+                                         'max_per_switch': max(counts)})
+                             for (msg_type, counts) in messages.iteritems()),
+        })
+        if changes:
+            self.phases[-1]['slowest_switches'] = self.__slowest_switches()
+
+    def connect(self):
+        for (dpid, port_nos) in sorted(self.fabric.ports.iteritems()):
+            ports = [fakepox.port(port_no, dpid) for port_no in port_nos]
+            ports.append(fakepox.port(fakepox.of.OFPP_LOCAL, dpid))
+            connection = fakepox.FakeConnection(self.core,
+                                                dpid,
+                                                ports,
+                                                self.args.table_size)
+            self.core.timed('ConnectionUp',
+                            self.core.openflow.connect,
+                            connection)
+
+    def discover(self):
+        discovery = self.core.openflow_discovery
+        for (dpid1, port1, dpid2, port2) in self.fabric.links:
+            self.core.timed('LinkEvent', discovery.add_link,
+                            dpid1, port1, dpid2, port2)
+            self.core.timed('LinkEvent', discovery.add_link,
+                            dpid2, port2, dpid1, port1)
+        for (macaddr, _, dpid, port) in self.fabric.hosts:
+            self.core.timed('HostEvent', self.core.host_tracker.join,
+                            macaddr, dpid, port)
+
+    def fail_links(self):
+        discovery = self.core.openflow_discovery
+        failures = self.rng.sample(self.fabric.links,
+                                   min(self.args.failures,
+                                       len(self.fabric.links)))
+        for (dpid1, port1, dpid2, port2) in failures:
+            self.core.timed('LinkEvent', discovery.remove_link,
+                            dpid1, port1, dpid2, port2)
+            self.core.timed('LinkEvent', discovery.remove_link,
+                            dpid2, port2, dpid1, port1)
+            self.core.run(self.horizon)
+
+    def move_hosts(self):
+        host_tracker = self.core.host_tracker
+        dpids = sorted(self.fabric.ports)
+        for _ in range(self.args.moves):
+            (macaddr, _, _, _) = self.rng.choice(self.fabric.hosts)
+            dpid = self.rng.choice(dpids)
+            port = max(self.fabric.ports[dpid]) + 1
+            self.fabric.ports[dpid].append(port)
+            self.core.timed('HostEvent', host_tracker.move,
+                            macaddr, dpid, port)
+            self.core.run(self.horizon)
+
+    def packet_ins(self):
+        from pox.lib.packet.arp import arp
+        from pox.lib.packet.ethernet import ethernet
+        of = fakepox.of
+        hosts = self.fabric.hosts
+        for _ in range(self.args.packet_ins):
+            (macaddr, ip, dpid, port) = self.rng.choice(hosts)
+            (_, target, _, _) = self.rng.choice(hosts)
+            request = arp(opcode=arp.REQUEST,
+                          hwsrc=macaddr,
+                          hwdst=ethernet.ETHER_ANY,
+                          protosrc=ip,
+                          protodst=target)
+            frame = ethernet(type=ethernet.ARP_TYPE,
+                             src=macaddr,
+                             dst=ethernet.ETHER_BROADCAST)
+            frame.set_payload(request)
+            connection = self.core.openflow.getConnection(dpid)
+            packet_in = of.ofp_packet_in(in_port=port,
+                                         reason=of.OFPR_ACTION,
+                                         data=frame.pack())
+            self.core.deliver(connection,
+                              fakepox.PacketIn(connection, packet_in))
+            self.core.run()
+
+    def report(self):
+        connections = self.core.openflow.connections.values()
+        report = {
+            'topology': {'name': self.fabric.topo.name,
+                         'switches': len(self.fabric.dpids),
+                         'links': len(self.fabric.links),
+                         'hosts': len(self.fabric.hosts)},
+            'phases': self.phases,
+            'writes_per_switch': max(c.writes for c in connections),
+            'flows_per_switch': max(len(c.flows) for c in connections),
+            # ru_maxrss is in kilobytes on Linux
+            'peak_memory_mb': resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        }
+        if self.metrics:
+            report['metrics'] = self.metrics.snapshot()
+        return report
+
+    def __slowest_switches(self, n=5):
+        switches = self.convergence.snapshot()['switches']
+        return sorted(switches.iteritems(),
+                      key=lambda (_, stats): stats['p99_ms'],
+                      reverse=True)[:n]
+
+    def __message_counts(self):
+        return dict((dpid, dict(connection.counts))
+                    for (dpid, connection)
+                    in self.core.openflow.connections.iteritems())
+
+
+def print_report(report):
+    topology = report['topology']
+    print('{name}: {switches} switches, {links} links, {hosts} hosts'
+          .format(**topology))
+    for phase in report['phases']:
+        print()
+        print('{phase}: converged in {convergence_s:.3f}s'.format(**phase))
+        if phase['changes']['count']:
+            print('  {:<28} n={count:<7} mean={mean_ms:8.3f}ms '
+                  'p95={p95_ms:8.3f}ms max={max_ms:8.3f}ms'
+                  .format('change convergence', **phase['changes']))
+        for (name, stats) in sorted(phase['handlers'].iteritems()):
+            print('  {:<28} n={count:<7} mean={mean_ms:8.3f}ms '
+                  'p95={p95_ms:8.3f}ms max={max_ms:8.3f}ms'
+                  .format(name, **stats))
+        for (msg_type, stats) in sorted(phase['messages'].iteritems()):
+            print('  {:<28} total={total:<8} max/switch={max_per_switch}'
+                  .format(msg_type, **stats))
+    print()
+    print('flows/switch: {flows_per_switch}  writes/switch: '
+          '{writes_per_switch}  peak memory: {peak_memory_mb:.1f}MB'
+          .format(**report))
+
+
+def parse_args(argv):
+    return build_parser().parse_args(argv)
+
+
+def build_parser(description=__doc__):
+    parser = argparse.ArgumentParser(
+        description=description.split('\n\n')[0])
+    parser.add_argument('--topo', choices=sorted(topologies.topologies),
+                        default='ring')
+    parser.add_argument('--edges',
+                        help='read the topology from an edge list file '
+                             'instead, see playground.topologies')
+    parser.add_argument('--size', type=int, default=3,
+                        help='ring/random switches, fattree k, '
+                             'leafspine leaves')
+    parser.add_argument('--hosts', type=int, default=1,
+                        help='hosts per switch for ring and random')
+    parser.add_argument('--spines', type=int, default=2)
+    parser.add_argument('--oversubscription', type=float, default=1.0,
+                        help='leafspine host ports per uplink')
+    parser.add_argument('--degree', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--forwarding', choices=('mac', 'label'),
+                        default='mac',
+                        help='per host MAC flows or VLAN labels per switch')
+    parser.add_argument('--ecmp', action='store_true',
+                        help='spread MAC forwarding over equal cost paths')
+    parser.add_argument('--quiet-period', type=float, default=0.1)
+    parser.add_argument('--max-delay', type=float, default=1.0)
+    parser.add_argument('--table-size', type=int, default=None,
+                        help='flow table capacity of the fake switches')
+    parser.add_argument('--table-policy',
+                        choices=('evict', 'aggregate', 'prioritize'),
+                        help='run table_capacity with this policy')
+    parser.add_argument('--failures', type=int, default=0,
+                        help='links to fail one by one after discovery')
+    parser.add_argument('--moves', type=int, default=0,
+                        help='hosts to move to another switch one by one '
+                             'after discovery')
+    parser.add_argument('--packet-ins', type=int, default=0,
+                        help='ARP requests to inject after discovery')
+    parser.add_argument('--metrics', action='store_true',
+                        help='enable the built-in instrumentation and add '
+                             'its snapshot to the JSON report')
+    parser.add_argument('--json', help='also write the report to a file')
+    parser.add_argument('--verbose', action='store_true')
+    return parser
+
+
+def main(argv=None):
+    args = parse_args(argv if argv is not None else sys.argv[1:])
+    logging.basicConfig(level=logging.DEBUG if args.verbose
+                        else logging.WARNING)
+    report = Benchmark(args).run()
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,443 @@
+"""
+Stand-in for the POX core, the OpenFlow nexus, discovery, host_tracker
+and switch connections.
+
+The real POX libraries (revent, libopenflow_01, packet) are used as they
+are, only the process wide `core` object and everything that would talk
+to a live switch is replaced. Call install() before importing any
+playground component so their `from pox.core import core` picks up the
+stand-in.
+"""
+import heapq
+import inspect
+import itertools
+import logging
+import struct
+import time
+from collections import defaultdict, deque, namedtuple
+
+import pox.core
+from pox.lib.revent import Event, EventMixin
+from pox.lib.addresses import EthAddr
+import pox.openflow.libopenflow_01 as of
+from playground.controller.flow_table import flow_key
+
+MESSAGE_TYPES = {of.OFPT_PACKET_OUT: 'packet_out',
+                 of.OFPT_FLOW_MOD: 'flow_mod',
+                 of.OFPT_PORT_MOD: 'port_mod',
+                 of.OFPT_STATS_REQUEST: 'stats_request',
+                 of.OFPT_BARRIER_REQUEST: 'barrier'}
+
+
+# OpenFlow events, named like the POX ones so _handle_* listeners bind
+
+class ConnectionUp (Event):
+  def __init__ (self, connection):
+    Event.__init__(self)
+    self.connection = connection
+    self.dpid = connection.dpid
+    self.ofp = connection.features
+
+class ConnectionDown (Event):
+  def __init__ (self, connection):
+    Event.__init__(self)
+    self.connection = connection
+    self.dpid = connection.dpid
+
+class PacketIn (Event):
+  def __init__ (self, connection, ofp):
+    Event.__init__(self)
+    self.connection = connection
+    self.dpid = connection.dpid
+    self.ofp = ofp
+    self.port = ofp.in_port
+    self.data = ofp.data
+    self._parsed = None
+
+  @property
+  def parsed (self):
+    if self._parsed is None:
+      from pox.lib.packet.ethernet import ethernet
+      self._parsed = ethernet(self.data)
+    return self._parsed
+
+class BarrierIn (Event):
+  def __init__ (self, connection, xid):
+    Event.__init__(self)
+    self.connection = connection
+    self.dpid = connection.dpid
+    self.xid = xid
+
+class FlowStatsReceived (Event):
+  def __init__ (self, connection, stats, xid):
+    Event.__init__(self)
+    self.connection = connection
+    self.dpid = connection.dpid
+    self.stats = stats
+    # The reply parts, like POX
+    self.ofp = [of.ofp_stats_reply(xid=xid)]
+
+class TableStatsReceived (FlowStatsReceived):
+  pass
+
+class PortStatsReceived (FlowStatsReceived):
+  pass
+
+class FlowRemoved (Event):
+  def __init__ (self, connection, ofp):
+    Event.__init__(self)
+    self.connection = connection
+    self.dpid = connection.dpid
+    self.ofp = ofp
+    self.idleTimeout = ofp.reason == of.OFPRR_IDLE_TIMEOUT
+    self.hardTimeout = ofp.reason == of.OFPRR_HARD_TIMEOUT
+    self.deleted = ofp.reason == of.OFPRR_DELETE
+
+
+class LinkEvent (Event):
+  def __init__ (self, add, link):
+    Event.__init__(self)
+    self.link = link
+    self.added = add
+    self.removed = not add
+
+class HostEvent (Event):
+  def __init__ (self, entry, join=False, leave=False, move=False,
+                new_dpid=None, new_port=None):
+    Event.__init__(self)
+    self.entry = entry
+    self.join = join
+    self.leave = leave
+    self.move = move
+    self.new_dpid = new_dpid
+    self.new_port = new_port
+
+
+Link = namedtuple('Link', ('dpid1', 'port1', 'dpid2', 'port2'))
+
+
+class MacEntry(object):
+    def __init__(self, dpid, port, macaddr):
+        self.dpid = dpid
+        self.port = port
+        self.macaddr = macaddr
+        self.ipAddrs = {}
+
+
+class FakeTimer(object):
+    def __init__(self, when, callback, args, kw):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.kw = kw
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return self.when < other.when
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeConnection(EventMixin):
+    """
+    A switch behind a connection. Messages written with send() are only
+    queued; the switch handles them when the core runs, so handler
+    latencies measure the controller and not the simulated switch.
+    """
+
+    _eventMixin_events = set([
+        ConnectionUp,
+        ConnectionDown,
+        PacketIn,
+        BarrierIn,
+        FlowStatsReceived,
+        TableStatsReceived,
+        PortStatsReceived,
+        FlowRemoved,
+    ])
+
+    def __init__(self, core, dpid, ports, table_size=None):
+        self.core = core
+        self.dpid = dpid
+        self.ports = dict((port.port_no, port) for port in ports)
+        self.features = of.ofp_features_reply(datapath_id=dpid,
+                                              ports=list(ports))
+        self.table_size = table_size
+        self.inbox = deque()
+        # message type name -> number of messages received
+        self.counts = defaultdict(int)
+        self.bytes_received = 0
+        self.writes = 0
+        # flow_key -> ofp_flow_mod as installed
+        self.flows = {}
+
+    def __repr__(self):
+        return '<FakeConnection s{}>'.format(self.dpid)
+
+    def send(self, data):
+        if not isinstance(data, bytes):
+            data = data.pack()
+        self.writes += 1
+        self.inbox.append(data)
+
+    def process(self):
+        while self.inbox:
+            data = self.inbox.popleft()
+            self.bytes_received += len(data)
+            offset = 0
+            while offset < len(data):
+                (_, msg_type, length, xid) = struct.unpack_from('!BBHL',
+                                                                data,
+                                                                offset)
+                raw = data[offset:offset + length]
+                offset += length
+                self.counts[MESSAGE_TYPES.get(msg_type, msg_type)] += 1
+                if msg_type == of.OFPT_BARRIER_REQUEST:
+                    self.core.deliver(self, BarrierIn(self, xid))
+                elif msg_type == of.OFPT_FLOW_MOD:
+                    self.__flow_mod(raw)
+                elif msg_type == of.OFPT_STATS_REQUEST:
+                    self.__stats_request(raw, xid)
+
+    def __flow_mod(self, raw):
+        flow_mod = of.ofp_flow_mod()
+        flow_mod.unpack(raw)
+        key = flow_key(flow_mod.match, flow_mod.priority)
+        if flow_mod.command in (of.OFPFC_DELETE, of.OFPFC_DELETE_STRICT):
+            if flow_mod.command == of.OFPFC_DELETE and key[1:] == (None,) * 12:
+                self.flows.clear()
+            else:
+                self.flows.pop(key, None)
+        elif (self.table_size is None or key in self.flows
+              or len(self.flows) < self.table_size):
+            self.flows[key] = flow_mod
+        else:
+            self.counts['table_full'] += 1
+
+    def __stats_request(self, raw, xid):
+        (stats_type,) = struct.unpack_from('!H', raw, 8)
+        if stats_type == of.OFPST_FLOW:
+            stats = [of.ofp_flow_stats(match=flow_mod.match,
+                                       priority=flow_mod.priority,
+                                       cookie=flow_mod.cookie,
+                                       idle_timeout=flow_mod.idle_timeout,
+                                       hard_timeout=flow_mod.hard_timeout,
+                                       actions=flow_mod.actions)
+                     for flow_mod in self.flows.itervalues()]
+            self.core.deliver(self, FlowStatsReceived(self, stats, xid))
+        elif stats_type == of.OFPST_TABLE:
+            stats = [of.ofp_table_stats(table_id=0,
+                                        max_entries=self.table_size or 0,
+                                        active_count=len(self.flows))]
+            self.core.deliver(self, TableStatsReceived(self, stats, xid))
+        elif stats_type == of.OFPST_PORT:
+            stats = [of.ofp_port_stats(port_no=port_no)
+                     for port_no in self.ports]
+            self.core.deliver(self, PortStatsReceived(self, stats, xid))
+
+
+class FakeOpenFlowNexus(EventMixin):
+
+    _eventMixin_events = FakeConnection._eventMixin_events
+
+    def __init__(self):
+        self.connections = {}
+
+    def getConnection(self, dpid):
+        return self.connections.get(dpid)
+
+    def connect(self, connection):
+        self.connections[connection.dpid] = connection
+        connection.raiseEventNoErrors(ConnectionUp(connection))
+        self.raiseEventNoErrors(ConnectionUp(connection))
+
+    def disconnect(self, dpid):
+        connection = self.connections.pop(dpid)
+        connection.raiseEventNoErrors(ConnectionDown(connection))
+        self.raiseEventNoErrors(ConnectionDown(connection))
+
+
+class FakeDiscovery(EventMixin):
+
+    _eventMixin_events = set([
+        LinkEvent,
+    ])
+
+    def __init__(self):
+        # (dpid, port) -> number of links on that port
+        self.link_ports = defaultdict(int)
+        self.adjacency = set()
+
+    def is_edge_port(self, dpid, port):
+        return not self.link_ports.get((dpid, port))
+
+    def add_link(self, dpid1, port1, dpid2, port2):
+        link = Link(dpid1, port1, dpid2, port2)
+        self.adjacency.add(link)
+        self.link_ports[(dpid1, port1)] += 1
+        self.link_ports[(dpid2, port2)] += 1
+        self.raiseEventNoErrors(LinkEvent(True, link))
+
+    def remove_link(self, dpid1, port1, dpid2, port2):
+        link = Link(dpid1, port1, dpid2, port2)
+        self.adjacency.discard(link)
+        for key in ((dpid1, port1), (dpid2, port2)):
+            self.link_ports[key] -= 1
+            if not self.link_ports[key]:
+                del self.link_ports[key]
+        self.raiseEventNoErrors(LinkEvent(False, link))
+
+
+class FakeHostTracker(EventMixin):
+
+    _eventMixin_events = set([
+        HostEvent,
+    ])
+
+    def __init__(self):
+        self.entryByMAC = {}
+
+    def join(self, macaddr, dpid, port):
+        entry = self.entryByMAC[macaddr] = MacEntry(dpid, port, macaddr)
+        self.raiseEventNoErrors(HostEvent(entry, join=True))
+
+    def leave(self, macaddr):
+        entry = self.entryByMAC.pop(macaddr)
+        self.raiseEventNoErrors(HostEvent(entry, leave=True))
+
+    def move(self, macaddr, dpid, port):
+        entry = self.entryByMAC[macaddr]
+        self.raiseEventNoErrors(HostEvent(entry,
+                                          move=True,
+                                          new_dpid=dpid,
+                                          new_port=port))
+        (entry.dpid, entry.port) = (dpid, port)
+
+
+class FakeCore(object):
+    """
+    Just enough of pox.core.core for the playground components, with a
+    run() loop that delivers switch replies, callLater calls and due
+    timers until the controller is idle.
+    """
+
+    def __init__(self):
+        self.openflow = FakeOpenFlowNexus()
+        self.openflow_discovery = FakeDiscovery()
+        self.host_tracker = FakeHostTracker()
+        self.components = {'openflow': self.openflow,
+                           'openflow_discovery': self.openflow_discovery,
+                           'host_tracker': self.host_tracker}
+        self.__waiting = []
+        self.__later = deque()
+        self.__timers = []
+        self.__sequence = itertools.count()
+        # name -> list of handler durations in seconds
+        self.latencies = defaultdict(list)
+
+    def getLogger(self, name=None):
+        if name is None:
+            frame = inspect.stack()[1][0]
+            name = frame.f_globals.get('__name__', 'bench')
+        return logging.getLogger(name)
+
+    def register(self, name, component):
+        self.components[name] = component
+        setattr(self, name, component)
+        for (callback, names) in list(self.__waiting):
+            if all(n in self.components for n in names):
+                self.__waiting.remove((callback, names))
+                callback()
+
+    def registerNew(self, cls, *args, **kw):
+        component = cls(*args, **kw)
+        self.register(getattr(cls, '_core_name', cls.__name__), component)
+        return component
+
+    def hasComponent(self, name):
+        return name in self.components
+
+    def addListenerByName(self, name, handler, **kw):
+        # Core events like GoingDownEvent are never raised here
+        pass
+
+    def call_when_ready(self, callback, components):
+        if isinstance(components, basestring):
+            components = [components]
+        if all(name in self.components for name in components):
+            callback()
+        else:
+            self.__waiting.append((callback, list(components)))
+
+    def callLater(self, func, *args, **kw):
+        self.__later.append((func.__name__, func, args, kw))
+
+    def callDelayed(self, seconds, func, *args, **kw):
+        timer = FakeTimer(time.time() + seconds, func, args, kw)
+        heapq.heappush(self.__timers, timer)
+        return timer
+
+    def deliver(self, connection, event):
+        self.__later.append((type(event).__name__,
+                             self.__raise,
+                             (connection, event),
+                             {}))
+
+    def timed(self, name, func, *args, **kw):
+        start = time.time()
+        try:
+            return func(*args, **kw)
+        finally:
+            self.latencies[name].append(time.time() - start)
+
+    def run(self, horizon=None):
+        """
+        Process everything that is pending. Timers fire at their real due
+        time; run() returns once nothing but timers due more than horizon
+        seconds from now are left, with horizon=None only the timers
+        already due are run.
+        """
+        while True:
+            if self.__later:
+                (name, func, args, kw) = self.__later.popleft()
+                self.timed(name, func, *args, **kw)
+                continue
+            busy = [connection
+                    for connection in self.openflow.connections.itervalues()
+                    if connection.inbox]
+            if busy:
+                for connection in busy:
+                    connection.process()
+                continue
+            while self.__timers and self.__timers[0].cancelled:
+                heapq.heappop(self.__timers)
+            if not self.__timers:
+                return
+            delay = self.__timers[0].when - time.time()
+            if delay > 0:
+                if horizon is None or delay > horizon:
+                    return
+                time.sleep(delay)
+            timer = heapq.heappop(self.__timers)
+            self.timed(timer.callback.__name__,
+                       timer.callback, *timer.args, **timer.kw)
+
+    def __raise(self, connection, event):
+        connection.raiseEventNoErrors(event)
+        self.openflow.raiseEventNoErrors(event)
+
+
+def install():
+    """
+    Replace pox.core.core with a FakeCore and return it
+    """
+    core = FakeCore()
+    pox.core.core = core
+    return core
+
+
+def port(port_no, dpid):
+    return of.ofp_phy_port(port_no=port_no,
+                           hw_addr=EthAddr(struct.pack('!HL', dpid, port_no)),
+                           name='s{}-eth{}'.format(dpid, port_no))
@@ -0,0 +1,187 @@
+"""
+Benchmark of the sharded controller on one host.
+
+Starts the shard log and one process per shard, each running the
+controller on the stand-in POX core with fake connections for the
+switches it owns. Every shard replays the discovery of its switches,
+links within a shard through discovery and links between shards as if
+their LLDP had arrived, and waits until it applied the whole log. The
+report compares the CPU time of the busiest shard with a single
+process doing all the work.
+
+  python -m bench.shards --topo fattree --size 16 --shards 4
+"""
+from __future__ import print_function
+
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from bench import controller
+
+
+class ShardBenchmark(controller.Benchmark):
+
+    def __init__(self, args, index, path):
+        controller.Benchmark.__init__(self, args)
+        from playground.controller.shard import Shard
+        self.index = index
+        self.shard = self.core.registerNew(Shard,
+                                           index,
+                                           args.shards,
+                                           path,
+                                           link_timeout=0)
+        # One record per switch, link direction and host
+        fabric = self.fabric
+        self.expected = (len(fabric.dpids) + 2 * len(fabric.links)
+                         + len(fabric.hosts))
+
+    def run(self):
+        start = time.time()
+        self.phase('connect', self.connect)
+        self.phase('discovery', self.discover)
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        connections = self.core.openflow.connections.values()
+        return {'shard': self.index,
+                'switches': len(connections),
+                'wall_s': time.time() - start,
+                'cpu_s': usage.ru_utime + usage.ru_stime,
+                'records': self.shard.applied,
+                'flows': sum(len(c.flows) for c in connections),
+                'phases': self.phases}
+
+    def connect(self):
+        for (dpid, port_nos) in sorted(self.fabric.ports.iteritems()):
+            if not self.shard.owns(dpid):
+                continue
+            ports = [controller.fakepox.port(port_no, dpid)
+                     for port_no in port_nos]
+            ports.append(controller.fakepox.port(
+                controller.fakepox.of.OFPP_LOCAL, dpid))
+            connection = controller.fakepox.FakeConnection(
+                self.core, dpid, ports, self.args.table_size)
+            self.core.timed('ConnectionUp',
+                            self.core.openflow.connect,
+                            connection)
+
+    def discover(self):
+        discovery = self.core.openflow_discovery
+        owns = self.shard.owns
+        for (dpid1, port1, dpid2, port2) in self.fabric.links:
+            # Each direction is seen by the shard receiving the LLDP
+            for (a, port_a, b, port_b) in ((dpid1, port1, dpid2, port2),
+                                           (dpid2, port2, dpid1, port1)):
+                if not owns(b):
+                    continue
+                if owns(a):
+                    self.core.timed('LinkEvent', discovery.add_link,
+                                    a, port_a, b, port_b)
+                else:
+                    self.core.timed('LLDP', self.shard.observe_link,
+                                    a, port_a, b, port_b)
+        for (macaddr, _, dpid, port) in self.fabric.hosts:
+            if owns(dpid):
+                self.core.timed('HostEvent', self.core.host_tracker.join,
+                                macaddr, dpid, port)
+        self.wait_for_log()
+
+    def wait_for_log(self, timeout=600):
+        deadline = time.time() + timeout
+        while self.shard.applied < self.expected:
+            if time.time() > deadline:
+                raise RuntimeError('Shard {} applied {} of {} records'
+                                   .format(self.index, self.shard.applied,
+                                           self.expected))
+            self.core.run(self.horizon)
+            time.sleep(0.001)
+
+
+def run_shard(args, index, path, results):
+    logging.basicConfig(level=logging.DEBUG if args.verbose
+                        else logging.WARNING)
+    try:
+        results.put(ShardBenchmark(args, index, path).run())
+    except Exception as e:
+        logging.exception('Shard {} failed'.format(index))
+        results.put({'shard': index, 'error': str(e)})
+
+
+def run_single(args, results):
+    # The same work in one process, for comparison
+    logging.basicConfig(level=logging.WARNING)
+    start = time.time()
+    single = controller.Benchmark(args)
+    single.phase('connect', single.connect)
+    single.phase('discovery', single.discover)
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    results.put({'wall_s': time.time() - start,
+                 'cpu_s': usage.ru_utime + usage.ru_stime})
+
+
+def benchmark(args):
+    from playground.controller.shard_log import LogHub
+    results = multiprocessing.Queue()
+    single = multiprocessing.Process(target=run_single, args=(args, results))
+    single.start()
+    single.join()
+    report = {'single': results.get(), 'shards': []}
+
+    path = os.path.join(tempfile.mkdtemp(), 'shards.sock')
+    workers = [multiprocessing.Process(target=run_shard,
+                                       args=(args, index, path, results))
+               for index in range(args.shards)]
+    for worker in workers:
+        worker.start()
+    # After forking, so the workers do not inherit the hub's thread
+    hub = LogHub(path)
+    hub.start()
+    try:
+        for _ in workers:
+            report['shards'].append(results.get())
+        for worker in workers:
+            worker.join()
+    finally:
+        hub.close()
+        os.rmdir(os.path.dirname(path))
+    report['shards'].sort(key=lambda shard: shard['shard'])
+    report['log_records'] = len(hub.records)
+    return report
+
+
+def print_report(report):
+    single = report['single']
+    print('single process: cpu {cpu_s:.3f}s wall {wall_s:.3f}s'
+          .format(**single))
+    for shard in report['shards']:
+        if 'error' in shard:
+            print('shard {shard}: failed: {error}'.format(**shard))
+            continue
+        print('shard {shard}: {switches} switches, {flows} flows, '
+              '{records} records, cpu {cpu_s:.3f}s wall {wall_s:.3f}s'
+              .format(**shard))
+    busiest = max(shard.get('cpu_s', 0) for shard in report['shards'])
+    if busiest:
+        print('busiest shard cpu {:.3f}s, {:.2f}x the single process '
+              'throughput'.format(busiest, single['cpu_s'] / busiest))
+
+
+def main(argv=None):
+    parser = controller.build_parser(__doc__)
+    parser.add_argument('--shards', type=int, default=2,
+                        help='controller processes to spread the switches '
+                             'over')
+    args = parser.parse_args(argv if argv is not None else sys.argv[1:])
+    report = benchmark(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
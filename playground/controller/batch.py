@@ -0,0 +1,143 @@
+import time
+from pox.core import core
+from pox.lib.revent import *
+import pox.openflow.libopenflow_01 as of
+from playground.controller import metrics
+
+log = core.getLogger()
+
+
+class BatchCommitted (Event):
+  """
+  Raised once a batch was written to its switch
+  """
+  def __init__ (self, batch):
+    Event.__init__(self)
+    self.batch = batch
+    self.dpid = batch.dpid
+
+
+class BatchComplete (Event):
+  """
+  Raised once the switch answered the barrier closing a batch
+  """
+  def __init__ (self, batch):
+    Event.__init__(self)
+    self.batch = batch
+    self.dpid = batch.dpid
+
+
+class Batch(object):
+    """
+    OpenFlow messages queued for a single switch.
+
+    commit() serializes the messages together with a closing barrier
+    request into one buffer and writes it with a single send. Once the
+    barrier reply arrives every message before it has been processed by
+    the switch.
+    """
+
+    def __init__(self, batcher, connection, trace_ids=()):
+        self.batcher = batcher
+        self.connection = connection
+        self.dpid = connection.dpid
+        # Trace ids of the TopoUpdates the messages belong to
+        self.trace_ids = tuple(trace_ids)
+        self.messages = []
+        self.xid = None
+        self.callback = None
+        self.committed_at = None
+        self.completed_at = None
+
+    def __len__(self):
+        return len(self.messages)
+
+    def send(self, msg):
+        self.messages.append(msg)
+
+    def commit(self, callback=None):
+        """
+        Write the batch, callback(batch) is called on the barrier reply.
+        Empty batches are not sent.
+        """
+        self.callback = callback
+        if not self.messages:
+            return False
+        return self.batcher.commit(self)
+
+    @property
+    def latency(self):
+        if self.completed_at is None:
+            return None
+        return self.completed_at - self.committed_at
+
+
+class Batcher(EventMixin):
+
+    _core_name = 'openflow_batcher'
+    _eventMixin_events = set([
+        BatchCommitted,
+        BatchComplete,
+    ])
+
+    def __init__(self):
+        # (dpid, barrier xid) -> committed Batch
+        self.__pending = {}
+        core.openflow.addListeners(self)
+
+    def begin(self, connection, trace_ids=()):
+        return Batch(self, connection, trace_ids)
+
+    def commit(self, batch):
+        barrier = of.ofp_barrier_request()
+        batch.xid = barrier.xid
+        data = b''.join(msg.pack() for msg in batch.messages)
+        batch.committed_at = time.time()
+        if metrics.enabled():
+            self.__count_messages(batch)
+        self.__pending[(batch.dpid, batch.xid)] = batch
+        batch.connection.send(data + barrier.pack())
+        self.raiseEventNoErrors(BatchCommitted, batch)
+        return True
+
+    def pending(self, dpid=None):
+        """
+        Committed batches still waiting for their barrier reply
+        """
+        return [batch
+                for ((batch_dpid, _), batch) in self.__pending.iteritems()
+                if dpid is None or batch_dpid == dpid]
+
+    # event handlers
+
+    def _handle_BarrierIn(self, event):
+        batch = self.__pending.pop((event.dpid, event.xid), None)
+        if batch is None:
+            return
+        batch.completed_at = time.time()
+        if batch.callback:
+            batch.callback(batch)
+        self.raiseEventNoErrors(BatchComplete, batch)
+
+    def _handle_ConnectionDown(self, event):
+        for batch in self.pending(event.dpid):
+            log.debug('Dropping unconfirmed batch of {} messages for <s{}>'
+                      .format(len(batch), batch.dpid))
+            del self.__pending[(batch.dpid, batch.xid)]
+
+    # private methods
+
+    def __count_messages(self, batch):
+        # ofp_flow_mod -> flow_mod, ofp_port_mod -> port_mod, ...
+        counts = {}
+        for msg in batch.messages:
+            name = type(msg).__name__
+            counts[name] = counts.get(name, 0) + 1
+        for (name, n) in counts.iteritems():
+            metrics.count(name[4:] if name.startswith('ofp_') else name,
+                          batch.dpid,
+                          n)
+
+
+def launch():
+    core.registerNew(Batcher)
@@ -0,0 +1,168 @@
+import collections
+import time
+from pox.core import core
+from playground.controller import metrics
+from playground.controller.metrics import Histogram
+
+log = core.getLogger()
+
+
+class Trace(object):
+    """
+    A single topology change on its way to the switches.
+
+    started is the first mutation folded into the TopoUpdate, raised when
+    the TopoUpdate went out. Every switch that was sent messages for the
+    change is pending until it answers the barrier closing its batch.
+    """
+
+    def __init__(self, trace_id, started, raised):
+        self.trace_id = trace_id
+        self.started = started
+        self.raised = raised
+        # Last time a batch of this change was written to a switch
+        self.emitted = None
+        # dpids a batch of this change was written to
+        self.switches = set()
+        # dpid -> batches of this change awaiting their barrier reply
+        self.outstanding = {}
+        # dpid -> time the barrier reply arrived
+        self.completed = {}
+        # dpids that disconnected before confirming the change
+        self.failed = set()
+        self.finished = None
+
+    @property
+    def latency(self):
+        if self.finished is None:
+            return None
+        return self.finished - self.started
+
+    def summary(self):
+        return {'trace_id': self.trace_id,
+                'latency_ms': 1000 * self.latency,
+                'debounce_ms': 1000 * (self.raised - self.started),
+                'emit_ms': (1000 * (self.emitted - self.raised)
+                            if self.emitted is not None else 0),
+                'switches': len(self.completed),
+                'failed': sorted(self.failed)}
+
+
+class ConvergenceTracker(object):
+    """
+    Follows the trace id of every TopoUpdate through the batches sent for
+    it and measures how long it takes until all switches confirmed the
+    new forwarding state, overall and per switch
+    """
+
+    _core_name = 'convergence'
+
+    def __init__(self, history=100):
+        # trace_id -> Trace still waiting for barrier replies
+        self.__traces = {}
+        # Summaries of the last converged changes
+        self.recent = collections.deque(maxlen=history)
+        # Time from the first mutation to the last confirmed switch
+        self.changes = Histogram()
+        # dpid -> Histogram from the first mutation to the switch's reply
+        self.switches = {}
+        # Ahead of the listeners committing the batches for the change
+        core.toponizer.addListeners(self, priority=1)
+        core.openflow_batcher.addListeners(self)
+        core.openflow.addListeners(self)
+        if core.hasComponent('route_worker'):
+            core.route_worker.addListeners(self)
+
+    def pending(self):
+        return self.__traces.values()
+
+    def snapshot(self):
+        return {'changes': self.changes.snapshot(),
+                'switches': dict((str(dpid), histogram.snapshot())
+                                 for (dpid, histogram)
+                                 in self.switches.items()),
+                'pending': len(self.__traces),
+                'recent': list(self.recent)}
+
+    # event handlers
+
+    def _handle_TopoUpdate(self, event):
+        trace_id = event.changes.trace_id
+        if trace_id is None:
+            return
+        self.__traces[trace_id] = Trace(trace_id,
+                                        event.changes.since,
+                                        time.time())
+        # The batches are committed by the other TopoUpdate listeners
+        core.callLater(self.__check, trace_id)
+
+    def _handle_BatchCommitted(self, event):
+        batch = event.batch
+        for trace_id in batch.trace_ids:
+            trace = self.__traces.get(trace_id)
+            if trace is None:
+                continue
+            trace.switches.add(batch.dpid)
+            trace.outstanding[batch.dpid] = (
+                trace.outstanding.get(batch.dpid, 0) + 1)
+
+    def _handle_BatchComplete(self, event):
+        batch = event.batch
+        for trace_id in batch.trace_ids:
+            trace = self.__traces.get(trace_id)
+            if trace is None:
+                continue
+            outstanding = trace.outstanding.get(batch.dpid, 0) - 1
+            if outstanding > 0:
+                trace.outstanding[batch.dpid] = outstanding
+            else:
+                trace.outstanding.pop(batch.dpid, None)
+            # A switch may get several batches for one change, the last
+            # reply counts
+            trace.completed[batch.dpid] = batch.completed_at
+            if trace.emitted is None or batch.committed_at > trace.emitted:
+                trace.emitted = batch.committed_at
+            self.__check(trace_id)
+
+    def _handle_JobFinished(self, event):
+        for trace_id in self.__traces.keys():
+            core.callLater(self.__check, trace_id)
+
+    def _handle_ConnectionDown(self, event):
+        for trace in self.__traces.values():
+            # The batcher drops the unconfirmed batches of the switch
+            if trace.outstanding.pop(event.dpid, None):
+                trace.failed.add(event.dpid)
+        for trace_id in self.__traces.keys():
+            core.callLater(self.__check, trace_id)
+
+    # private methods
+
+    def __check(self, trace_id):
+        trace = self.__traces.get(trace_id)
+        if trace is None:
+            return
+        if trace.outstanding or self.__computing(trace_id):
+            return
+        del self.__traces[trace_id]
+        trace.finished = max(trace.completed.values() or [trace.raised])
+        for (dpid, completed) in trace.completed.iteritems():
+            histogram = self.switches.get(dpid)
+            if histogram is None:
+                histogram = self.switches[dpid] = Histogram()
+            histogram.observe(completed - trace.started)
+        self.changes.observe(trace.latency)
+        metrics.observe('convergence', trace.latency)
+        summary = trace.summary()
+        self.recent.append(summary)
+        log.debug('Change {trace_id} converged on {switches} switches in '
+                  '{latency_ms:.3f}ms (debounce {debounce_ms:.3f}ms, '
+                  'emit {emit_ms:.3f}ms)'.format(**summary))
+
+    def __computing(self, trace_id):
+        return (core.hasComponent('route_worker')
+                and trace_id in core.route_worker.pending_traces())
+
+
+def launch(history=100):
+    core.registerNew(ConvergenceTracker, int(history))
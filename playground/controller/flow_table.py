@@ -0,0 +1,225 @@
+import struct
+import zlib
+import pox.openflow.libopenflow_01 as of
+
+MATCH_FIELDS = ('in_port',
+                'dl_src',
+                'dl_dst',
+                'dl_vlan',
+                'dl_vlan_pcp',
+                'dl_type',
+                'nw_tos',
+                'nw_proto',
+                'nw_src',
+                'nw_dst',
+                'tp_src',
+                'tp_dst')
+
+
+def flow_key(match, priority):
+    """
+    Hashable identity of a flow as seen by the *_STRICT commands
+    """
+    return (priority,) + tuple(getattr(match, field)
+                               for field in MATCH_FIELDS)
+
+
+class FlowEntry(object):
+    """
+    A single flow the controller wants to have installed on a switch
+    """
+    def __init__(self,
+                 match,
+                 actions,
+                 priority=of.OFP_DEFAULT_PRIORITY,
+                 cookie=0):
+        self.match = match
+        self.actions = list(actions)
+        self.priority = priority
+        self.cookie = cookie
+        self.key = flow_key(match, priority)
+        self.packed_actions = b''.join(action.pack()
+                                       for action in self.actions)
+
+    def __eq__(self, other):
+        return (isinstance(other, FlowEntry)
+                and self.key == other.key
+                and self.packed_actions == other.packed_actions)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<FlowEntry {} -> {}>'.format(self.key, self.actions)
+
+    def flow_mod(self, command=of.OFPFC_ADD):
+        msg = of.ofp_flow_mod(command=command,
+                              match=self.match,
+                              priority=self.priority,
+                              cookie=self.cookie)
+        if command != of.OFPFC_DELETE_STRICT:
+            msg.actions.extend(self.actions)
+        return msg
+
+
+class ShadowFlowTable(object):
+    """
+    The flows the controller believes to be installed on one switch.
+
+    reconcile() diffs a desired state against the shadow, updates the
+    shadow and returns only the flow_mods needed to get the switch there.
+    """
+
+    def __init__(self, dpid, cookie=0):
+        self.dpid = dpid
+        self.cookie = cookie
+        # flow_key -> FlowEntry
+        self.__entries = {}
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __iter__(self):
+        return self.__entries.itervalues()
+
+    def __contains__(self, key):
+        return key in self.__entries
+
+    def get(self, key):
+        return self.__entries.get(key)
+
+    def clear(self):
+        self.__entries.clear()
+
+    def digest(self):
+        """
+        Checksum of the flows independent of their order, to tell
+        whether a switch still holds the flows it had earlier
+        """
+        digest = 0
+        for entry in self.__entries.itervalues():
+            digest += zlib.crc32(struct.pack('!H', entry.priority)
+                                 + entry.match.pack()
+                                 + entry.packed_actions) & 0xffffffff
+        return digest & 0xffffffff
+
+    def diff(self, desired, keys=None):
+        """
+        List of (command, FlowEntry) turning the shadow into desired,
+        a {flow_key: FlowEntry} dictionary. With keys only those flows
+        are compared.
+        """
+        if keys is None:
+            wanted = desired.iteritems()
+            installed = self.__entries.iteritems()
+        else:
+            wanted = ((key, desired[key]) for key in keys if key in desired)
+            installed = ((key, self.__entries[key]) for key in keys
+                         if key in self.__entries)
+        changes = []
+        for (key, entry) in wanted:
+            current = self.__entries.get(key)
+            if current is None:
+                changes.append((of.OFPFC_ADD, entry))
+            elif current != entry:
+                changes.append((of.OFPFC_MODIFY_STRICT, entry))
+        # Deletes go last so traffic is never left without a flow
+        for (key, entry) in installed:
+            if key not in desired:
+                changes.append((of.OFPFC_DELETE_STRICT, entry))
+        return changes
+
+    def apply(self, command, entry):
+        if command == of.OFPFC_DELETE_STRICT:
+            self.__entries.pop(entry.key, None)
+        else:
+            self.__entries[entry.key] = entry
+
+    def reconcile(self, desired, keys=None):
+        flow_mods = []
+        for (command, entry) in self.diff(desired, keys):
+            self.apply(command, entry)
+            flow_mods.append(entry.flow_mod(command))
+        return flow_mods
+
+    def resync(self, flow_stats):
+        """
+        Replace the shadow with the flows reported in a flow stats reply,
+        ignoring flows installed by someone else
+        """
+        self.__entries.clear()
+        for stats in flow_stats:
+            if stats.cookie != self.cookie:
+                continue
+            entry = FlowEntry(stats.match,
+                              stats.actions,
+                              priority=stats.priority,
+                              cookie=stats.cookie)
+            self.__entries[entry.key] = entry
+
+
+class FlowPlan(object):
+    """
+    The flows wanted on every switch, together with the replacements of
+    the flows forwarding out of a port for when that port's link fails.
+    Flows are grouped by the destination they lead to, so the flows of
+    a few destinations can be replaced by a partial plan.
+    """
+
+    def __init__(self):
+        # dpid -> {flow_key: FlowEntry}
+        self.flows = {}
+        # (dpid, port_no) -> {flow_key: FlowEntry}
+        self.backups = {}
+        # destination -> [(dpid, flow_key, port_no of the backup or None)]
+        self.__destinations = {}
+
+    def add(self, dpid, flow, port=None, backup=None, destination=None):
+        self.flows.setdefault(dpid, {})[flow.key] = flow
+        if backup is not None:
+            self.backups.setdefault((dpid, port), {})[flow.key] = backup
+        self.__destinations.setdefault(destination, []).append(
+            (dpid, flow.key, port if backup is not None else None))
+
+    def destinations(self):
+        return self.__destinations.keys()
+
+    def update(self, other, destinations):
+        """
+        Replace the flows of destinations by the ones other has for them,
+        returns dpid -> set of the flow keys that may have changed
+        """
+        touched = {}
+        for destination in destinations:
+            for (dpid, key, port) in self.__destinations.pop(destination, ()):
+                self.flows.get(dpid, {}).pop(key, None)
+                if port is not None:
+                    self.backups.get((dpid, port), {}).pop(key, None)
+                touched.setdefault(dpid, set()).add(key)
+            entries = other.__destinations.get(destination)
+            if not entries:
+                continue
+            self.__destinations[destination] = entries
+            for (dpid, key, port) in entries:
+                self.flows.setdefault(dpid, {})[key] = other.flows[dpid][key]
+                if port is not None:
+                    self.backups.setdefault((dpid, port), {})[key] = \
+                        other.backups[(dpid, port)][key]
+                touched.setdefault(dpid, set()).add(key)
+        return touched
+
+    def fail_over(self, dpid, port):
+        """
+        Swap in the backups of the flows leaving port on dpid, returns
+        whether any flow changed
+        """
+        backups = self.backups.pop((dpid, port), None)
+        flows = self.flows.get(dpid)
+        if not backups or flows is None:
+            return False
+        changed = False
+        for (key, backup) in backups.iteritems():
+            if key in flows:
+                flows[key] = backup
+                changed = True
+        return changed
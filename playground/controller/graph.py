@@ -0,0 +1,296 @@
+from array import array
+
+
+class Node(object):
+    """
+    Switch or host in a TopologyGraph. Switches only keep the port
+    numbers and hardware addresses of their connection's ports.
+    """
+
+    SWITCH = 'switch'
+    HOST = 'host'
+
+    __slots__ = ('id', 'type', 'dpid', 'macaddr', 'ports')
+
+    def __init__(self, node_id, type, dpid=None, macaddr=None, ports=None):
+        self.id = node_id
+        self.type = type
+        self.dpid = dpid
+        self.macaddr = macaddr
+        # port_no -> hw_addr
+        self.ports = ports if ports is not None else {}
+
+    def __repr__(self):
+        if self.type == Node.SWITCH:
+            return '<Node {} s{}>'.format(self.id, self.dpid)
+        return '<Node {} {}>'.format(self.id, self.macaddr)
+
+    @property
+    def is_host(self):
+        return self.type == Node.HOST
+
+
+class Link(object):
+    """
+    Directed link from port1 on source to port2 on target. Host ports are
+    None.
+    """
+
+    __slots__ = ('id', 'source', 'target', 'port1', 'port2', 'weight')
+
+    def __init__(self, link_id, source, target, port1, port2, weight=1):
+        self.id = link_id
+        self.source = source
+        self.target = target
+        self.port1 = port1
+        self.port2 = port2
+        self.weight = weight
+
+    def __repr__(self):
+        return '<Link {} {}:{} -> {}:{}>'.format(self.id,
+                                                self.source, self.port1,
+                                                self.target, self.port2)
+
+
+class Adjacency(object):
+    """
+    Compressed sparse rows of the links entering every node. The links
+    into node n are offsets[n] up to offsets[n + 1] in the other arrays.
+    """
+
+    # Port number of host ports, which have none
+    NO_PORT = -1
+
+    __slots__ = ('version', 'offsets', 'sources', 'ports', 'weights', 'hosts')
+
+    def __init__(self, version, offsets, sources, ports, weights, hosts):
+        self.version = version
+        self.offsets = offsets
+        # source node id of each link
+        self.sources = sources
+        # outgoing port on the source node
+        self.ports = ports
+        self.weights = weights
+        # node id -> 1 for hosts
+        self.hosts = hosts
+
+
+class TopologyGraph(object):
+    """
+    Directed multigraph of switches and hosts with dense integer node and
+    link ids. Ids of removed nodes and links are reused, so the id space
+    stays as small as the topology. Path computations read the array
+    backed reverse adjacency, which is rebuilt once per version.
+    """
+
+    def __init__(self):
+        # node id -> Node or None
+        self.__nodes = []
+        # link id -> Link or None
+        self.__links = []
+        self.__free_nodes = []
+        self.__free_links = []
+        # node id -> {neighbour id: [link ids]}
+        self.__out = []
+        self.__in = []
+        self.__node_count = 0
+        self.__link_count = 0
+        # bumped on every mutation
+        self.version = 0
+        self.__adjacency = None
+
+    def __len__(self):
+        return self.__node_count
+
+    def __contains__(self, node_id):
+        return self.node(node_id) is not None
+
+    def number_of_links(self):
+        return self.__link_count
+
+    def size(self):
+        """
+        Upper bound of the node ids, for arrays indexed by node id
+        """
+        return len(self.__nodes)
+
+    # nodes
+
+    def add_node(self, type, dpid=None, macaddr=None, ports=None):
+        if self.__free_nodes:
+            node_id = self.__free_nodes.pop()
+        else:
+            node_id = len(self.__nodes)
+            self.__nodes.append(None)
+            self.__out.append(None)
+            self.__in.append(None)
+        node = Node(node_id, type, dpid=dpid, macaddr=macaddr, ports=ports)
+        self.__nodes[node_id] = node
+        self.__out[node_id] = {}
+        self.__in[node_id] = {}
+        self.__node_count += 1
+        self.version += 1
+        return node
+
+    def remove_node(self, node_id):
+        """
+        Remove the node together with its links, which are returned
+        """
+        node = self.node(node_id)
+        if node is None:
+            return []
+        links = self.out_links(node_id) + [link
+                                           for link in self.in_links(node_id)
+                                           if link.source != node_id]
+        for link in links:
+            self.remove_link(link.id)
+        self.__nodes[node_id] = None
+        self.__out[node_id] = None
+        self.__in[node_id] = None
+        self.__free_nodes.append(node_id)
+        self.__node_count -= 1
+        self.version += 1
+        return links
+
+    def node(self, node_id):
+        if 0 <= node_id < len(self.__nodes):
+            return self.__nodes[node_id]
+        return None
+
+    def nodes(self):
+        return [node for node in self.__nodes if node is not None]
+
+    # links
+
+    def add_link(self, source, target, port1, port2, weight=1):
+        if self.__free_links:
+            link_id = self.__free_links.pop()
+        else:
+            link_id = len(self.__links)
+            self.__links.append(None)
+        link = Link(link_id, source, target, port1, port2, weight)
+        self.__links[link_id] = link
+        self.__out[source].setdefault(target, []).append(link_id)
+        self.__in[target].setdefault(source, []).append(link_id)
+        self.__link_count += 1
+        self.version += 1
+        return link
+
+    def remove_link(self, link_id):
+        link = self.link(link_id)
+        if link is None:
+            return None
+        TopologyGraph.__discard(self.__out[link.source], link.target, link_id)
+        TopologyGraph.__discard(self.__in[link.target], link.source, link_id)
+        self.__links[link_id] = None
+        self.__free_links.append(link_id)
+        self.__link_count -= 1
+        self.version += 1
+        return link
+
+    def set_weight(self, link_id, weight):
+        link = self.link(link_id)
+        if link is not None and link.weight != weight:
+            link.weight = weight
+            self.version += 1
+        return link
+
+    def link(self, link_id):
+        if 0 <= link_id < len(self.__links):
+            return self.__links[link_id]
+        return None
+
+    def links(self):
+        return [link for link in self.__links if link is not None]
+
+    def links_between(self, source, target):
+        """
+        Links from source to target in the order they were added
+        """
+        return [self.__links[link_id]
+                for link_id in self.__out[source].get(target, ())]
+
+    def find_link(self, source, target, port1, port2):
+        for link in self.links_between(source, target):
+            if link.port1 == port1 and link.port2 == port2:
+                return link
+        return None
+
+    def has_link(self, source, target):
+        return bool(self.__out[source].get(target))
+
+    def out_links(self, node_id):
+        return [self.__links[link_id]
+                for link_ids in self.__out[node_id].itervalues()
+                for link_id in link_ids]
+
+    def in_links(self, node_id):
+        return [self.__links[link_id]
+                for link_ids in self.__in[node_id].itervalues()
+                for link_id in link_ids]
+
+    def successors(self, node_id):
+        return self.__out[node_id].keys()
+
+    def predecessors(self, node_id):
+        return self.__in[node_id].keys()
+
+    # bulk views
+
+    def reverse_adjacency(self):
+        adjacency = self.__adjacency
+        if adjacency is None or adjacency.version != self.version:
+            adjacency = self.__adjacency = self.__build_reverse_adjacency()
+        return adjacency
+
+    def to_networkx(self):
+        """
+        Copy as a networkx MultiDiGraph keyed by link id, for ad-hoc
+        analysis
+        """
+        import networkx as nx
+        graph = nx.MultiDiGraph()
+        for node in self.nodes():
+            graph.add_node(node.id,
+                           type=node.type,
+                           dpid=node.dpid,
+                           macaddr=node.macaddr)
+        for link in self.links():
+            graph.add_edge(link.source,
+                           link.target,
+                           key=link.id,
+                           port1=link.port1,
+                           port2=link.port2,
+                           weight=link.weight)
+        return graph
+
+    # private methods
+
+    def __build_reverse_adjacency(self):
+        size = len(self.__nodes)
+        offsets = array('l', [0]) * (size + 1)
+        sources = array('l')
+        ports = array('l')
+        weights = array('d')
+        hosts = bytearray(size)
+        for node_id in xrange(size):
+            node = self.__nodes[node_id]
+            if node is not None:
+                hosts[node_id] = node.type == Node.HOST
+                for link_ids in self.__in[node_id].itervalues():
+                    for link_id in link_ids:
+                        link = self.__links[link_id]
+                        sources.append(link.source)
+                        ports.append(link.port1 if link.port1 is not None
+                                     else Adjacency.NO_PORT)
+                        weights.append(link.weight)
+            offsets[node_id + 1] = len(sources)
+        return Adjacency(self.version, offsets, sources, ports, weights, hosts)
+
+    @staticmethod
+    def __discard(adjacent, node_id, link_id):
+        link_ids = adjacent.get(node_id)
+        if link_ids is not None:
+            link_ids.remove(link_id)
+            if not link_ids:
+                del adjacent[node_id]
@@ -0,0 +1,116 @@
+import json
+import os
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from pox.core import core
+from playground.controller import convergence, metrics
+
+log = core.getLogger()
+
+
+class SnapshotRequestHandler(BaseHTTPRequestHandler):
+    """
+    Answers every GET with the current metrics snapshot as JSON
+    """
+
+    def do_GET(self):
+        body = json.dumps(core.instrumentation.snapshot(),
+                          indent=2,
+                          sort_keys=True)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug('{} {}'.format(self.address_string(), format % args))
+
+
+class Instrumentation(object):
+    """
+    Turns on metrics recording and publishes snapshots every interval
+    seconds to the log and/or a JSON file, and on request over HTTP
+    """
+
+    _core_name = 'instrumentation'
+
+    def __init__(self,
+                 interval=60.0,
+                 path=None,
+                 http_port=None,
+                 http_address='127.0.0.1',
+                 time_constant=10.0):
+        self.interval = interval
+        self.path = path
+        self.stats = metrics.enable(time_constant)
+        self.__server = None
+        if http_port is not None:
+            self.__server = HTTPServer((http_address, http_port),
+                                       SnapshotRequestHandler)
+            thread = threading.Thread(target=self.__server.serve_forever,
+                                      name='instrumentation')
+            thread.daemon = True
+            thread.start()
+            log.info('Serving metrics on http://{}:{}/'
+                     .format(http_address, self.__server.server_port))
+        if interval > 0:
+            core.callDelayed(interval, self.__publish)
+        core.addListenerByName('GoingDownEvent', self.__going_down)
+
+    def snapshot(self):
+        snapshot = metrics.snapshot()
+        if core.hasComponent('convergence'):
+            snapshot['convergence'] = core.convergence.snapshot()
+        if core.hasComponent('table_capacity'):
+            snapshot['tables'] = core.table_capacity.snapshot()
+        return snapshot
+
+    def dump(self):
+        """
+        Write the current snapshot to the log and the file
+        """
+        snapshot = self.snapshot()
+        for (name, latency) in sorted(snapshot['latencies'].iteritems()):
+            log.info('{:<20} n={count} mean={mean_ms:.3f}ms '
+                     'p95={p95_ms:.3f}ms p99={p99_ms:.3f}ms max={max_ms:.3f}ms'
+                     .format(name, **latency))
+        for (name, counter) in sorted(snapshot['counters'].iteritems()):
+            log.info('{:<20} total={total} rate={rate:.1f}/s over {} switches'
+                     .format(name, len(counter['switches']), **counter))
+        if self.path:
+            self.__write(snapshot)
+        return snapshot
+
+    def reset(self):
+        metrics.disable()
+        self.stats = metrics.enable(self.stats.time_constant)
+
+    # private methods
+
+    def __publish(self):
+        self.dump()
+        core.callDelayed(self.interval, self.__publish)
+
+    def __write(self, snapshot):
+        # Readers never see a half written file
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(snapshot, f, indent=2, sort_keys=True)
+        os.rename(temporary, self.path)
+
+    def __going_down(self, event):
+        if self.__server is not None:
+            self.__server.shutdown()
+        metrics.disable()
+
+
+def launch(interval=60, file=None, http_port=None, http_address='127.0.0.1'):
+    core.registerNew(Instrumentation,
+                     interval=float(interval),
+                     path=file,
+                     http_port=int(http_port) if http_port else None,
+                     http_address=http_address)
+    # Change tracing only costs when there is someone to report it to
+    core.call_when_ready(convergence.launch,
+                         ['toponizer', 'openflow_batcher'])
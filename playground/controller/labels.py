@@ -0,0 +1,62 @@
+class LabelAllocator(object):
+    """
+    Hands out VLAN ids as destination switch labels. A switch keeps its
+    label until it is released, so the transit flows of the other
+    switches do not change on host churn.
+    """
+
+    FIRST = 1
+    LAST = 4094
+
+    def __init__(self, first=FIRST, last=LAST):
+        self.first = first
+        self.last = last
+        # dpid -> VLAN id
+        self.__labels = {}
+        self.__free = []
+        self.__next = first
+
+    def __len__(self):
+        return len(self.__labels)
+
+    def __contains__(self, dpid):
+        return dpid in self.__labels
+
+    def get(self, dpid):
+        return self.__labels.get(dpid)
+
+    def label(self, dpid):
+        """
+        Label of dpid, allocated on first use. None once all VLAN ids
+        are taken.
+        """
+        label = self.__labels.get(dpid)
+        if label is not None:
+            return label
+        if self.__free:
+            label = self.__free.pop()
+        elif self.__next <= self.last:
+            label = self.__next
+            self.__next += 1
+        else:
+            return None
+        self.__labels[dpid] = label
+        return label
+
+    def release(self, dpid):
+        label = self.__labels.pop(dpid, None)
+        if label is not None:
+            self.__free.append(label)
+        return label
+
+    def retain(self, dpids):
+        """
+        Release the labels of all switches not in dpids
+        """
+        dpids = set(dpids)
+        for dpid in list(self.__labels):
+            if dpid not in dpids:
+                self.release(dpid)
+
+    def labels(self):
+        return dict(self.__labels)
@@ -1,44 +1,189 @@
 # discovery: https://www.grotto-networking.com/SDNfun.html
 # openflow.discovery: http://xuyansen.work/discovery-topology-in-mininet/
 
+import time
+import zlib
 from pox.core import core
 import pox.openflow.libopenflow_01 as of
 import pox.openflow.discovery
 from pox.openflow.discovery import Discovery
 import pox.host_tracker
+import playground.controller.batch
+import playground.controller.route_worker
 import playground.controller.toponizer
+from playground.controller import metrics, packet_headers
 from playground.controller.toponizer import Toponizer
+from playground.controller.flow_table import (FlowEntry,
+                                              FlowPlan,
+                                              ShadowFlowTable)
+from playground.controller.labels import LabelAllocator
+from playground.controller.proxy_arp import ArpCache, FloodLimiter, arp_reply
+from playground.controller.route_worker import Job
+from pox.lib.packet.arp import arp
 from pox.lib.packet.ethernet import ethernet
-from pox.lib.addresses import EthAddr
-import networkx as nx
+from pox.lib.addresses import EthAddr, IPAddr, IP_ANY
 
 log = core.getLogger()
 
 
 class LoopDiscovery(object):
 
-    def __init__(self):
+    # Marks the flows installed by this component in flow stats replies
+    FLOW_COOKIE = 0x100b
+
+    # Forwarding modes: one dl_dst flow per host on every switch, or
+    # VLAN labels naming the destination switch
+    MAC = 'mac'
+    LABEL = 'label'
+
+    def __init__(self,
+                 arp_ttl=300,
+                 flood_rate=10.0,
+                 flood_burst=20,
+                 forwarding=MAC,
+                 ecmp=False,
+                 fast_packet_in=True):
+        if forwarding not in (LoopDiscovery.MAC, LoopDiscovery.LABEL):
+            raise ValueError('Unknown forwarding mode {}'.format(forwarding))
+        if ecmp and forwarding != LoopDiscovery.MAC:
+            raise ValueError('ECMP needs MAC forwarding')
+        self.forwarding = forwarding
+        # Spread the traffic towards a host over all equal cost paths
+        self.ecmp = ecmp
+        # Read PacketIns with packet_headers instead of parsing them
+        self.fast_packet_in = fast_packet_in
+        # dpid -> VLAN id of the egress switches in label forwarding
+        self.labels = LabelAllocator()
+        # IP -> MAC learned from ARP traffic, used to answer ARP requests
+        self.arp_cache = ArpCache(ttl=arp_ttl)
+        # Floods of unknown destinations allowed per source MAC
+        self.flood_limiter = FloodLimiter(rate=flood_rate, burst=flood_burst)
+        core.callDelayed(arp_ttl, self.__expire)
+        # dpid -> ShadowFlowTable of the flows installed on the switch
+        self.flow_tables = {}
+        # dpid -> xid of the flow stats request the shadow waits for,
+        # replies to other components' requests are left alone
+        self.__resyncs = {}
+        # switches whose flows are all replaced once their shadow is
+        # resynced
+        self.__untrusted = set()
+        # FlowPlan computed on the last TopoUpdate, None until the first
+        # one so restored switches do not lose their flows meanwhile
+        self.__plan = None
+        # (roots, host topo_ids) whose routes changed since the plan was
+        # computed, None if every destination has to be recomputed
+        self.__stale = None
+        # topo_id -> VLAN id the plan was computed with
+        self.__planned_labels = None
+        # dpid -> {port_no: flood} as last sent to the switch
+        self.__flood_states = {}
+        # switches table_capacity did not admit all planned flows on
+        self.__limited = set()
         core.toponizer.addListeners(self)
         core.openflow_discovery.addListeners(self)
         core.openflow.addListeners(self)
         core.host_tracker.addListeners(self)
 
+    def reinstall(self, dpid):
+        """
+        Delete the flows on switch dpid and install the planned ones
+        again, for switches that hold other flows than they should
+        """
+        if dpid in self.__resyncs:
+            # The shadow does not know the switch's flows yet
+            self.__untrusted.add(dpid)
+            return
+        batches = {}
+        self.__reinstall(dpid, batches)
+        self.__commit(batches)
+
     # Event handlers
 
+    @metrics.timed('TopoUpdate')
     def _handle_TopoUpdate(self, event):
-        self.__send_flood_port_mods()
-        hosts = core.toponizer.hosts()
-        for (_, host_attributes) in hosts:
-            macaddr = host_attributes['macaddr']
-            self.__send_flow_mods_for_host(macaddr)
+        # dpid -> Batch, every switch gets all its messages in one write
+        batches = {}
+        # Flooding follows the spanning tree right away, the flows once
+        # the route worker is done
+        self.__send_flood_port_mods(event.tree_ports, batches)
+        self.__commit(batches, [event.trace_id])
+        toponizer = core.toponizer
+        self.__collect_stale(toponizer.routing.take_changes())
+        routing = toponizer.routing.snapshot()
+        switches = [(switch.id, switch.dpid)
+                    for switch in toponizer.switches()]
+        hosts = [(host.id, host.macaddr) for host in toponizer.hosts()]
+        labels = self.__assign_labels(routing, switches)
+        if core.hasComponent('shard'):
+            # The other shards program their own switches
+            switches = [(topo_id, dpid) for (topo_id, dpid) in switches
+                        if core.shard.owns(dpid)]
+        stale = self.__stale
+        planned = frozenset()
+        if (self.__plan is None
+                or labels != self.__planned_labels):
+            # New edge switches need the ingress flows of every host
+            stale = None
+        elif stale is not None:
+            stale = (frozenset(stale[0]), frozenset(stale[1]))
+            planned = frozenset(self.__plan.destinations())
+        core.route_worker.submit(
+            Job(routing.version,
+                lambda: self.__compute_flows(routing,
+                                             switches,
+                                             hosts,
+                                             labels,
+                                             stale,
+                                             planned),
+                self.__flows_computed,
+                trace_id=event.trace_id))
+
+    @metrics.timed('LinkFailure')
+    def _handle_LinkFailure(self, event):
+        # Only the switch the link left from and the ends of the
+        # replacement tree link are touched, the TopoUpdate following
+        # later reoptimizes everything
+        failed_at = time.time()
+        batches = {}
+        self.__send_flood_port_mods(event.tree_ports, batches)
+        if (self.__plan is not None
+                and self.__plan.fail_over(event.dpid1, event.port1)):
+            self.__send_flow_mods(event.dpid1, batches)
+        if not batches:
+            return
+        log.debug('Failing over <s{}:p{}> on {} switches'
+                  .format(event.dpid1, event.port1, len(batches)))
+
+        def failed_over(batch):
+            metrics.observe('failover', batch.completed_at - failed_at)
+            self.__switch_programmed(batch)
+
+        for batch in batches.itervalues():
+            batch.commit(failed_over)
 
+    @metrics.timed('PacketIn')
     def _handle_PacketIn(self, event):
         #log.debug('Handle PacketIn')
+        metrics.count('packet_in', event.dpid)
+        if self.fast_packet_in:
+            self.__handle_headers(event)
+            return
         packet = event.parsed
         if not packet.parsed:
             log.warning("Ignoring incomplete packet")
             return
 
+        arp_packet = packet.find('arp')
+        if arp_packet is not None:
+            self.__learn_arp(arp_packet)
+            if (arp_packet.opcode == arp.REQUEST
+                    and self.__answer_arp(event, packet, arp_packet)):
+                return
+
+        if not self.flood_limiter.allow(packet.src):
+            log.debug('Rate limiting floods from {}'.format(packet.src))
+            return
+
         # ARP ping for unknown destination
         msg = of.ofp_packet_out()
         msg.data = event.ofp
@@ -53,110 +198,516 @@ class LoopDiscovery(object):
     def _handle_ConnectionUp(self, event):
         connection = event.connection
 
+        # Start from an empty shadow and learn what survived on the switch
+        self.flow_tables[connection.dpid] = ShadowFlowTable(
+            connection.dpid,
+            cookie=LoopDiscovery.FLOW_COOKIE)
+        request = of.ofp_stats_request(body=of.ofp_flow_stats_request())
+        self.__resyncs[connection.dpid] = request.xid
+        connection.send(request)
+
+        if (core.hasComponent('warm_start')
+                and core.warm_start.is_restored(connection.dpid)):
+            # Keep flooding where the switch does and only fix the ports
+            # that disagree with the restored spanning tree
+            self.__flood_states[connection.dpid] = dict(
+                (port.port_no, not port.config & of.OFPPC_NO_FLOOD)
+                for (_, port) in connection.ports.iteritems()
+                if port.port_no < of.OFPP_MAX)
+            batches = {}
+            self.__send_flood_port_mods(core.toponizer.tree_ports, batches)
+            self.__commit(batches)
+            return
+
         # Disable flood by default
+        batch = core.openflow_batcher.begin(connection)
+        flood_states = self.__flood_states[connection.dpid] = {}
         for no, port in connection.ports.iteritems():
             # Do not disable flooding to the controller
             if port.port_no >= of.OFPP_MAX:
                 continue
-            port_mod = self.__flood_port_mod(port, flood=False)
-            connection.send(port_mod)
+            port_mod = self.__flood_port_mod(port.port_no,
+                                             port.hw_addr,
+                                             flood=False)
+            batch.send(port_mod)
+            flood_states[port.port_no] = False
+        batch.commit()
+
+    def _handle_ConnectionDown(self, event):
+        self.flow_tables.pop(event.dpid, None)
+        self.__resyncs.pop(event.dpid, None)
+        self.__untrusted.discard(event.dpid)
+        self.__flood_states.pop(event.dpid, None)
+        self.__limited.discard(event.dpid)
+
+    def _handle_FlowStatsReceived(self, event):
+        dpid = event.connection.dpid
+        if self.__resyncs.get(dpid) != event.ofp[0].xid:
+            return
+        del self.__resyncs[dpid]
+        flow_table = self.flow_tables.get(dpid)
+        if flow_table is None:
+            return
+        flow_table.resync(event.stats)
+        log.debug('Resynced <s{}> with {} installed flows'
+                  .format(flow_table.dpid, len(flow_table)))
+        batches = {}
+        if dpid in self.__untrusted:
+            self.__untrusted.discard(dpid)
+            self.__reinstall(dpid, batches)
+        else:
+            self.__send_flow_mods(dpid, batches)
+        self.__commit(batches)
 
     # private methods
 
-    def __send_flow_mods_for_host(self, macaddr):
-        switches = core.toponizer.switches()
-        for (topo_id_s, attributes_s) in switches:
-            connection = core.openflow.getConnection(attributes_s['dpid'])
-            host = core.toponizer.get_host_by_macaddr(macaddr)
-            (topo_id_h, attributes_h) = host
-            try:
-                shortest_path = nx.shortest_path(core.toponizer.topo,
-                                                 source=topo_id_s,
-                                                 target=topo_id_h,
-                                                 weight='weight')
-                log.debug('Shortes Path between switch {} and host {}: {}'
-                          .format(topo_id_s, topo_id_h, shortest_path))
-            except nx.NetworkXNoPath:
-                log.debug('Could not find any path between switch {} and host {}'
-                          .format(topo_id_s, topo_id_h))
+    def __expire(self):
+        self.arp_cache.expire()
+        self.flood_limiter.expire()
+        core.callDelayed(self.arp_cache.ttl, self.__expire)
+
+    def __handle_headers(self, event):
+        headers = packet_headers.parse(event.data)
+        if headers is None:
+            log.warning("Ignoring incomplete packet")
+            return
+
+        if headers.is_arp:
+            protosrc = IPAddr(headers.arp_protosrc)
+            protodst = IPAddr(headers.arp_protodst)
+            # Probes come from 0.0.0.0 and bind nothing
+            if protosrc != IP_ANY and protosrc != protodst:
+                self.arp_cache.learn(protosrc, EthAddr(headers.arp_hwsrc))
+            if (headers.arp_opcode == packet_headers.ARP_REQUEST
+                    and protosrc != protodst):
+                macaddr = self.arp_cache.lookup(protodst)
+                if (macaddr is not None
+                        and core.toponizer.get_host_by_macaddr(macaddr)):
+                    msg = of.ofp_packet_out(in_port=event.port)
+                    msg.data = packet_headers.arp_reply(headers,
+                                                        macaddr.toRaw())
+                    msg.actions.append(
+                        of.ofp_action_output(port=of.OFPP_IN_PORT))
+                    event.connection.send(msg)
+                    return
+
+        if not self.flood_limiter.allow(headers.src):
+            log.debug('Rate limiting floods from {}'
+                      .format(EthAddr(headers.src)))
+            return
+
+        # A buffered packet is flooded by the switch, only unbuffered ones
+        # are sent back
+        msg = of.ofp_packet_out(in_port=event.port)
+        buffer_id = event.ofp.buffer_id
+        if buffer_id is not None and buffer_id != -1:
+            msg.buffer_id = buffer_id
+        else:
+            msg.data = event.data
+        msg.actions.append(of.ofp_action_output(port=of.OFPP_FLOOD))
+        event.connection.send(msg)
+
+    def __learn_arp(self, arp_packet):
+        if (arp_packet.protosrc != IP_ANY
+                and arp_packet.protosrc != arp_packet.protodst):
+            self.arp_cache.learn(arp_packet.protosrc, arp_packet.hwsrc)
+
+    def __answer_arp(self, event, packet, arp_packet):
+        # Gratuitous ARP has to reach everyone
+        if arp_packet.protosrc == arp_packet.protodst:
+            return False
+        macaddr = self.arp_cache.lookup(arp_packet.protodst)
+        if macaddr is None or not core.toponizer.get_host_by_macaddr(macaddr):
+            return False
+        log.debug('Answering ARP request for {} from {} with {}'
+                  .format(arp_packet.protodst, arp_packet.protosrc, macaddr))
+        msg = of.ofp_packet_out()
+        msg.data = arp_reply(packet, arp_packet, macaddr).pack()
+        msg.actions.append(of.ofp_action_output(port=of.OFPP_IN_PORT))
+        msg.in_port = event.port
+        event.connection.send(msg)
+        return True
+
+    def __batch(self, dpid, batches):
+        batch = batches.get(dpid)
+        if batch is None:
+            connection = core.openflow.getConnection(dpid)
+            if connection is None:
+                return None
+            batch = batches[dpid] = core.openflow_batcher.begin(connection)
+        return batch
+
+    def __commit(self, batches, trace_ids=()):
+        for batch in batches.itervalues():
+            batch.trace_ids = tuple(trace_ids)
+            batch.commit(self.__switch_programmed)
+
+    def __switch_programmed(self, batch):
+        log.debug('<s{}> programmed with {} messages in {:.3f}s (changes {})'
+                  .format(batch.dpid, len(batch), batch.latency,
+                          list(batch.trace_ids)))
+
+    def __assign_labels(self, routing, switches):
+        """
+        topo_id -> VLAN id of the switches hosts are attached to, None in
+        MAC forwarding
+        """
+        if self.forwarding != LoopDiscovery.LABEL:
+            return None
+        dpids = dict(switches)
+        self.labels.retain(dpids.itervalues())
+        labels = {}
+        for (root, _) in routing.host_roots.itervalues():
+            if root in dpids and root not in labels:
+                label = self.labels.label(dpids[root])
+                if label is None:
+                    log.warning('Out of VLAN labels, <s{}> is reached by MAC'
+                                .format(dpids[root]))
+                    continue
+                labels[root] = label
+        return labels
+
+    def __collect_stale(self, changes):
+        if changes is None:
+            self.__stale = None
+        elif self.__stale is not None:
+            self.__stale[0].update(changes[0])
+            self.__stale[1].update(changes[1])
+
+    def __compute_flows(self,
+                        routing,
+                        switches,
+                        hosts,
+                        labels=None,
+                        stale=None,
+                        planned=frozenset()):
+        # Runs on the route worker, only touches its arguments. Unless
+        # stale is None only the destinations routed over a changed tree
+        # or attached differently are computed, together with the names
+        # of the destinations the partial plan replaces.
+        plan = FlowPlan()
+        targets = hosts
+        transit = labels
+        destinations = None
+        if stale is not None:
+            (roots, host_ids) = stale
+            targets = [(topo_id_h, macaddr) for (topo_id_h, macaddr) in hosts
+                       if topo_id_h in host_ids
+                       or routing.host_root(topo_id_h)[0] in roots]
+            destinations = set(EthAddr(macaddr) for (_, macaddr) in targets)
+            current = set(EthAddr(macaddr) for (_, macaddr) in hosts)
+            if labels is not None:
+                transit = dict((root, label)
+                               for (root, label) in labels.iteritems()
+                               if root in roots)
+                destinations.update(('label', label)
+                                    for label in transit.itervalues())
+                current.update(('label', label)
+                               for label in labels.itervalues())
+            # Hosts that left and labels that are gone
+            destinations.update(planned - current)
+        if labels is not None:
+            self.__add_label_flows(routing,
+                                   switches,
+                                   targets,
+                                   labels,
+                                   transit,
+                                   plan)
+            return (routing, labels, plan, destinations)
+        for (topo_id_h, macaddr) in targets:
+            self.__add_flows_for_host(routing,
+                                      switches,
+                                      topo_id_h,
+                                      macaddr,
+                                      plan)
+        return (routing, labels, plan, destinations)
+
+    def __flows_computed(self, job):
+        (routing, labels, plan, destinations) = job.result
+        if core.toponizer.routing.adopt(routing):
+            self.__stale = (set(), set())
+        else:
+            # The graph changed while the flows were computed, so the trees
+            # they were built on are not cached and the next update has to
+            # recompute every destination
+            self.__stale = None
+        self.__planned_labels = labels
+        batches = {}
+        if destinations is None or self.__plan is None:
+            self.__plan = plan
+            for dpid in self.flow_tables:
+                self.__send_flow_mods(dpid, batches)
+        else:
+            touched = self.__plan.update(plan, destinations)
+            log.debug('Rerouting {} destinations on {} switches'
+                      .format(len(destinations), len(touched)))
+            for (dpid, keys) in touched.iteritems():
+                self.__send_flow_mods(dpid, batches, keys)
+        self.__commit(batches, job.trace_ids)
+
+    def __send_flow_mods(self, dpid, batches, keys=None):
+        flow_table = self.flow_tables.get(dpid)
+        if (flow_table is None
+                or self.__plan is None
+                or core.openflow.getConnection(dpid) is None):
+            return
+        desired = self.__plan.flows.get(dpid, {})
+        if core.hasComponent('table_capacity'):
+            admitted = core.table_capacity.admit(dpid,
+                                                 desired,
+                                                 len(flow_table))
+            if admitted is not desired or dpid in self.__limited:
+                # Flows left out before may fit now, compare everything
+                keys = None
+            if admitted is not desired:
+                self.__limited.add(dpid)
+            else:
+                self.__limited.discard(dpid)
+            desired = admitted
+        flow_mods = flow_table.reconcile(desired, keys)
+        if not flow_mods:
+            return
+        if core.hasComponent('table_capacity'):
+            core.table_capacity.track(dpid, flow_mods)
+        log.debug('Sending {} flow_mods to <s{}>'.format(len(flow_mods), dpid))
+        batch = self.__batch(dpid, batches)
+        for flow_mod in flow_mods:
+            batch.send(flow_mod)
+
+    def __reinstall(self, dpid, batches):
+        flow_table = self.flow_tables.get(dpid)
+        if flow_table is None:
+            return
+        flow_mods = flow_table.reconcile({})
+        if flow_mods:
+            if core.hasComponent('table_capacity'):
+                core.table_capacity.track(dpid, flow_mods)
+            log.info('Deleting {} flows from <s{}>'
+                     .format(len(flow_mods), dpid))
+            batch = self.__batch(dpid, batches)
+            for flow_mod in flow_mods:
+                batch.send(flow_mod)
+        # Without a plan yet the switch is left to the PacketIns
+        self.__send_flow_mods(dpid, batches)
+
+    def __add_flows_for_host(self,
+                             routing,
+                             switches,
+                             topo_id_h,
+                             macaddr,
+                             plan):
+        for (topo_id_s, dpid) in switches:
+            if self.ecmp:
+                # Every destination takes one of the equal cost paths,
+                # which keeps the table at one flow per host
+                ports = routing.next_hops(topo_id_s, topo_id_h)
+                port_to_gateway = None
+                if ports:
+                    bucket = LoopDiscovery.ecmp_hash(dpid, macaddr)
+                    port_to_gateway = ports[bucket % len(ports)]
+            else:
+                port_to_gateway = routing.next_hop(topo_id_s, topo_id_h)
+            if port_to_gateway is None:
+                log.debug('Could not find any path between switch <s{}> '
+                          'and host <{}>'.format(dpid, macaddr))
+                continue
+            match = of.ofp_match()
+            match.dl_dst = EthAddr(macaddr)
+            LoopDiscovery.__add_flow(plan,
+                                     dpid,
+                                     match,
+                                     [of.ofp_action_output(
+                                         port=port_to_gateway)],
+                                     backup_port=routing.backup_hop(
+                                         topo_id_s,
+                                         topo_id_h,
+                                         port_to_gateway))
+            self.__add_arp_flow(plan, dpid, macaddr)
+
+    @staticmethod
+    def ecmp_hash(dpid, destination):
+        # Stable across restarts, the switch is mixed in so the choices
+        # of consecutive switches are independent
+        return zlib.crc32('{}-{}'.format(dpid, destination)) & 0xffffffff
+
+    def __add_label_flows(self,
+                          routing,
+                          switches,
+                          hosts,
+                          labels,
+                          transit,
+                          plan):
+        # Edge switches tag the packets for a remote host with the label
+        # of its switch and deliver local ones by MAC. Every switch
+        # forwards on the label alone, the egress switch pops it.
+        dpids = dict(switches)
+        edge_switches = [topo_id for topo_id in labels if topo_id in dpids]
+        for (topo_id_h, macaddr) in hosts:
+            (root, port) = routing.host_root(topo_id_h)
+            label = labels.get(root)
+            if label is None:
+                # Multihomed or unlabelled, fall back to MAC forwarding
+                self.__add_flows_for_host(routing,
+                                          switches,
+                                          topo_id_h,
+                                          macaddr,
+                                          plan)
                 continue
-            log.debug('Sending flowmods for switch {} and host {}'
-                      .format(topo_id_s, topo_id_h))
-            gateway_topo_id = shortest_path[1]
-            port_to_gateway = (core.toponizer
-                                   .topo[topo_id_s]
-                                        [gateway_topo_id]
-                                        [0]
-                                        ['port1'])
-            msg = of.ofp_flow_mod()
-            msg.match = of.ofp_match()
-            msg.match.dl_dst = EthAddr(macaddr)
-            msg.actions.append(of.ofp_action_output(port=port_to_gateway))
-            connection.send(msg)
-
-            # let the controller still handle ARP pings
-            gateway_topo_id = shortest_path[1]
-            port_to_gateway = (core.toponizer
-                                   .topo[topo_id_s]
-                                        [gateway_topo_id]
-                                        [0]
-                                        ['port1'])
-            msg2 = of.ofp_flow_mod()
-            msg2.priority += 1
-            msg2.match = of.ofp_match()
-            msg2.match.dl_dst = EthAddr(macaddr)
-            msg2.match.dl_type = ethernet.ARP_TYPE
-            msg2.actions.append(of.ofp_action_output(port=of.OFPP_CONTROLLER))
-            connection.send(msg2)
-
-    def __send_flood_port_mods(self):
+            match = of.ofp_match()
+            match.dl_vlan = label
+            match.dl_dst = EthAddr(macaddr)
+            LoopDiscovery.__add_flow(plan,
+                                     dpids[root],
+                                     match,
+                                     [of.ofp_action_strip_vlan(),
+                                      of.ofp_action_output(port=port)])
+            for topo_id_s in edge_switches:
+                dpid = dpids[topo_id_s]
+                match = of.ofp_match()
+                match.dl_vlan = of.OFP_VLAN_NONE
+                match.dl_dst = EthAddr(macaddr)
+                backup_port = None
+                if topo_id_s == root:
+                    actions = [of.ofp_action_output(port=port)]
+                else:
+                    port_to_egress = routing.port_towards(topo_id_s, root)
+                    if port_to_egress is None:
+                        continue
+                    actions = [of.ofp_action_vlan_vid(vlan_vid=label),
+                               of.ofp_action_output(port=port_to_egress)]
+                    backup_port = routing.backup_towards(topo_id_s,
+                                                         root,
+                                                         port_to_egress)
+                LoopDiscovery.__add_flow(plan,
+                                         dpid,
+                                         match,
+                                         actions,
+                                         backup_port=backup_port)
+                self.__add_arp_flow(plan, dpid, macaddr)
+        for (root, label) in transit.iteritems():
+            for (topo_id_s, dpid) in switches:
+                if topo_id_s == root:
+                    continue
+                port_to_egress = routing.port_towards(topo_id_s, root)
+                if port_to_egress is None:
+                    continue
+                match = of.ofp_match()
+                match.dl_vlan = label
+                LoopDiscovery.__add_flow(plan,
+                                         dpid,
+                                         match,
+                                         [of.ofp_action_output(
+                                             port=port_to_egress)],
+                                         backup_port=routing.backup_towards(
+                                             topo_id_s,
+                                             root,
+                                             port_to_egress))
+
+    def __add_arp_flow(self, plan, dpid, macaddr):
+        # let the controller still handle ARP pings
+        match = of.ofp_match()
+        match.dl_dst = EthAddr(macaddr)
+        match.dl_type = ethernet.ARP_TYPE
+        LoopDiscovery.__add_flow(plan,
+                                 dpid,
+                                 match,
+                                 [of.ofp_action_output(
+                                     port=of.OFPP_CONTROLLER)],
+                                 priority=of.OFP_DEFAULT_PRIORITY + 1)
+
+    @staticmethod
+    def __add_flow(plan,
+                   dpid,
+                   match,
+                   actions,
+                   priority=of.OFP_DEFAULT_PRIORITY,
+                   backup_port=None):
+        # The output action goes last, the backup sends the same packets
+        # out of backup_port instead. Flows are grouped by the host they
+        # lead to, label transit flows by their label.
+        flow = FlowEntry(match,
+                         actions,
+                         priority=priority,
+                         cookie=LoopDiscovery.FLOW_COOKIE)
+        backup = None
+        if backup_port is not None:
+            backup = FlowEntry(match,
+                               actions[:-1]
+                               + [of.ofp_action_output(port=backup_port)],
+                               priority=priority,
+                               cookie=LoopDiscovery.FLOW_COOKIE)
+        plan.add(dpid,
+                 flow,
+                 port=actions[-1].port,
+                 backup=backup,
+                 destination=(match.dl_dst if match.dl_dst is not None
+                              else ('label', match.dl_vlan)))
+
+    def __send_flood_port_mods(self, tree_ports, batches):
         switches = core.toponizer.switches()
         for switch in switches:
-            (topo_id, attributes) = switch
-            for no, port in attributes['ports'].iteritems():
-                if port.port_no >= of.OFPP_MAX:
+            dpid = switch.dpid
+            if core.openflow.getConnection(dpid) is None:
+                continue
+            flood_states = self.__flood_states.setdefault(dpid, {})
+            spanning_tree_ports = tree_ports.get(dpid, ())
+            link_ports = core.toponizer.link_ports(dpid)
+            for (port_no, hw_addr) in switch.ports.iteritems():
+                if port_no >= of.OFPP_MAX:
+                    continue
+                flood = self.__is_flood_port(dpid,
+                                             port_no,
+                                             spanning_tree_ports,
+                                             link_ports)
+                # Only tell the switch about ports whose state flips
+                if flood_states.get(port_no) == flood:
                     continue
-                if self.__is_flood_port(switch, port):
-                    port_mod = self.__flood_port_mod(port)
+                if flood:
                     log.debug("Enabled flooding on <s{}:p{}>"
-                              .format(attributes['dpid'], port.port_no))
-                else:
-                    port_mod = self.__flood_port_mod(port, flood=False)
-                connection = core.openflow.getConnection(attributes['dpid'])
-                connection.send(port_mod)
+                              .format(dpid, port_no))
+                self.__batch(dpid, batches).send(
+                    self.__flood_port_mod(port_no, hw_addr, flood=flood))
+                flood_states[port_no] = flood
 
-    def __flood_port_mod(self, port, flood=True):
-        port_mod = of.ofp_port_mod(port_no=port.port_no,
-                                   hw_addr=port.hw_addr,
+    def __flood_port_mod(self, port_no, hw_addr, flood=True):
+        port_mod = of.ofp_port_mod(port_no=port_no,
+                                   hw_addr=hw_addr,
                                    config=0 if flood else of.OFPPC_NO_FLOOD,
                                    mask=of.OFPPC_NO_FLOOD)
         return port_mod
 
-    def __is_flood_port(self, switch, port):
-        (topo_id, attributes) = switch
-        is_edge_port = (core.openflow_discovery
-                            .is_edge_port(attributes['dpid'], port.port_no))
-        is_in_spanning_tree = False
-
-        # No need to check for edge ports
-        if not is_edge_port:
-            edges = core.toponizer.mst.edges(data=True)
-            for (topo_id1, topo_id2, attributes) in edges:
-                if topo_id == topo_id1 and port.port_no == attributes['port1']:
-                    is_in_spanning_tree = True
-                    break
-                if topo_id == topo_id2 and port.port_no == attributes['port2']:
-                    is_in_spanning_tree = True
-                    break
-
-        return is_edge_port or is_in_spanning_tree
+    def __is_flood_port(self, dpid, port_no, spanning_tree_ports, link_ports):
+        # Links restored from a snapshot are unknown to discovery until
+        # LLDP confirms them, their ports are no edge ports either
+        return (port_no in spanning_tree_ports
+                or (port_no not in link_ports
+                    and core.openflow_discovery.is_edge_port(dpid, port_no)))
 
 
-def launch():
+def launch(quiet_period=0.1,
+           max_delay=1.0,
+           arp_ttl=300,
+           flood_rate=10.0,
+           flood_burst=20,
+           threaded=True,
+           forwarding=LoopDiscovery.MAC,
+           ecmp=False,
+           fast_packet_in=True):
     def start_loop_discovery():
-        core.registerNew(LoopDiscovery)
+        core.registerNew(LoopDiscovery,
+                         arp_ttl=float(arp_ttl),
+                         flood_rate=float(flood_rate),
+                         flood_burst=int(flood_burst),
+                         forwarding=forwarding,
+                         ecmp=str(ecmp).lower() in ('true', '1'),
+                         fast_packet_in=str(fast_packet_in).lower()
+                         in ('true', '1'))
 
     pox.openflow.discovery.launch()
     pox.host_tracker.launch()
-    playground.controller.toponizer.launch()
-    core.call_when_ready(start_loop_discovery, 'toponizer')
+    playground.controller.batch.launch()
+    playground.controller.route_worker.launch(threaded=threaded)
+    playground.controller.toponizer.launch(quiet_period=quiet_period,
+                                           max_delay=max_delay)
+    core.call_when_ready(start_loop_discovery,
+                         ['toponizer', 'openflow_batcher', 'route_worker'])
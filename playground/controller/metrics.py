@@ -0,0 +1,201 @@
+"""
+Latency histograms and per switch counters for the controller hot paths.
+
+Recording is off until enable() is called, which is what the
+instrumentation component does on launch. While disabled timed() and
+count() only check a module global, so the decorators can stay on the
+event handlers.
+"""
+import functools
+import math
+import time
+
+# Recorder the helpers below write to, None while disabled
+_stats = None
+
+
+class Histogram(object):
+    """
+    Log-linear latency histogram, every power of two is split into
+    SUBBUCKETS buckets which bounds the error of a percentile to ~12%
+    """
+
+    SUBBUCKETS = 4
+
+    def __init__(self):
+        # bucket index -> number of samples
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        bucket = Histogram.bucket(seconds)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, fraction):
+        """
+        Upper bound of the bucket holding the given fraction of samples
+        """
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(Histogram.upper_bound(bucket), self.max)
+        return self.max
+
+    def snapshot(self):
+        return {'count': self.count,
+                'mean_ms': 1000 * self.total / self.count if self.count else 0,
+                'p50_ms': 1000 * self.percentile(0.5),
+                'p95_ms': 1000 * self.percentile(0.95),
+                'p99_ms': 1000 * self.percentile(0.99),
+                'max_ms': 1000 * self.max}
+
+    @staticmethod
+    def bucket(seconds):
+        if seconds <= 0:
+            return 0
+        (mantissa, exponent) = math.frexp(seconds)
+        # mantissa is in [0.5, 1)
+        sub = int((mantissa - 0.5) * 2 * Histogram.SUBBUCKETS)
+        return exponent * Histogram.SUBBUCKETS + sub
+
+    @staticmethod
+    def upper_bound(bucket):
+        (exponent, sub) = divmod(bucket, Histogram.SUBBUCKETS)
+        mantissa = 0.5 + (sub + 1) / (2.0 * Histogram.SUBBUCKETS)
+        return math.ldexp(mantissa, exponent)
+
+
+class Meter(object):
+    """
+    Event total and an exponentially decaying per second rate
+    """
+
+    def __init__(self, time_constant=10.0):
+        self.time_constant = time_constant
+        self.total = 0
+        self.__rate = 0.0
+        self.__updated = None
+
+    def mark(self, n=1, now=None):
+        now = now if now is not None else time.time()
+        self.__rate = self.rate(now) + n / self.time_constant
+        self.__updated = now
+        self.total += n
+
+    def rate(self, now=None):
+        if self.__updated is None:
+            return 0.0
+        now = now if now is not None else time.time()
+        elapsed = max(0.0, now - self.__updated)
+        return self.__rate * math.exp(-elapsed / self.time_constant)
+
+
+class Stats(object):
+    """
+    Named latency histograms and per switch meters
+    """
+
+    def __init__(self, time_constant=10.0):
+        self.time_constant = time_constant
+        self.started = time.time()
+        # name -> Histogram
+        self.histograms = {}
+        # name -> {dpid: Meter}
+        self.meters = {}
+
+    def observe(self, name, seconds):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(seconds)
+
+    def count(self, name, dpid, n=1):
+        meters = self.meters.setdefault(name, {})
+        meter = meters.get(dpid)
+        if meter is None:
+            meter = meters[dpid] = Meter(self.time_constant)
+        meter.mark(n)
+
+    def snapshot(self):
+        """
+        JSON serializable view of everything recorded so far. Only copies
+        of the dicts are iterated, so it may run on another thread.
+        """
+        now = time.time()
+        counters = {}
+        for (name, meters) in self.meters.items():
+            switches = dict((str(dpid), {'total': meter.total,
+                                         'rate': meter.rate(now)})
+                            for (dpid, meter) in meters.items())
+            counters[name] = {
+                'total': sum(m['total'] for m in switches.itervalues()),
+                'rate': sum(m['rate'] for m in switches.itervalues()),
+                'switches': switches,
+            }
+        return {'uptime_s': now - self.started,
+                'latencies': dict((name, histogram.snapshot())
+                                  for (name, histogram)
+                                  in self.histograms.items()),
+                'counters': counters}
+
+
+def enable(time_constant=10.0):
+    global _stats
+    if _stats is None:
+        _stats = Stats(time_constant)
+    return _stats
+
+
+def disable():
+    global _stats
+    _stats = None
+
+
+def enabled():
+    return _stats is not None
+
+
+def snapshot():
+    stats = _stats
+    return stats.snapshot() if stats is not None else {}
+
+
+def count(name, dpid, n=1):
+    stats = _stats
+    if stats is not None:
+        stats.count(name, dpid, n)
+
+
+def observe(name, seconds):
+    stats = _stats
+    if stats is not None:
+        stats.observe(name, seconds)
+
+
+def timed(name):
+    """
+    Decorator recording the run time of each call under name
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            stats = _stats
+            if stats is None:
+                return func(*args, **kwargs)
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stats.observe(name, time.time() - start)
+        return wrapper
+    return decorator
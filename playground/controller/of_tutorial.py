@@ -15,35 +15,95 @@
 """
 This component is for use with the OpenFlow tutorial.
 
-It acts as a simple hub, but can be modified to act like an L2
-learning switch.
+It acts as an L2 learning switch by default and can be switched back
+to a simple hub with --mode=hub.
 
 It's roughly similar to the one Brandon Heller did for NOX.
 """
 
+import time
+from collections import OrderedDict
 from pox.core import core
 import pox.openflow.libopenflow_01 as of
+from pox.lib.addresses import EthAddr
+from playground.controller import packet_headers
 
 log = core.getLogger()
 
 
 
+class MacTable (object):
+  """
+  Bounded table of which ethernet address is on which switch port.
+
+  Keys are the raw EthAddr values. Once max_entries is reached the least
+  recently learned address is evicted, and entries expire ttl seconds
+  after they were last learned.
+  """
+  def __init__ (self, max_entries=4096, ttl=300):
+    self.max_entries = max_entries
+    self.ttl = ttl
+    # EthAddr -> (port, expires), ordered from least to most recent
+    self._entries = OrderedDict()
+
+  def __len__ (self):
+    return len(self._entries)
+
+  def __contains__ (self, mac):
+    return self.lookup(mac) is not None
+
+  def learn (self, mac, port, now=None):
+    now = now if now is not None else time.time()
+    self._entries.pop(mac, None)
+    self._entries[mac] = (port, now + self.ttl)
+    while len(self._entries) > self.max_entries:
+      self._entries.popitem(last=False)
+
+  def lookup (self, mac, now=None):
+    entry = self._entries.get(mac)
+    if entry is None:
+      return None
+    port, expires = entry
+    if expires <= (now if now is not None else time.time()):
+      del self._entries[mac]
+      return None
+    return port
+
+  def forget (self, mac):
+    self._entries.pop(mac, None)
+
+
+
 class Tutorial (object):
   """
   A Tutorial object is created for each switch that connects.
   A Connection object for that switch is passed to the __init__ function.
   """
-  def __init__ (self, connection):
+  def __init__ (self, connection, mode="switch", idle_timeout=10,
+                hard_timeout=30, max_entries=4096, mac_ttl=300,
+                fast_packet_in=True):
     # Keep track of the connection to the switch so that we can
     # send it messages!
     self.connection = connection
+    self.mode = mode
 
-    # This binds our PacketIn event listener
+    # Read only the Ethernet header of PacketIns instead of parsing the
+    # whole packet
+    self.fast_packet_in = fast_packet_in
+
+    # Timeouts of the flows installed in switch mode, 0 is permanent
+    self.idle_timeout = idle_timeout
+    self.hard_timeout = hard_timeout
+
+    # This binds our PacketIn and FlowRemoved event listeners
     connection.addListeners(self)
 
     # Use this table to keep track of which ethernet address is on
     # which switch port (keys are MACs, values are ports).
-    self.mac_to_port = {}
+    self.mac_to_port = MacTable(max_entries=max_entries, ttl=mac_ttl)
+
+    # Destinations that have a flow on the switch, until its FlowRemoved
+    self.flows = set()
 
 
   def resend_packet (self, packet_in, out_port):
@@ -53,7 +113,12 @@ class Tutorial (object):
     controller due to a table-miss.
     """
     msg = of.ofp_packet_out()
-    msg.data = packet_in
+    msg.in_port = packet_in.in_port
+    if self._is_buffered(packet_in):
+      # The switch still holds the packet, no need to send it back
+      msg.buffer_id = packet_in.buffer_id
+    else:
+      msg.data = packet_in
 
     # Add an action to send to the specified port
     action = of.ofp_action_output(port = out_port)
@@ -74,51 +139,92 @@ class Tutorial (object):
     # OFPP_FLOOD.)
     self.resend_packet(packet_in, of.OFPP_ALL)
 
-    # Note that if we didn't get a valid buffer_id, a slightly better
-    # implementation would check that we got the full data before
-    # sending it (len(packet_in.data) should be == packet_in.total_len)).
-
 
   def act_like_switch (self, packet, packet_in):
     """
     Implement switch-like behavior.
     """
+    self.switch_frame(None if packet.src.is_multicast else packet.src,
+                      None if packet.dst.is_multicast else packet.dst,
+                      packet_in)
+
+
+  def switch_frame (self, src, dst, packet_in):
+    """
+    Learn src and forward the frame to dst like a learning switch.
+    src and dst are None for group addresses, which are neither learned
+    nor looked up.
+    """
 
     # Learn the port for the source MAC
     in_port = packet_in.in_port
-    dl_src = str(packet.src)
-    dl_dst = str(packet.dst)
-    self.mac_to_port[dl_src] = in_port
-  
-    if dl_dst in self.mac_to_port:
-      # Send packet out the associated port
-      dst_in_port = self.mac_to_port[dl_dst]
-      self.resend_packet(packet_in, dst_in_port)
-
-      # Once you have the above working, try pushing a flow entry
-      # instead of resending the packet (comment out the above and
-      # uncomment and complete the below.)
-
-      log.debug("Installing flow for mac address {} on port {}. Destination mac is {}".format(dl_src, in_port, dl_dst))
-      # Maybe the log statement should have source/destination/port?
-
-      msg = of.ofp_flow_mod()
-      
-      # Set fields to match received packet
-      msg.match = of.ofp_match.from_packet(packet)
-      
-      #< Set other fields of flow_mod (timeouts? buffer_id?) >
-     
-      #< Add an output action, and send -- similar to resend_packet() >
-      action = of.ofp_action_output(port=dst_in_port)
-      msg.actions.append(action)
- 
-      self.connection.send(msg)
+    if src is not None:
+      self.mac_to_port.learn(src, in_port)
 
-    else:
+    dst_port = None
+    if dst is not None:
+      dst_port = self.mac_to_port.lookup(dst)
+
+    if dst_port is None:
       # Flood the packet out everything but the input port
-      # This part looks familiar, right?
       self.resend_packet(packet_in, of.OFPP_ALL)
+      return
+
+    if dst_port == in_port:
+      log.debug("Dropping packet for {} coming from its own port {}"
+                .format(dst, in_port))
+      return
+
+    dpid = self.connection.dpid
+    # An ADD for a destination that has a flow replaces it, the table
+    # does not grow
+    new_flow = dst not in self.flows
+    if (new_flow and core.hasComponent("table_capacity")
+        and not core.table_capacity.has_room(dpid)
+        and not core.table_capacity.make_room(dpid)):
+      # The table is close to full, forward without a flow for now
+      log.debug("No room for a flow for {} on {}"
+                .format(dst, dpid))
+      self.resend_packet(packet_in, dst_port)
+      return
+
+    log.debug("Installing flow for destination {} on port {}"
+              .format(dst, dst_port))
+
+    # Match on the destination only, so one flow serves all senders
+    msg = of.ofp_flow_mod()
+    msg.match = of.ofp_match(dl_dst=dst)
+    msg.idle_timeout = self.idle_timeout
+    msg.hard_timeout = self.hard_timeout
+    msg.flags = of.OFPFF_SEND_FLOW_REM
+    msg.actions.append(of.ofp_action_output(port=dst_port))
+
+    if self._is_buffered(packet_in):
+      # The switch applies the new flow to the buffered packet itself
+      msg.buffer_id = packet_in.buffer_id
+      self.connection.send(msg)
+    else:
+      self.connection.send(msg)
+      self.resend_packet(packet_in, dst_port)
+    if new_flow:
+      self.flows.add(dst)
+      if core.hasComponent("table_capacity"):
+        core.table_capacity.installed(dpid)
+
+
+  def _is_buffered (self, packet_in):
+    return packet_in.buffer_id is not None and packet_in.buffer_id != -1
+
+
+  def _handle_FlowRemoved (self, event):
+    """
+    Forget addresses whose flow expired or was deleted, so the table
+    does not point at ports the switch no longer forwards to.
+    """
+    dl_dst = event.ofp.match.dl_dst
+    if dl_dst is not None:
+      self.mac_to_port.forget(dl_dst)
+      self.flows.discard(dl_dst)
 
 
   def _handle_PacketIn (self, event):
@@ -126,6 +232,25 @@ class Tutorial (object):
     Handles packet in messages from the switch.
     """
 
+    if self.fast_packet_in:
+      if self.mode == "hub":
+        # Flooding does not need to look into the packet at all
+        self.act_like_hub(None, event.ofp)
+        return
+      headers = packet_headers.parse(event.data)
+      if headers is None:
+        log.warning("Ignoring incomplete packet")
+        return
+      # Only unicast addresses are worth an EthAddr
+      src = None
+      if not packet_headers.is_multicast(headers.src):
+        src = EthAddr(headers.src)
+      dst = None
+      if not packet_headers.is_multicast(headers.dst):
+        dst = EthAddr(headers.dst)
+      self.switch_frame(src, dst, event.ofp)
+      return
+
     packet = event.parsed # This is the parsed packet data.
     if not packet.parsed:
       log.warning("Ignoring incomplete packet")
@@ -133,18 +258,24 @@ class Tutorial (object):
 
     packet_in = event.ofp # The actual ofp_packet_in message.
 
-    # Comment out the following line and uncomment the one after
-    # when starting the exercise.
-    #self.act_like_hub(packet, packet_in)
-    self.act_like_switch(packet, packet_in)
+    if self.mode == "hub":
+      self.act_like_hub(packet, packet_in)
+    else:
+      self.act_like_switch(packet, packet_in)
 
 
 
-def launch ():
+def launch (mode="switch", idle_timeout=10, hard_timeout=30,
+            max_entries=4096, mac_ttl=300, fast_packet_in=True):
   """
   Starts the component
   """
   def start_switch (event):
     log.debug("Controlling %s" % (event.connection,))
-    Tutorial(event.connection)
+    Tutorial(event.connection, mode=mode,
+             idle_timeout=int(idle_timeout),
+             hard_timeout=int(hard_timeout),
+             max_entries=int(max_entries),
+             mac_ttl=float(mac_ttl),
+             fast_packet_in=str(fast_packet_in).lower() in ("true", "1"))
   core.openflow.addListenerByName("ConnectionUp", start_switch)
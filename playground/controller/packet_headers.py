@@ -0,0 +1,97 @@
+"""
+Header only view of the frames in PacketIns. Reads the Ethernet header
+and the ARP header straight from the raw data instead of building a
+full pox.lib.packet object tree. Addresses stay raw bytes.
+"""
+import struct
+
+ETHERNET = struct.Struct('!6s6sH')
+VLAN = struct.Struct('!HH')
+# Ethernet/IPv4 ARP: hwtype, prototype, hwlen, protolen, opcode,
+# hwsrc, protosrc, hwdst, protodst
+ARP = struct.Struct('!HHBBH6s4s6s4s')
+
+IP_TYPE = 0x0800
+ARP_TYPE = 0x0806
+VLAN_TYPE = 0x8100
+
+ARP_REQUEST = 1
+ARP_REPLY = 2
+
+
+class Headers(object):
+    """
+    Header fields of one frame. The ARP fields are only set for
+    Ethernet/IPv4 ARP.
+    """
+
+    __slots__ = ('dst', 'src', 'type', 'tci',
+                 'arp_opcode', 'arp_hwsrc', 'arp_protosrc', 'arp_hwdst',
+                 'arp_protodst')
+
+    def __init__(self, dst, src, type, tci=None):
+        self.dst = dst
+        self.src = src
+        # Ethertype after the VLAN tag, if any
+        self.type = type
+        # Tag control information of the VLAN tag, None if untagged
+        self.tci = tci
+        self.arp_opcode = None
+        self.arp_hwsrc = None
+        self.arp_protosrc = None
+        self.arp_hwdst = None
+        self.arp_protodst = None
+
+    @property
+    def is_arp(self):
+        return self.arp_opcode is not None
+
+
+def parse(data):
+    """
+    Headers of the frame in data, a str or buffer, None if the frame is
+    too short for its Ethernet header
+    """
+    if len(data) < ETHERNET.size:
+        return None
+    (dst, src, type) = ETHERNET.unpack_from(data)
+    offset = ETHERNET.size
+    headers = Headers(dst, src, type)
+    if type == VLAN_TYPE:
+        if len(data) < offset + VLAN.size:
+            return None
+        (headers.tci, headers.type) = VLAN.unpack_from(data, offset)
+        offset += VLAN.size
+    if headers.type == ARP_TYPE:
+        if len(data) >= offset + ARP.size:
+            (hwtype, prototype, hwlen, protolen, opcode,
+             hwsrc, protosrc, hwdst, protodst) = ARP.unpack_from(data, offset)
+            if (hwtype, prototype, hwlen, protolen) == (1, IP_TYPE, 6, 4):
+                headers.arp_opcode = opcode
+                headers.arp_hwsrc = hwsrc
+                headers.arp_protosrc = protosrc
+                headers.arp_hwdst = hwdst
+                headers.arp_protodst = protodst
+    return headers
+
+
+def is_multicast(hwaddr):
+    """
+    Whether the raw hwaddr is a group address, broadcast included
+    """
+    return bool(ord(hwaddr[0]) & 1)
+
+
+def arp_reply(headers, hwaddr):
+    """
+    Raw frame answering the ARP request in headers on behalf of hwaddr,
+    tagged like the request
+    """
+    if headers.tci is None:
+        frame = ETHERNET.pack(headers.arp_hwsrc, hwaddr, ARP_TYPE)
+    else:
+        frame = (ETHERNET.pack(headers.arp_hwsrc, hwaddr, VLAN_TYPE)
+                 + VLAN.pack(headers.tci, ARP_TYPE))
+    return frame + ARP.pack(1, IP_TYPE, 6, 4, ARP_REPLY,
+                            hwaddr, headers.arp_protodst,
+                            headers.arp_hwsrc, headers.arp_protosrc)
@@ -0,0 +1,196 @@
+import time
+from pox.core import core
+import pox.openflow.libopenflow_01 as of
+
+log = core.getLogger()
+
+# ofp_phy_port.curr feature bit -> bits per second
+PORT_SPEEDS = ((of.OFPPF_10GB_FD, 10e9),
+               (of.OFPPF_1GB_FD, 1e9),
+               (of.OFPPF_1GB_HD, 1e9),
+               (of.OFPPF_100MB_FD, 100e6),
+               (of.OFPPF_100MB_HD, 100e6),
+               (of.OFPPF_10MB_FD, 10e6),
+               (of.OFPPF_10MB_HD, 10e6))
+
+
+def port_speed(port, default=None):
+    """
+    Current speed of an ofp_phy_port in bits per second
+    """
+    curr = getattr(port, 'curr', 0) or 0
+    for (feature, speed) in PORT_SPEEDS:
+        if curr & feature:
+            return speed
+    return default
+
+
+class PortLoad(object):
+    """
+    Smoothed transmit utilization of a single switch port and the weight
+    level derived from it
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.tx_bytes = None
+        self.sampled_at = None
+        # EWMA of the fraction of capacity used
+        self.utilization = 0.0
+        # Number of thresholds the utilization is above
+        self.level = 0
+
+    def sample(self, tx_bytes, now, alpha):
+        """
+        Feed a counter reading, returns False for the first reading and
+        counter resets
+        """
+        (previous, previous_at) = (self.tx_bytes, self.sampled_at)
+        self.tx_bytes = tx_bytes
+        self.sampled_at = now
+        if previous is None or tx_bytes < previous or now <= previous_at:
+            return False
+        rate = 8.0 * (tx_bytes - previous) / (now - previous_at)
+        self.utilization = (alpha * min(rate / self.capacity, 1.0)
+                            + (1 - alpha) * self.utilization)
+        return True
+
+
+class PortStatsCollector(object):
+    """
+    Polls port counters and turns transmit utilization into link weights.
+
+    The weight of a link is its speed cost, reference_bandwidth divided
+    by the port speed, times one plus the number of utilization
+    thresholds crossed. A level is only left again once the utilization
+    dropped hysteresis below its threshold, so routes do not flap around
+    a threshold. Toponizer is told only about levels that changed.
+
+    The speed costs are handed over as soon as a switch connects, before
+    discovery finds its links, and again when a port changes speed. The
+    polls then only move weights for load.
+    """
+
+    _core_name = 'port_stats'
+
+    def __init__(self,
+                 interval=5.0,
+                 alpha=0.3,
+                 thresholds=(0.5, 0.7, 0.9),
+                 hysteresis=0.05,
+                 reference_bandwidth=10e9,
+                 default_speed=1e9):
+        self.interval = interval
+        self.alpha = alpha
+        self.thresholds = sorted(thresholds)
+        self.hysteresis = hysteresis
+        self.reference_bandwidth = reference_bandwidth
+        self.default_speed = default_speed
+        # (dpid, port_no) -> PortLoad
+        self.loads = {}
+        # (dpid, port_no) -> weight last handed to Toponizer
+        self.__weights = {}
+        core.openflow.addListeners(self)
+        core.callDelayed(interval, self.__poll)
+
+    def weight(self, dpid, port_no):
+        return self.__weights.get((dpid, port_no))
+
+    def utilization(self, dpid, port_no):
+        load = self.loads.get((dpid, port_no))
+        return load.utilization if load else None
+
+    # event handlers
+
+    def _handle_ConnectionUp(self, event):
+        for port in event.ofp.ports:
+            if port.port_no < of.OFPP_MAX:
+                key = (event.dpid, port.port_no)
+                load = self.loads[key] = PortLoad(
+                    port_speed(port, self.default_speed))
+                self.__update_weight(key, load)
+
+    def _handle_PortStatus(self, event):
+        if event.deleted or event.port >= of.OFPP_MAX:
+            return
+        key = (event.dpid, event.port)
+        load = self.loads.get(key)
+        capacity = port_speed(event.ofp.desc, self.default_speed)
+        if load is None or load.capacity != capacity:
+            # The utilization was a fraction of the old speed, start over
+            load = self.loads[key] = PortLoad(capacity)
+            self.__update_weight(key, load)
+
+    def _handle_PortStatsReceived(self, event):
+        connection = event.connection
+        now = time.time()
+        for stats in event.stats:
+            if stats.port_no >= of.OFPP_MAX:
+                continue
+            key = (connection.dpid, stats.port_no)
+            load = self.loads.get(key)
+            if load is None:
+                port = (connection.ports[stats.port_no]
+                        if stats.port_no in connection.ports else None)
+                load = self.loads[key] = PortLoad(
+                    port_speed(port, self.default_speed))
+            if load.sample(stats.tx_bytes, now, self.alpha):
+                load.level = self.__level(load)
+            self.__update_weight(key, load)
+
+    def _handle_ConnectionDown(self, event):
+        for key in [key for key in self.loads if key[0] == event.dpid]:
+            del self.loads[key]
+            self.__weights.pop(key, None)
+
+    # private methods
+
+    def __poll(self):
+        for connection in core.openflow.connections.values():
+            connection.send(of.ofp_stats_request(
+                body=of.ofp_port_stats_request()))
+        core.callDelayed(self.interval, self.__poll)
+
+    def __level(self, load):
+        level = load.level
+        while (level < len(self.thresholds)
+               and load.utilization > self.thresholds[level]):
+            level += 1
+        while (level > 0
+               and load.utilization
+               < self.thresholds[level - 1] - self.hysteresis):
+            level -= 1
+        return level
+
+    def __update_weight(self, key, load):
+        cost = max(1, int(round(self.reference_bandwidth / load.capacity)))
+        weight = cost * (1 + load.level)
+        if self.__weights.get(key) == weight:
+            return
+        (dpid, port_no) = key
+        log.debug('<s{}:p{}> at {:.0%} of {:.0f}Mb/s, weight {}'
+                  .format(dpid, port_no, load.utilization,
+                          load.capacity / 1e6, weight))
+        self.__weights[key] = weight
+        if core.hasComponent('shard'):
+            # Every shard has to route with the same weights
+            core.shard.set_link_weight(dpid, port_no, weight)
+        else:
+            core.toponizer.set_link_weight(dpid, port_no, weight)
+
+
+def launch(interval=5,
+           alpha=0.3,
+           thresholds='0.5,0.7,0.9',
+           hysteresis=0.05,
+           reference_bandwidth=10e9):
+    def start():
+        core.registerNew(PortStatsCollector,
+                         interval=float(interval),
+                         alpha=float(alpha),
+                         thresholds=[float(threshold) for threshold
+                                     in str(thresholds).split(',')],
+                         hysteresis=float(hysteresis),
+                         reference_bandwidth=float(reference_bandwidth))
+
+    core.call_when_ready(start, ['toponizer'])
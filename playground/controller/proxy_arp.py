@@ -0,0 +1,107 @@
+import time
+from collections import OrderedDict
+from pox.lib.packet.arp import arp
+from pox.lib.packet.ethernet import ethernet
+
+
+class ArpCache(object):
+    """
+    IP -> MAC mappings that expire ttl seconds after they were learned
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        # ip -> (macaddr, expires), ordered by expiry
+        self.__entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def learn(self, ip, macaddr, now=None):
+        now = now if now is not None else time.time()
+        # Re-insert so the dictionary stays ordered by expiry
+        self.__entries.pop(ip, None)
+        self.__entries[ip] = (macaddr, now + self.ttl)
+
+    def lookup(self, ip, now=None):
+        entry = self.__entries.get(ip)
+        if entry is None:
+            return None
+        (macaddr, expires) = entry
+        if expires <= (now if now is not None else time.time()):
+            del self.__entries[ip]
+            return None
+        return macaddr
+
+    def forget(self, ip):
+        self.__entries.pop(ip, None)
+
+    def forget_macaddr(self, macaddr):
+        for (ip, (cached_macaddr, _)) in self.__entries.items():
+            if cached_macaddr == macaddr:
+                del self.__entries[ip]
+
+    def expire(self, now=None):
+        now = now if now is not None else time.time()
+        expired = 0
+        while self.__entries:
+            (ip, (_, expires)) = next(self.__entries.iteritems())
+            if expires > now:
+                break
+            del self.__entries[ip]
+            expired += 1
+        return expired
+
+
+class FloodLimiter(object):
+    """
+    Token bucket per source address, allowing rate floods per second
+    with bursts of up to burst packets
+    """
+
+    def __init__(self, rate=10.0, burst=20):
+        self.rate = rate
+        self.burst = burst
+        # source -> (tokens, last refill)
+        self.__buckets = {}
+
+    def allow(self, source, now=None):
+        now = now if now is not None else time.time()
+        (tokens, last) = self.__buckets.get(source, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        if tokens < 1:
+            self.__buckets[source] = (tokens, now)
+            return False
+        self.__buckets[source] = (tokens - 1, now)
+        return True
+
+    def expire(self, now=None):
+        """
+        Drop the buckets that refilled completely, they are equivalent to
+        a fresh one
+        """
+        now = now if now is not None else time.time()
+        for (source, (tokens, last)) in self.__buckets.items():
+            if tokens + (now - last) * self.rate >= self.burst:
+                del self.__buckets[source]
+
+
+def arp_reply(request_packet, request, macaddr):
+    """
+    Ethernet frame answering the ARP request on behalf of macaddr
+    """
+    reply = arp()
+    reply.hwtype = request.hwtype
+    reply.prototype = request.prototype
+    reply.hwlen = request.hwlen
+    reply.protolen = request.protolen
+    reply.opcode = arp.REPLY
+    reply.hwdst = request.hwsrc
+    reply.protodst = request.protosrc
+    reply.protosrc = request.protodst
+    reply.hwsrc = macaddr
+    frame = ethernet(type=request_packet.type,
+                     src=macaddr,
+                     dst=request.hwsrc)
+    frame.set_payload(reply)
+    return frame
@@ -0,0 +1,130 @@
+import threading
+from pox.core import core
+from pox.lib.revent import *
+
+log = core.getLogger()
+
+
+class JobFinished (Event):
+  """
+  Raised on the event loop once a job's result was delivered or dropped
+  as stale
+  """
+  def __init__ (self, job, stale=False):
+    Event.__init__(self)
+    self.job = job
+    self.stale = stale
+
+
+class Job(object):
+    """
+    function runs on the worker thread and may only touch the immutable
+    data it closes over. callback(job) runs on the event loop with the
+    result, unless a job for a newer topology version was submitted in
+    the meantime.
+    """
+
+    def __init__(self, version, function, callback, trace_id=None):
+        self.version = version
+        self.function = function
+        self.callback = callback
+        # Trace ids of the topology changes the result will cover,
+        # superseded jobs hand theirs down to the newer one
+        self.trace_ids = [trace_id] if trace_id is not None else []
+        self.result = None
+        self.error = None
+
+
+class RouteWorker(EventMixin):
+    """
+    Runs route computations off the POX event loop, so PacketIns, echo
+    replies and LLDP keep being served while a large fabric recomputes.
+
+    At most one job runs and one waits. Submitting replaces the waiting
+    job, and a result is only delivered if no newer version was
+    submitted since. With threaded=False jobs run inline on submit.
+    """
+
+    _core_name = 'route_worker'
+    _eventMixin_events = set([
+        JobFinished,
+    ])
+
+    def __init__(self, threaded=True):
+        self.threaded = threaded
+        self.__lock = threading.Condition()
+        self.__waiting = None
+        self.__running = None
+        # Newest version submitted
+        self.__version = None
+        if threaded:
+            thread = threading.Thread(target=self.__work, name='route_worker')
+            thread.daemon = True
+            thread.start()
+
+    def submit(self, job):
+        with self.__lock:
+            self.__version = job.version
+            # Results of the older jobs will be dropped, so this one has
+            # to account for their changes
+            for older in (self.__running, self.__waiting):
+                if older is not None:
+                    job.trace_ids = older.trace_ids + job.trace_ids
+                    older.trace_ids = []
+            self.__waiting = job
+            self.__lock.notify()
+        if not self.threaded:
+            self.__run(self.__take())
+
+    def pending_traces(self):
+        with self.__lock:
+            return set(trace_id
+                       for job in (self.__running, self.__waiting)
+                       if job is not None
+                       for trace_id in job.trace_ids)
+
+    def busy(self):
+        with self.__lock:
+            return self.__running is not None or self.__waiting is not None
+
+    # private methods
+
+    def __work(self):
+        while True:
+            with self.__lock:
+                while self.__waiting is None:
+                    self.__lock.wait()
+            self.__run(self.__take())
+
+    def __take(self):
+        with self.__lock:
+            job = self.__running = self.__waiting
+            self.__waiting = None
+            return job
+
+    def __run(self, job):
+        try:
+            job.result = job.function()
+        except Exception as e:
+            log.exception('Route computation for version {} failed'
+                          .format(job.version))
+            job.error = e
+        if self.threaded:
+            core.callLater(self.__finish, job)
+        else:
+            self.__finish(job)
+
+    def __finish(self, job):
+        with self.__lock:
+            if self.__running is job:
+                self.__running = None
+            stale = job.version != self.__version
+        if stale:
+            log.debug('Dropping routes of stale version {}'.format(job.version))
+        elif job.error is None:
+            job.callback(job)
+        self.raiseEventNoErrors(JobFinished, job, stale=stale)
+
+
+def launch(threaded=True):
+    core.registerNew(RouteWorker, str(threaded).lower() not in ('false', '0'))
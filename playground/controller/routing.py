@@ -0,0 +1,400 @@
+import heapq
+from playground.controller import metrics
+
+
+class ShortestPathTree(object):
+    """
+    Reverse shortest path tree towards a single root node
+    """
+    def __init__(self, root, distances, hops, alternatives=None, backups=None):
+        self.root = root
+        # topo_id -> cost of the path to the root
+        self.distances = distances
+        # topo_id -> (next topo_id, outgoing port) towards the root
+        self.hops = hops
+        # topo_id -> all equal cost (next topo_id, outgoing port), only
+        # for nodes with more than one, the first one is in hops
+        self.alternatives = alternatives if alternatives is not None else {}
+        # topo_id -> (next topo_id, outgoing port) of the cheapest loop
+        # free alternate besides the hop in hops, a neighbour closer to
+        # the root than topo_id itself
+        self.backups = backups if backups is not None else {}
+
+    def backup_port(self, topo_id, failed_port):
+        """
+        Port to use from topo_id once the link on failed_port is gone
+        """
+        hop = self.hops.get(topo_id)
+        if hop is None:
+            return None
+        if hop[1] != failed_port:
+            return hop[1]
+        backup = self.backups.get(topo_id)
+        return backup[1] if backup else None
+
+    def links(self):
+        """
+        (topo_id, next topo_id, port) of every link the tree routes or
+        falls back over
+        """
+        for (topo_id, (next_id, port)) in self.hops.iteritems():
+            yield (topo_id, next_id, port)
+        for (topo_id, hops) in self.alternatives.iteritems():
+            for (next_id, port) in hops[1:]:
+                yield (topo_id, next_id, port)
+        for (topo_id, (next_id, port)) in self.backups.iteritems():
+            yield (topo_id, next_id, port)
+
+    def hops_of(self, topo_id):
+        alternatives = self.alternatives.get(topo_id)
+        if alternatives is not None:
+            return alternatives
+        hop = self.hops.get(topo_id)
+        return [hop] if hop else []
+
+    def __contains__(self, topo_id):
+        return topo_id in self.distances
+
+
+class RoutingSnapshot(object):
+    """
+    Frozen view of a RoutingEngine for computing next hops away from the
+    event loop. It holds the adjacency arrays of one graph version, the
+    roots of all hosts and the trees that were still valid, and computes
+    missing trees into its own cache.
+    """
+
+    def __init__(self, version, adjacency, host_roots, trees):
+        self.version = version
+        self.adjacency = adjacency
+        # host topo_id -> (root topo_id, port on the root or None)
+        self.host_roots = host_roots
+        # root topo_id -> ShortestPathTree
+        self.trees = trees
+
+    def next_hop(self, topo_id_s, topo_id_h):
+        (root, port) = self.host_root(topo_id_h)
+        if root is None:
+            return None
+        if root == topo_id_s:
+            return port
+        return self.port_towards(topo_id_s, root)
+
+    def host_root(self, topo_id_h):
+        """
+        (switch or host the tree towards topo_id_h is rooted at, port on
+        the root or None)
+        """
+        return self.host_roots.get(topo_id_h, (None, None))
+
+    def port_towards(self, topo_id, root):
+        hop = self.tree(root).hops.get(topo_id)
+        return hop[1] if hop else None
+
+    def backup_towards(self, topo_id, root, failed_port):
+        return self.tree(root).backup_port(topo_id, failed_port)
+
+    def backup_hop(self, topo_id_s, topo_id_h, failed_port):
+        """
+        Port on topo_id_s towards topo_id_h once failed_port is down
+        """
+        (root, _) = self.host_root(topo_id_h)
+        if root is None or root == topo_id_s:
+            return None
+        return self.backup_towards(topo_id_s, root, failed_port)
+
+    def next_hops(self, topo_id_s, topo_id_h):
+        """
+        Ports of all equal cost paths from topo_id_s towards topo_id_h,
+        the one next_hop returns first
+        """
+        (root, port) = self.host_root(topo_id_h)
+        if root is None:
+            return []
+        if root == topo_id_s:
+            return [port]
+        return [hop_port for (_, hop_port)
+                in self.tree(root).hops_of(topo_id_s)]
+
+    def tree(self, root):
+        tree = self.trees.get(root)
+        if tree is None:
+            tree = self.trees[root] = shortest_path_tree(self.adjacency, root)
+        return tree
+
+
+class RoutingEngine(object):
+    """
+    Next hop lookups on top of the Toponizer TopologyGraph.
+
+    Instead of running one shortest path search per switch and host, the
+    engine computes one reverse shortest path tree per destination and
+    caches it until a graph change can affect it. Hosts attached to a
+    single switch share the tree rooted at that switch, multihomed hosts
+    get a tree rooted at the host itself. Hosts never forward traffic.
+
+    The roots of dropped trees and the hosts whose attachment changed are
+    collected until take_changes(), so callers only redo the routes of
+    those destinations.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        # root topo_id -> ShortestPathTree
+        self.__trees = {}
+        # host topo_id -> (root topo_id, port on the root or None)
+        self.__host_roots = {}
+        # (topo_id, next topo_id, port) -> roots of the cached trees that
+        # route or fall back over that link
+        self.__routes_over = {}
+        self.__stale_roots = set()
+        self.__stale_hosts = set()
+        # set by invalidate(), every route is stale
+        self.__invalidated = True
+
+    def next_hop(self, topo_id_s, topo_id_h):
+        """
+        Port on switch topo_id_s towards host topo_id_h or None
+        """
+        (root, port) = self.__host_root(topo_id_h)
+        if root is None:
+            return None
+        if root == topo_id_s:
+            return port
+        hop = self.tree(root).hops.get(topo_id_s)
+        return hop[1] if hop else None
+
+    def tree(self, root):
+        tree = self.__trees.get(root)
+        if tree is None:
+            tree = shortest_path_tree(self.graph.reverse_adjacency(), root)
+            self.__keep(root, tree)
+        return tree
+
+    def routes_over(self, topo_id1, topo_id2, port):
+        """
+        Roots of the cached trees using the link from port on topo_id1 to
+        topo_id2
+        """
+        return set(self.__routes_over.get((topo_id1, topo_id2, port), ()))
+
+    def take_changes(self):
+        """
+        (roots whose trees were dropped, hosts whose attachment changed)
+        since the last call, None if everything has to be redone
+        """
+        changes = (None if self.__invalidated
+                   else (self.__stale_roots, self.__stale_hosts))
+        self.__stale_roots = set()
+        self.__stale_hosts = set()
+        self.__invalidated = False
+        return changes
+
+    def trees(self):
+        return self.__trees.values()
+
+    def snapshot(self):
+        """
+        RoutingSnapshot of the current graph version, safe to hand to
+        another thread
+        """
+        host_roots = dict((node.id, self.__host_root(node.id))
+                          for node in self.graph.nodes()
+                          if node.is_host)
+        return RoutingSnapshot(self.graph.version,
+                               self.graph.reverse_adjacency(),
+                               host_roots,
+                               dict(self.__trees))
+
+    def adopt(self, snapshot):
+        """
+        Take over the trees computed on a snapshot of the current version
+        """
+        if snapshot.version != self.graph.version:
+            return False
+        for (root, tree) in snapshot.trees.iteritems():
+            if root not in self.__trees:
+                self.__keep(root, tree)
+        return True
+
+    def invalidate(self):
+        self.__trees.clear()
+        self.__host_roots.clear()
+        self.__routes_over.clear()
+        self.__invalidated = True
+
+    # graph change notifications
+
+    def edge_added(self, topo_id1, topo_id2, weight):
+        if self.__is_host(topo_id1) or self.__is_host(topo_id2):
+            self.__forget_host_roots(topo_id1, topo_id2)
+        if self.__is_host(topo_id1):
+            return
+        # A new edge only matters to trees it offers a shorter or an
+        # equal cost path in, or a cheaper loop free alternate
+        for (root, tree) in self.__trees.items():
+            distance = tree.distances.get(topo_id2)
+            if distance is None:
+                continue
+            current = tree.distances.get(topo_id1)
+            if (current is None
+                    or distance + weight <= current
+                    or (distance < current
+                        and distance + weight
+                        < self.__backup_cost(tree, topo_id1))):
+                self.__drop(root)
+
+    def edge_removed(self, topo_id1, topo_id2, port):
+        if self.__is_host(topo_id1) or self.__is_host(topo_id2):
+            self.__forget_host_roots(topo_id1, topo_id2)
+        # Only trees routing or falling back over the removed edge have to
+        # be rebuilt
+        for root in self.routes_over(topo_id1, topo_id2, port):
+            self.__drop(root)
+
+    def edge_weight_changed(self, topo_id1, topo_id2, port, weight):
+        # Trees routing over the edge may now have a cheaper detour, trees
+        # that do not may now have a cheaper path over it
+        self.edge_removed(topo_id1, topo_id2, port)
+        self.edge_added(topo_id1, topo_id2, weight)
+
+    def node_removed(self, topo_id):
+        if self.__host_roots.pop(topo_id, None):
+            self.__stale_hosts.add(topo_id)
+        for (host, (root, _)) in self.__host_roots.items():
+            if root == topo_id:
+                del self.__host_roots[host]
+                self.__stale_hosts.add(host)
+        for (root, tree) in self.__trees.items():
+            if root == topo_id or topo_id in tree:
+                self.__drop(root)
+
+    # private methods
+
+    def __keep(self, root, tree):
+        self.__trees[root] = tree
+        for link in tree.links():
+            self.__routes_over.setdefault(link, set()).add(root)
+
+    def __drop(self, root):
+        tree = self.__trees.pop(root, None)
+        if tree is None:
+            return
+        self.__stale_roots.add(root)
+        for link in tree.links():
+            roots = self.__routes_over.get(link)
+            if roots is not None:
+                roots.discard(root)
+                if not roots:
+                    del self.__routes_over[link]
+
+    def __backup_cost(self, tree, topo_id):
+        backup = tree.backups.get(topo_id)
+        if backup is None:
+            return float('inf')
+        (next_id, port) = backup
+        for link in self.graph.links_between(topo_id, next_id):
+            if link.port1 == port:
+                return tree.distances[next_id] + link.weight
+        return float('inf')
+
+    def __is_host(self, topo_id):
+        node = self.graph.node(topo_id)
+        return node is not None and node.is_host
+
+    def __forget_host_roots(self, *topo_ids):
+        for topo_id in topo_ids:
+            if self.__is_host(topo_id):
+                self.__stale_hosts.add(topo_id)
+            if self.__host_roots.pop(topo_id, None):
+                self.__drop(topo_id)
+
+    def __host_root(self, topo_id_h):
+        root = self.__host_roots.get(topo_id_h)
+        if root is None:
+            switches = self.graph.successors(topo_id_h)
+            if len(switches) == 1:
+                topo_id_s = switches[0]
+                links = self.graph.links_between(topo_id_s, topo_id_h)
+                if links:
+                    root = (topo_id_s, links[0].port1)
+                else:
+                    root = (None, None)
+            elif switches:
+                root = (topo_id_h, None)
+            else:
+                root = (None, None)
+            self.__host_roots[topo_id_h] = root
+        return root
+
+
+@metrics.timed('shortest_path_tree')
+def shortest_path_tree(adjacency, root):
+    """
+    Dijkstra towards root over the reverse Adjacency of a TopologyGraph
+    """
+    offsets = adjacency.offsets
+    sources = adjacency.sources
+    ports = adjacency.ports
+    weights = adjacency.weights
+    # Hosts are marked done up front so they never forward traffic
+    done = bytearray(adjacency.hosts)
+    done[root] = 0
+    distances = {root: 0}
+    hops = {}
+    alternatives = {}
+    heap = [(0, root)]
+    while heap:
+        (distance, topo_id) = heapq.heappop(heap)
+        if done[topo_id]:
+            continue
+        done[topo_id] = 1
+        for i in xrange(offsets[topo_id], offsets[topo_id + 1]):
+            predecessor = sources[i]
+            if done[predecessor]:
+                continue
+            candidate = distance + weights[i]
+            current = distances.get(predecessor, candidate + 1)
+            if candidate < current:
+                distances[predecessor] = candidate
+                hops[predecessor] = (topo_id, ports[i])
+                alternatives.pop(predecessor, None)
+                heapq.heappush(heap, (candidate, predecessor))
+            elif candidate == current:
+                alternatives.setdefault(predecessor,
+                                        [hops[predecessor]]).append(
+                    (topo_id, ports[i]))
+    return ShortestPathTree(root,
+                            distances,
+                            hops,
+                            alternatives,
+                            loop_free_alternates(adjacency, distances, hops))
+
+
+def loop_free_alternates(adjacency, distances, hops):
+    """
+    Cheapest alternate next hop of every node that satisfies the
+    downstream condition: the neighbour is strictly closer to the root,
+    so its own path can neither come back nor use the failed link
+    """
+    offsets = adjacency.offsets
+    sources = adjacency.sources
+    ports = adjacency.ports
+    weights = adjacency.weights
+    hosts = adjacency.hosts
+    best = {}
+    for (topo_id, distance) in distances.iteritems():
+        for i in xrange(offsets[topo_id], offsets[topo_id + 1]):
+            predecessor = sources[i]
+            if hosts[predecessor]:
+                continue
+            current = distances.get(predecessor)
+            if current is None or distance >= current:
+                continue
+            hop = (topo_id, ports[i])
+            if hops.get(predecessor) == hop:
+                continue
+            cost = weights[i] + distance
+            if predecessor not in best or cost < best[predecessor][0]:
+                best[predecessor] = (cost, hop)
+    return dict((topo_id, hop) for (topo_id, (_, hop)) in best.iteritems())
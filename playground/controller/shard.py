@@ -0,0 +1,237 @@
+import time
+from pox.core import core
+from pox.lib.revent import EventHalt
+import pox.openflow.libopenflow_01 as of
+from pox.lib.addresses import EthAddr
+from pox.lib.packet.ethernet import ethernet
+from pox.lib.packet.lldp import lldp, chassis_id, port_id
+from playground.controller import packet_headers
+from playground.controller.loop_discovery import LoopDiscovery
+from playground.controller.shard_log import LogClient, LogHub
+
+log = core.getLogger()
+
+# Ahead of discovery, which listens at 0xffffffff and drops LLDP from
+# switches that are not connected here, and of the components that
+# would program a switch of another shard
+PRIORITY = 0x100000000
+
+
+class Shard(object):
+    """
+    One of count controller processes sharing a fabric. The shard owns
+    the switches whose dpid modulo count is its index and only programs
+    those.
+
+    Switches, links, hosts and link weights observed by any shard are
+    appended to a shared log and every shard applies the log to its
+    Toponizer, its own observations included. With the same records in
+    the same order all shards build the same graph and spanning tree, so
+    flooding stays loop free across shards and routes agree.
+
+    Links between switches of different shards are learned from the LLDP
+    discovery sends out of the other shard's switch and expire like
+    discovery's own after link_timeout seconds without LLDP.
+    """
+
+    _core_name = 'shard'
+
+    def __init__(self, index, count, path, hub=False, link_timeout=10.0):
+        if core.LoopDiscovery.forwarding == LoopDiscovery.LABEL:
+            raise ValueError('Label forwarding needs labels agreed between '
+                             'shards, use MAC forwarding')
+        self.index = index
+        self.count = count
+        self.link_timeout = link_timeout
+        # Records applied from the log
+        self.applied = 0
+        # (dpid1, port1, dpid2, port2) -> time of the last LLDP, for the
+        # links from other shards' switches to ours
+        self.__remote_links = {}
+        self.__hub = None
+        if hub:
+            self.__hub = LogHub(path)
+            self.__hub.start()
+        core.toponizer.detach()
+        self.__client = LogClient(path, self.__received)
+        core.openflow.addListeners(self, priority=PRIORITY)
+        core.openflow_discovery.addListeners(self)
+        core.host_tracker.addListeners(self)
+        core.addListenerByName('GoingDownEvent', self.__going_down)
+        if link_timeout > 0:
+            core.callDelayed(link_timeout / 2, self.__expire_links)
+        log.info('Shard {} of {} on {}'.format(index, count, path))
+
+    def owns(self, dpid):
+        return dpid % self.count == self.index
+
+    def set_link_weight(self, dpid, port, weight):
+        self.__append('weight', dpid=dpid, port=port, weight=weight)
+
+    def observe_link(self, dpid1, port1, dpid2, port2):
+        """
+        LLDP sent out of port1 on dpid1 was received on port2 on dpid2
+        """
+        link = (dpid1, port1, dpid2, port2)
+        if link not in self.__remote_links:
+            self.__append('link_up', link=link)
+        self.__remote_links[link] = time.time()
+
+    # event handlers
+
+    def _handle_ConnectionUp(self, event):
+        if not self.owns(event.dpid):
+            log.warning('<s{}> belongs to shard {}, disconnecting'
+                        .format(event.dpid, event.dpid % self.count))
+            event.connection.disconnect()
+            return EventHalt
+        self.__append('switch_up',
+                      dpid=event.dpid,
+                      ports=[(port.port_no, str(port.hw_addr))
+                             for port in event.connection.ports.itervalues()])
+
+    def _handle_PacketIn(self, event):
+        headers = packet_headers.parse(event.data)
+        if headers is None or headers.type != ethernet.LLDP_TYPE:
+            return
+        origin = Shard.__lldp_origin(event.parsed.find('lldp'))
+        if origin is None or core.openflow.getConnection(origin[0]):
+            # Links within the shard are left to discovery
+            return
+        self.observe_link(origin[0], origin[1], event.dpid, event.port)
+        return EventHalt
+
+    def _handle_PortStatus(self, event):
+        if not (event.deleted
+                or event.ofp.desc.state & of.OFPPS_LINK_DOWN):
+            return
+        for link in self.__remote_links.keys():
+            if link[2] == event.dpid and link[3] == event.port:
+                self.__drop_remote_link(link)
+
+    def _handle_LinkEvent(self, event):
+        link = event.link
+        self.__append('link_up' if event.added else 'link_down',
+                      link=(link.dpid1, link.port1, link.dpid2, link.port2))
+
+    def _handle_HostEvent(self, event):
+        entry = event.entry
+        if event.leave:
+            if self.__is_edge_port(entry.dpid, entry.port):
+                self.__append('host_leave', mac=str(entry.macaddr))
+        elif event.move:
+            if self.__is_edge_port(event.new_dpid, event.new_port):
+                self.__append('host_move',
+                              mac=str(entry.macaddr),
+                              dpid=event.new_dpid,
+                              port=event.new_port)
+        elif event.join:
+            if self.__is_edge_port(entry.dpid, entry.port):
+                self.__append('host_join',
+                              mac=str(entry.macaddr),
+                              dpid=entry.dpid,
+                              port=entry.port)
+
+    # private methods
+
+    @staticmethod
+    def __lldp_origin(lldph):
+        # (dpid, port) the way discovery encodes them
+        if lldph is None or not lldph.parsed or len(lldph.tlvs) < 2:
+            return None
+        (chassis, port) = lldph.tlvs[:2]
+        if (chassis.tlv_type != lldp.CHASSIS_ID_TLV
+                or chassis.subtype != chassis_id.SUB_LOCAL
+                or not chassis.id.startswith('dpid:')
+                or port.tlv_type != lldp.PORT_ID_TLV
+                or port.subtype != port_id.SUB_PORT):
+            return None
+        try:
+            return (int(chassis.id[5:], 16), int(port.id))
+        except ValueError:
+            return None
+
+    def __is_edge_port(self, dpid, port):
+        # Packets from other shards' hosts enter through the links between
+        # shards, which local discovery takes for edge ports
+        return (self.owns(dpid)
+                and port not in core.toponizer.link_ports(dpid))
+
+    def __expire_links(self):
+        deadline = time.time() - self.link_timeout
+        for (link, seen_at) in self.__remote_links.items():
+            if seen_at < deadline:
+                log.info('Link <s{}:p{}> -> <s{}:p{}> timed out'
+                         .format(*link))
+                self.__drop_remote_link(link)
+        core.callDelayed(self.link_timeout / 2, self.__expire_links)
+
+    def __drop_remote_link(self, link):
+        del self.__remote_links[link]
+        self.__append('link_down', link=link)
+
+    def __append(self, op, **record):
+        record['op'] = op
+        self.__client.append(record)
+
+    def __received(self, record):
+        # Called on the log reader thread
+        core.callLater(self.__apply, record)
+
+    def __apply(self, record):
+        self.applied += 1
+        toponizer = core.toponizer
+        op = record['op']
+        if op == 'switch_up':
+            toponizer.update_switch(record['dpid'],
+                                    dict((port_no, EthAddr(hw_addr))
+                                         for (port_no, hw_addr)
+                                         in record['ports']))
+        elif op == 'link_up':
+            toponizer.add_link(*record['link'])
+        elif op == 'link_down':
+            toponizer.remove_link(*record['link'])
+        elif op == 'host_join':
+            toponizer.attach_host(EthAddr(record['mac']),
+                                  record['dpid'],
+                                  record['port'])
+        elif op == 'host_move':
+            toponizer.move_host(EthAddr(record['mac']),
+                                record['dpid'],
+                                record['port'])
+        elif op == 'host_leave':
+            toponizer.remove_host(EthAddr(record['mac']))
+        elif op == 'weight':
+            toponizer.set_link_weight(record['dpid'],
+                                      record['port'],
+                                      record['weight'])
+        else:
+            log.warning('Ignoring unknown shard log record {}'.format(op))
+
+    def __going_down(self, event):
+        self.__client.close()
+        if self.__hub is not None:
+            self.__hub.close()
+
+
+def launch(index, count, socket='/tmp/pox-shards.sock', hub=None,
+           link_timeout=10):
+    """
+    Run as shard index of count. The shard with index 0 serves the log
+    unless --hub=False is given, e.g. when the hub runs on its own.
+    """
+    index = int(index)
+    if hub is None:
+        hub = index == 0
+    else:
+        hub = str(hub).lower() in ('true', '1')
+
+    def start():
+        core.registerNew(Shard,
+                         index,
+                         int(count),
+                         socket,
+                         hub=hub,
+                         link_timeout=float(link_timeout))
+
+    core.call_when_ready(start, ['toponizer', 'LoopDiscovery'])
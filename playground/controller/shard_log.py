@@ -0,0 +1,170 @@
+"""
+Ordered log the shards of a sharded controller replicate the topology
+through, over a Unix socket. Records are JSON objects, one per line.
+
+The hub can run inside one of the shards or on its own:
+
+  python -m playground.controller.shard_log /tmp/fabric.sock
+"""
+import errno
+import json
+import logging
+import os
+import select
+import socket
+import sys
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class LogHub(object):
+    """
+    Serves an append only log on a Unix socket. Every record a client
+    sends is appended and passed on to all clients, the sender included,
+    so all of them apply the same records in the same order. A client
+    connecting later gets the whole log first and ends up in the same
+    state as the others.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Encoded lines in log order
+        self.records = []
+        # socket -> bytes received after the last complete line
+        self.__clients = {}
+        self.__server = None
+        self.__stopped = False
+
+    def start(self):
+        self.listen()
+        thread = threading.Thread(target=self.serve_forever,
+                                  name='shard_log')
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def listen(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.__server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__server.bind(self.path)
+        self.__server.listen(64)
+
+    def serve_forever(self):
+        while not self.__stopped:
+            sockets = [self.__server] + self.__clients.keys()
+            try:
+                (readable, _, _) = select.select(sockets, [], [], 0.5)
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            for sock in readable:
+                if sock is self.__server:
+                    self.__accept()
+                else:
+                    self.__receive(sock)
+
+    def close(self):
+        self.__stopped = True
+        for sock in self.__clients.keys():
+            sock.close()
+        self.__clients.clear()
+        if self.__server is not None:
+            self.__server.close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    # private methods
+
+    def __accept(self):
+        (sock, _) = self.__server.accept()
+        if self.records:
+            sock.sendall(''.join(self.records))
+        self.__clients[sock] = ''
+
+    def __receive(self, sock):
+        data = sock.recv(65536)
+        if not data:
+            del self.__clients[sock]
+            sock.close()
+            return
+        lines = (self.__clients[sock] + data).split('\n')
+        self.__clients[sock] = lines.pop()
+        if not lines:
+            return
+        appended = ''.join(line + '\n' for line in lines)
+        self.records.extend(line + '\n' for line in lines)
+        for client in self.__clients.keys():
+            try:
+                client.sendall(appended)
+            except socket.error as e:
+                log.warning('Dropping shard log client: {}'.format(e))
+                del self.__clients[client]
+                client.close()
+
+
+class LogClient(object):
+    """
+    Connection of one shard to a LogHub. deliver(record) is called on the
+    reader thread for every record of the log, in log order, including
+    the ones this client appended.
+    """
+
+    def __init__(self, path, deliver, timeout=10.0):
+        self.path = path
+        self.deliver = deliver
+        # Records delivered so far
+        self.position = 0
+        self.__lock = threading.Lock()
+        self.__sock = LogClient.__connect(path, timeout)
+        thread = threading.Thread(target=self.__read, name='shard_client')
+        thread.daemon = True
+        thread.start()
+
+    def append(self, record):
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self.__lock:
+            self.__sock.sendall(line)
+
+    def close(self):
+        self.__sock.close()
+
+    # private methods
+
+    @staticmethod
+    def __connect(path, timeout):
+        # The hub may still be starting up in another process
+        deadline = time.time() + timeout
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(path)
+                return sock
+            except socket.error:
+                sock.close()
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.05)
+
+    def __read(self):
+        stream = self.__sock.makefile('rb')
+        for line in stream:
+            self.position += 1
+            self.deliver(json.loads(line))
+        log.warning('Shard log {} closed'.format(self.path))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    hub = LogHub(sys.argv[1] if len(sys.argv) > 1 else 'shard.sock')
+    hub.listen()
+    log.info('Serving the shard log on {}'.format(hub.path))
+    try:
+        hub.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        hub.close()
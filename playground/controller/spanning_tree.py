@@ -0,0 +1,267 @@
+from collections import deque
+
+
+class TreeDelta(object):
+    """
+    Tree links added to and removed from a spanning tree by one or more
+    updates
+    """
+    def __init__(self, added=None, removed=None):
+        self.added = set(added) if added else set()
+        self.removed = set(removed) if removed else set()
+
+    def __nonzero__(self):
+        return bool(self.added or self.removed)
+
+    __bool__ = __nonzero__
+
+    def __repr__(self):
+        return '<TreeDelta +{} -{}>'.format(sorted(self.added),
+                                             sorted(self.removed))
+
+    def merge(self, other):
+        for key in other.removed:
+            if key in self.added:
+                self.added.discard(key)
+            else:
+                self.removed.add(key)
+        for key in other.added:
+            if key in self.removed:
+                self.removed.discard(key)
+            else:
+                self.added.add(key)
+        return self
+
+
+class SpanningTree(object):
+    """
+    Minimum spanning forest that is maintained link by link.
+
+    Adding a link costs a path search in the tree and at most one
+    replacement. Removing a tree link searches the smaller of the two
+    resulting components for the cheapest reconnecting link. Removing a
+    non-tree link does not touch the tree. Every update returns the
+    TreeDelta it caused.
+    """
+
+    def __init__(self):
+        # key -> (node1, node2, weight)
+        self.__links = {}
+        # node -> set of keys of all incident links
+        self.__incident = {}
+        # node -> {key: neighbour} for tree links only
+        self.__tree = {}
+        self.__tree_links = set()
+        # tree link key -> key of the cheapest link reconnecting the tree
+        # without it, None until computed for the current links
+        self.__replacements = None
+
+    def __contains__(self, key):
+        return key in self.__links
+
+    def __len__(self):
+        return len(self.__links)
+
+    def link(self, key):
+        return self.__links[key]
+
+    def links(self):
+        return self.__links.iterkeys()
+
+    def tree_links(self):
+        return iter(self.__tree_links)
+
+    def is_tree_link(self, key):
+        return key in self.__tree_links
+
+    def replacements(self):
+        """
+        Replacement link for every tree link that has one. Computed once
+        for all tree links and kept until the next update, so a failing
+        tree link is replaced without a search.
+        """
+        if self.__replacements is None:
+            self.__replacements = self.__compute_replacements()
+        return self.__replacements
+
+    def add_link(self, key, node1, node2, weight=1):
+        self.__replacements = None
+        delta = TreeDelta()
+        if key in self.__links:
+            if self.__links[key] == (node1, node2, weight):
+                return delta
+            delta.merge(self.remove_link(key))
+        self.__links[key] = (node1, node2, weight)
+        self.__incident.setdefault(node1, set()).add(key)
+        self.__incident.setdefault(node2, set()).add(key)
+        if node1 == node2:
+            return delta
+
+        path = self.__tree_path(node1, node2)
+        if path is None:
+            self.__attach(key)
+            return delta.merge(TreeDelta(added=[key]))
+        heaviest = max(path, key=lambda k: self.__links[k][2])
+        if self.__links[heaviest][2] > weight:
+            self.__detach(heaviest)
+            self.__attach(key)
+            delta.merge(TreeDelta(added=[key], removed=[heaviest]))
+        return delta
+
+    def remove_link(self, key):
+        delta = TreeDelta()
+        if key not in self.__links:
+            return delta
+        (node1, node2, _) = self.__links[key]
+        in_tree = key in self.__tree_links
+        replacements = self.__replacements
+        self.__replacements = None
+        if in_tree:
+            self.__detach(key)
+        del self.__links[key]
+        for node in (node1, node2):
+            incident = self.__incident.get(node)
+            if incident is not None:
+                incident.discard(key)
+                if not incident:
+                    del self.__incident[node]
+        if not in_tree:
+            return delta
+
+        delta.removed.add(key)
+        if replacements is not None:
+            replacement = replacements.get(key)
+        else:
+            replacement = self.__replacement_link(
+                self.__smaller_component(node1, node2))
+        if replacement is not None:
+            self.__attach(replacement)
+            delta.added.add(replacement)
+        return delta
+
+    def remove_node(self, node):
+        delta = TreeDelta()
+        incident = self.__incident.get(node, ())
+        # Drop non-tree links first so none of them is picked as a
+        # replacement for the tree links of the same node.
+        keys = sorted(incident, key=self.is_tree_link)
+        for key in keys:
+            delta.merge(self.remove_link(key))
+        self.__tree.pop(node, None)
+        return delta
+
+    # private methods
+
+    def __attach(self, key):
+        (node1, node2, _) = self.__links[key]
+        self.__tree.setdefault(node1, {})[key] = node2
+        self.__tree.setdefault(node2, {})[key] = node1
+        self.__tree_links.add(key)
+
+    def __detach(self, key):
+        (node1, node2, _) = self.__links[key]
+        for node in (node1, node2):
+            neighbours = self.__tree.get(node)
+            if neighbours is not None:
+                neighbours.pop(key, None)
+                if not neighbours:
+                    del self.__tree[node]
+        self.__tree_links.discard(key)
+
+    def __tree_path(self, source, target):
+        if source not in self.__tree or target not in self.__tree:
+            return None
+        parents = {source: None}
+        queue = deque([source])
+        while queue:
+            node = queue.popleft()
+            if node == target:
+                path = []
+                while parents[node] is not None:
+                    (node, key) = parents[node]
+                    path.append(key)
+                return path
+            for (key, neighbour) in self.__tree[node].iteritems():
+                if neighbour not in parents:
+                    parents[neighbour] = (node, key)
+                    queue.append(neighbour)
+        return None
+
+    def __smaller_component(self, node1, node2):
+        # Grow both sides in lockstep, the first one to run out of nodes
+        # is the smaller component.
+        searches = [(set([node1]), deque([node1])),
+                    (set([node2]), deque([node2]))]
+        while True:
+            for (seen, queue) in searches:
+                if not queue:
+                    return seen
+                node = queue.popleft()
+                for neighbour in self.__tree.get(node, {}).itervalues():
+                    if neighbour not in seen:
+                        seen.add(neighbour)
+                        queue.append(neighbour)
+
+    def __compute_replacements(self):
+        # Root every tree, then let the non-tree links claim the tree
+        # links on their tree path, cheapest first. Claimed tree links are
+        # skipped by jumping to the nearest unclaimed ancestor.
+        parents = {}
+        depths = {}
+        for root in self.__tree:
+            if root in depths:
+                continue
+            parents[root] = None
+            depths[root] = 0
+            queue = deque([root])
+            while queue:
+                node = queue.popleft()
+                for (key, neighbour) in self.__tree[node].iteritems():
+                    if neighbour not in depths:
+                        parents[neighbour] = (node, key)
+                        depths[neighbour] = depths[node] + 1
+                        queue.append(neighbour)
+        jumps = {}
+
+        def unclaimed(node):
+            top = node
+            while jumps.get(top, top) != top:
+                top = jumps[top]
+            while node != top:
+                following = jumps[node]
+                jumps[node] = top
+                node = following
+            return top
+
+        replacements = {}
+        candidates = sorted((weight, key)
+                            for (key, (node1, node2, weight))
+                            in self.__links.iteritems()
+                            if key not in self.__tree_links
+                            and node1 != node2
+                            and node1 in depths and node2 in depths)
+        for (_, key) in candidates:
+            (node1, node2, _) = self.__links[key]
+            node1 = unclaimed(node1)
+            node2 = unclaimed(node2)
+            while node1 != node2:
+                if depths[node1] < depths[node2]:
+                    (node1, node2) = (node2, node1)
+                (parent, tree_key) = parents[node1]
+                replacements[tree_key] = key
+                jumps[node1] = parent
+                node1 = unclaimed(parent)
+        return replacements
+
+    def __replacement_link(self, component):
+        best = None
+        for node in component:
+            for key in self.__incident.get(node, ()):
+                if key in self.__tree_links:
+                    continue
+                (node1, node2, weight) = self.__links[key]
+                if (node1 in component) == (node2 in component):
+                    continue
+                if best is None or weight < self.__links[best][2]:
+                    best = key
+        return best
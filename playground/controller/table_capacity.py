@@ -0,0 +1,355 @@
+import time
+from pox.core import core
+import pox.openflow.libopenflow_01 as of
+from playground.controller import metrics
+from playground.controller.flow_table import flow_key
+
+log = core.getLogger()
+
+
+class FlowCounters(object):
+    """
+    Counters of one flow from the last flow stats reply
+    """
+
+    __slots__ = ('match', 'priority', 'packets', 'bytes', 'active_at',
+                 'timed')
+
+    def __init__(self, match, priority, packets, bytes, active_at, timed):
+        self.match = match
+        self.priority = priority
+        self.packets = packets
+        self.bytes = bytes
+        # last time the packet count was seen growing
+        self.active_at = active_at
+        # has an idle or hard timeout, so it was installed reactively
+        self.timed = timed
+
+
+class TableUsage(object):
+    """
+    Flow table occupancy of one switch. Seeded from table stats replies
+    and moved along with every install and removal the controller knows
+    about until the next reply.
+    """
+
+    def __init__(self, dpid):
+        self.dpid = dpid
+        # max_entries summed over all tables, None until the first reply
+        self.capacity = None
+        self.active = 0
+        self.seeded_at = None
+        # flow_key -> FlowCounters
+        self.counters = {}
+        # flow_keys deleted to make room whose FlowRemoved may still come,
+        # they were counted as removed already
+        self.evicted = set()
+        # whether the occupancy is above the warning threshold
+        self.warned = False
+
+    @property
+    def fill(self):
+        if not self.capacity:
+            return None
+        return float(self.active) / self.capacity
+
+    def seed(self, capacity, active, now):
+        self.capacity = capacity or None
+        self.active = active
+        self.seeded_at = now
+        # The switch answers in order, so the FlowRemoved of every flow
+        # deleted before the reply came in ahead of it
+        self.evicted.clear()
+
+    def installed(self, n=1):
+        self.active += n
+
+    def removed(self, n=1):
+        self.active = max(0, self.active - n)
+
+    def room(self, high_water):
+        """
+        Entries that can still be added below high_water, None if the
+        capacity is unknown
+        """
+        if not self.capacity:
+            return None
+        return int(self.capacity * high_water) - self.active
+
+    def sample(self, stats, now):
+        counters = {}
+        for flow in stats:
+            key = flow_key(flow.match, flow.priority)
+            previous = self.counters.get(key)
+            active_at = now
+            if previous is not None and previous.packets == flow.packet_count:
+                active_at = previous.active_at
+            counters[key] = FlowCounters(flow.match,
+                                         flow.priority,
+                                         flow.packet_count,
+                                         flow.byte_count,
+                                         active_at,
+                                         bool(flow.idle_timeout
+                                              or flow.hard_timeout))
+        self.counters = counters
+
+
+class TableCapacity(object):
+    """
+    Keeps track of how full every switch's flow table is and stops the
+    controller from installing flows past high_water of the capacity.
+
+    Proactive installers pass the flows they want through admit(), which
+    cuts them down with the configured policy once a switch runs out of
+    room:
+
+      evict       keep the flows that carried packets most recently
+      aggregate   drop the refinements above the default priority first
+                  (ARP punts) and let the coarser per destination flows
+                  carry their traffic
+      prioritize  keep the flows that carried the most bytes
+
+    Reactive installers ask has_room() first and make_room() if there is
+    none. With the evict policy the longest idle flows that have timeouts
+    are deleted to make room.
+
+    Occupancy above warn is logged and counted before the table
+    overflows, and flow counters are polled from those switches so the
+    policies have traffic to go by.
+    """
+
+    _core_name = 'table_capacity'
+
+    POLICIES = ('evict', 'aggregate', 'prioritize')
+
+    def __init__(self,
+                 policy='evict',
+                 interval=10.0,
+                 warn=0.8,
+                 high_water=0.95,
+                 low_water=0.85):
+        if policy not in TableCapacity.POLICIES:
+            raise ValueError('Unknown table policy {}'.format(policy))
+        self.policy = policy
+        self.interval = interval
+        self.warn = warn
+        self.high_water = high_water
+        # evict down to this fill
+        self.low_water = low_water
+        # dpid -> TableUsage
+        self.tables = {}
+        core.openflow.addListeners(self)
+        if interval > 0:
+            core.callDelayed(interval, self.__poll)
+
+    def usage(self, dpid):
+        usage = self.tables.get(dpid)
+        if usage is None:
+            usage = self.tables[dpid] = TableUsage(dpid)
+        return usage
+
+    def installed(self, dpid, n=1):
+        usage = self.usage(dpid)
+        usage.installed(n)
+        self.__check(usage)
+
+    def removed(self, dpid, n=1):
+        self.usage(dpid).removed(n)
+
+    def track(self, dpid, flow_mods):
+        """
+        Account for flow_mods sent to dpid
+        """
+        added = 0
+        deleted = 0
+        for flow_mod in flow_mods:
+            if flow_mod.command == of.OFPFC_ADD:
+                added += 1
+            elif flow_mod.command == of.OFPFC_DELETE_STRICT:
+                deleted += 1
+        if deleted:
+            self.removed(dpid, deleted)
+        if added:
+            self.installed(dpid, added)
+
+    def has_room(self, dpid, n=1):
+        room = self.usage(dpid).room(self.high_water)
+        return room is None or room >= n
+
+    def make_room(self, dpid, n=1):
+        """
+        Evict idle flows from dpid if the policy allows until n more fit,
+        returns whether they do
+        """
+        usage = self.usage(dpid)
+        if self.policy == 'evict' and not self.has_room(dpid, n):
+            self.__evict(usage)
+        if self.has_room(dpid, n):
+            return True
+        metrics.count('table_refused', dpid, n)
+        return False
+
+    def admit(self, dpid, desired, installed=0):
+        """
+        The flows of desired, a {flow_key: FlowEntry} dictionary, that
+        fit on switch dpid, given that installed of them are on it
+        already. Returns desired itself if all of them fit.
+        """
+        usage = self.usage(dpid)
+        room = usage.room(self.high_water)
+        if room is None:
+            return desired
+        limit = max(0, room + installed)
+        if len(desired) <= limit:
+            return desired
+        log.info('<s{}> has room for {} of {} flows, applying {} policy'
+                 .format(dpid, limit, len(desired), self.policy))
+        metrics.count('table_refused', dpid, len(desired) - limit)
+        flows = desired.values()
+        if self.policy == 'aggregate':
+            coarse = [flow for flow in flows
+                      if flow.priority <= of.OFP_DEFAULT_PRIORITY]
+            if len(coarse) <= limit:
+                # Fill the remaining room with refinements by traffic
+                rest = sorted((flow for flow in flows
+                               if flow.priority > of.OFP_DEFAULT_PRIORITY),
+                              key=lambda flow: self.__bytes(usage, flow),
+                              reverse=True)
+                flows = coarse + rest[:limit - len(coarse)]
+            else:
+                flows = self.__by_bytes(usage, coarse)[:limit]
+        elif self.policy == 'prioritize':
+            flows = self.__by_bytes(usage, flows)[:limit]
+        else:
+            now = time.time()
+            flows = sorted(flows,
+                           key=lambda flow: self.__active_at(usage,
+                                                             flow,
+                                                             now),
+                           reverse=True)[:limit]
+        return dict((flow.key, flow) for flow in flows)
+
+    def snapshot(self):
+        return dict((dpid, {'active': usage.active,
+                            'capacity': usage.capacity,
+                            'fill': usage.fill})
+                    for (dpid, usage) in self.tables.iteritems())
+
+    # event handlers
+
+    def _handle_ConnectionUp(self, event):
+        self.tables[event.dpid] = TableUsage(event.dpid)
+        TableCapacity.__request_table_stats(event.connection)
+
+    def _handle_ConnectionDown(self, event):
+        self.tables.pop(event.dpid, None)
+
+    def _handle_TableStatsReceived(self, event):
+        usage = self.usage(event.connection.dpid)
+        usage.seed(sum(table.max_entries for table in event.stats),
+                   sum(table.active_count for table in event.stats),
+                   time.time())
+        self.__check(usage)
+
+    def _handle_FlowStatsReceived(self, event):
+        self.usage(event.connection.dpid).sample(event.stats, time.time())
+
+    def _handle_FlowRemoved(self, event):
+        usage = self.usage(event.connection.dpid)
+        key = flow_key(event.ofp.match, event.ofp.priority)
+        if key in usage.evicted:
+            usage.evicted.discard(key)
+        else:
+            usage.removed()
+        usage.counters.pop(key, None)
+
+    def _handle_ErrorIn(self, event):
+        if (event.ofp.type == of.OFPET_FLOW_MOD_FAILED
+                and event.ofp.code == of.OFPFMFC_ALL_TABLES_FULL):
+            log.error('<s{}> rejected a flow, its table is full'
+                      .format(event.connection.dpid))
+            metrics.count('table_full', event.connection.dpid)
+            TableCapacity.__request_table_stats(event.connection)
+
+    # private methods
+
+    def __poll(self):
+        for connection in core.openflow.connections.values():
+            TableCapacity.__request_table_stats(connection)
+            usage = self.tables.get(connection.dpid)
+            if (usage is not None
+                    and usage.fill is not None
+                    and usage.fill >= self.warn):
+                connection.send(of.ofp_stats_request(
+                    body=of.ofp_flow_stats_request()))
+        core.callDelayed(self.interval, self.__poll)
+
+    def __check(self, usage):
+        fill = usage.fill
+        if fill is None:
+            return
+        if fill >= self.warn and not usage.warned:
+            usage.warned = True
+            log.warning('<s{}> flow table {:.0%} full ({} of {})'
+                        .format(usage.dpid, fill, usage.active,
+                                usage.capacity))
+            metrics.count('table_warning', usage.dpid)
+        elif fill < self.warn - 0.05 and usage.warned:
+            usage.warned = False
+            log.info('<s{}> flow table back at {:.0%}'
+                     .format(usage.dpid, fill))
+
+    def __evict(self, usage):
+        connection = core.openflow.getConnection(usage.dpid)
+        if connection is None:
+            return
+        excess = usage.active - int(usage.capacity * self.low_water)
+        idle = sorted((counters.active_at, key)
+                      for (key, counters) in usage.counters.iteritems()
+                      if counters.timed)[:max(0, excess)]
+        for (_, key) in idle:
+            counters = usage.counters.pop(key)
+            usage.evicted.add(key)
+            connection.send(of.ofp_flow_mod(command=of.OFPFC_DELETE_STRICT,
+                                            match=counters.match,
+                                            priority=counters.priority))
+        if idle:
+            log.info('<s{}> evicted {} idle flows'
+                     .format(usage.dpid, len(idle)))
+            usage.removed(len(idle))
+            metrics.count('table_evicted', usage.dpid, len(idle))
+
+    def __by_bytes(self, usage, flows):
+        return sorted(flows,
+                      key=lambda flow: (self.__bytes(usage, flow),
+                                        -flow.priority),
+                      reverse=True)
+
+    @staticmethod
+    def __bytes(usage, flow):
+        counters = usage.counters.get(flow.key)
+        return counters.bytes if counters else 0
+
+    @staticmethod
+    def __active_at(usage, flow, now):
+        # Flows not installed yet count as active, they were just wanted
+        counters = usage.counters.get(flow.key)
+        return counters.active_at if counters else now
+
+    @staticmethod
+    def __request_table_stats(connection):
+        connection.send(of.ofp_stats_request(
+            body=of.ofp_table_stats_request()))
+
+
+def launch(policy='evict',
+           interval=10,
+           warn=0.8,
+           high_water=0.95,
+           low_water=0.85):
+    core.registerNew(TableCapacity,
+                     policy=policy,
+                     interval=float(interval),
+                     warn=float(warn),
+                     high_water=float(high_water),
+                     low_water=float(low_water))
@@ -1,4 +1,5 @@
-import uuid
+import itertools
+import time
 from pox.core import core
 from pox.lib.revent import *
 import pox.openflow.discovery
@@ -6,7 +7,10 @@ from pox.openflow.discovery import Discovery
 import pox.host_tracker
 from pox.lib.packet.ethernet import ethernet
 from pox.lib.addresses import EthAddr
-import networkx as nx
+from playground.controller import metrics
+from playground.controller.graph import Node, TopologyGraph
+from playground.controller.routing import RoutingEngine
+from playground.controller.spanning_tree import SpanningTree, TreeDelta
 
 log = core.getLogger()
 
@@ -15,69 +19,371 @@ class TopoUpdate (Event):
   """
   Topology events
   """
-  def __init__ (self, mst, topo):
+  def __init__ (self, mst, topo, mst_changes=None, tree_ports=None,
+                changes=None):
     Event.__init__(self)
+    # SpanningTree over the node ids of topo
     self.mst = mst
+    # TopologyGraph
     self.topo = topo
+    # TopoChanges folded into this update
+    self.changes = changes if changes else TopoChanges()
+    # Correlates the update with the messages sent for it
+    self.trace_id = self.changes.trace_id
+    # dpid -> set of the port numbers that are part of the spanning tree
+    self.tree_ports = tree_ports if tree_ports is not None else {}
+    # TreeDelta of the link keys that entered or left the spanning tree
+    self.mst_changes = mst_changes if mst_changes else TreeDelta()
+
+class LinkFailure (Event):
+  """
+  Raised as soon as the link from port1 on dpid1 to port2 on dpid2 is
+  gone, ahead of the TopoUpdate covering it. The spanning tree and
+  tree_ports already include the replacement link.
+  """
+  def __init__ (self, dpid1, port1, dpid2, port2, tree_ports=None):
+    Event.__init__(self)
+    self.dpid1 = dpid1
+    self.port1 = port1
+    self.dpid2 = dpid2
+    self.port2 = port2
+    self.tree_ports = tree_ports if tree_ports is not None else {}
+
+class TopoChanges(object):
+    """
+    Topology mutations collected between two TopoUpdates. Links are
+    (dpid1, port1, dpid2, port2) tuples, hosts (macaddr, dpid, port).
+    A mutation followed by its inverse cancels out. Weight changes map
+    the (dpid, port) a link leaves from to its new weight.
+    """
+    def __init__(self):
+        self.links_added = set()
+        self.links_removed = set()
+        self.hosts_added = set()
+        self.hosts_removed = set()
+        self.weights_changed = {}
+        # time of the first mutation
+        self.since = None
+        # id following the changes to the switches, set on first mutation
+        self.trace_id = None
+
+    def __nonzero__(self):
+        return bool(self.links_added or self.links_removed
+                    or self.hosts_added or self.hosts_removed
+                    or self.weights_changed)
+
+    __bool__ = __nonzero__
+
+    def __repr__(self):
+        return ('<TopoChanges {} links +{} -{} hosts +{} -{} weights {}>'
+                .format(self.trace_id,
+                        len(self.links_added),
+                        len(self.links_removed),
+                        len(self.hosts_added),
+                        len(self.hosts_removed),
+                        len(self.weights_changed)))
+
+    def link_added(self, link):
+        TopoChanges.__toggle(self.links_added, self.links_removed, link)
+
+    def link_removed(self, link):
+        TopoChanges.__toggle(self.links_removed, self.links_added, link)
+
+    def host_added(self, host):
+        TopoChanges.__toggle(self.hosts_added, self.hosts_removed, host)
+
+    def host_removed(self, host):
+        TopoChanges.__toggle(self.hosts_removed, self.hosts_added, host)
+
+    def weight_changed(self, dpid, port, weight):
+        self.weights_changed[(dpid, port)] = weight
+
+    @staticmethod
+    def __toggle(changes, inverse_changes, item):
+        if item in inverse_changes:
+            inverse_changes.discard(item)
+        else:
+            changes.add(item)
+
 
 class Toponizer(EventMixin):
 
     _core_name = 'toponizer'
     _eventMixin_events = set([
         TopoUpdate,
+        LinkFailure,
     ])
 
     @staticmethod
-    def assign_node_id():
-        return str(uuid.uuid1())
+    def switch_ports(connection):
+        # Only what port_mods need, not the whole ofp_phy_port
+        return dict((port.port_no, port.hw_addr)
+                    for (_, port) in connection.ports.iteritems())
 
-    def __init__(self):
-        self.topo = nx.MultiDiGraph()
-        self.mst = None
-        core.openflow.addListeners(self)
-        core.openflow_discovery.addListeners(self)
-        core.host_tracker.addListeners(self)
+    @staticmethod
+    def link_key(topo_id1, port1, topo_id2, port2):
+        """
+        Direction independent key of the link between two node ports
+        """
+        return tuple(sorted([(topo_id1, port1), (topo_id2, port2)]))
+
+    def __init__(self, quiet_period=0.1, max_delay=1.0):
+        # A TopoUpdate is raised once no mutation arrived for quiet_period
+        # seconds, but at the latest max_delay seconds after the first one
+        self.quiet_period = quiet_period
+        self.max_delay = max_delay
+        self.__changes = TopoChanges()
+        self.__last_change = None
+        self.__flush_timer = None
+        self.__trace_ids = itertools.count(1)
+        self.topo = TopologyGraph()
+        # Undirected spanning tree over the links present in both
+        # directions, keyed by Toponizer.link_key
+        self.mst = SpanningTree()
+        self.__mst_changes = TreeDelta()
+        # dpid -> set of the switch ports on links of the spanning tree
+        self.tree_ports = {}
+        self.routing = RoutingEngine(self.topo)
+        # (dpid, port) -> weight of the links leaving that port, set by
+        # set_link_weight and kept for links that are discovered later
+        self.__link_weights = {}
+        # Lookup indexes of the Nodes in self.topo
+        self.__switches_by_dpid = {}
+        self.__hosts_by_macaddr = {}
+        # (event source, listener ids) until detach()
+        self.__sources = [(source, source.addListeners(self))
+                          for source in (core.openflow,
+                                         core.openflow_discovery,
+                                         core.host_tracker)]
+
+    def detach(self):
+        """
+        Stop following the local OpenFlow, discovery and host tracker
+        events. The topology then only changes through the public
+        methods, e.g. when it is replicated from elsewhere.
+        """
+        for (source, listeners) in self.__sources:
+            source.removeListeners(listeners)
+        self.__sources = []
 
     def add_host(self, entry):
-        self.topo.add_node(Toponizer.assign_node_id(),
-                           type='host',
-                           macaddr=entry.macaddr)
-
-    def add_switch(self, connection, graph=None):
-        graph = graph if graph else self.topo
-        graph.add_node(Toponizer.assign_node_id(),
-                       type='switch',
-                       ports=connection.ports,
-                       dpid=connection.dpid,
-                       features=connection.features)
-
-    def switches(self, graph=None):
-        graph = graph if graph else self.topo.nodes(data=True)
-        return self.__filter_by_attribute('type', 'switch', filter_list=graph)
-
-    def hosts(self, graph=None):
-        graph = graph if graph else self.topo.nodes(data=True)
-        return self.__filter_by_attribute('type', 'host', filter_list=graph)
-
-    def links(self, graph=None):
-        graph = graph if graph else self.topo
-        links = graph.edges(data=True)
-        return links
+        return self.__add_host(entry.macaddr)
+
+    def add_switch(self, connection):
+        return self.update_switch(connection.dpid,
+                                  Toponizer.switch_ports(connection))
+
+    def update_switch(self, dpid, ports):
+        """
+        Add switch dpid with ports, {port_no: hw_addr}, or refresh the
+        ports of a known one and keep its links
+        """
+        switch = self.get_switch_by_dpid(dpid)
+        if switch:
+            switch.ports = ports
+            return switch
+        switch = self.topo.add_node(Node.SWITCH, dpid=dpid, ports=ports)
+        self.__switches_by_dpid[dpid] = switch
+        return switch
+
+    def remove_host(self, macaddr):
+        host = self.__hosts_by_macaddr.pop(macaddr, None)
+        if host:
+            for link in self.topo.out_links(host.id):
+                dpid = self.topo.node(link.target).dpid
+                self.__changes.host_removed((macaddr, dpid, link.port2))
+            self.__remove_node(host)
+        return host
+
+    def remove_switch(self, dpid):
+        switch = self.__switches_by_dpid.pop(dpid, None)
+        if switch:
+            self.tree_ports.pop(dpid, None)
+            self.__remove_node(switch)
+        return switch
+
+    def set_link_weight(self, dpid, port, weight):
+        """
+        Routing cost of the links leaving switch dpid on port. The
+        spanning tree used for flooding keeps its hop count weights.
+        """
+        if self.__link_weights.get((dpid, port), 1) == weight:
+            return
+        self.__link_weights[(dpid, port)] = weight
+        switch = self.get_switch_by_dpid(dpid)
+        if switch is None:
+            return
+        changed = False
+        for link in self.topo.out_links(switch.id):
+            if link.port1 == port and link.weight != weight:
+                self.topo.set_weight(link.id, weight)
+                self.routing.edge_weight_changed(link.source,
+                                                 link.target,
+                                                 port,
+                                                 weight)
+                changed = True
+        if changed:
+            self.__changes.weight_changed(dpid, port, weight)
+            self.__topology_changed()
+
+    def attach_host(self, macaddr, dpid, port):
+        """
+        Attach host macaddr to port on switch dpid, besides the switches
+        it is attached to already
+        """
+        if self.get_switch_by_dpid(dpid) is None:
+            return False
+        if not self.get_host_by_macaddr(macaddr):
+            log.debug("Adding host <{}> to topology".format(macaddr))
+            self.__add_host(macaddr)
+        if self.__is_host_connected_to_switch(macaddr, dpid):
+            return False
+        log.debug('Adding links between host <{}>'
+                  'and switch <s{}:p{}> to topology'
+                  .format(macaddr, dpid, port))
+        self.__add_switch_to_host_connection(dpid, port, macaddr)
+        self.__topology_changed()
+        return True
+
+    def move_host(self, macaddr, dpid, port):
+        """
+        Attach host macaddr to port on switch dpid instead of wherever it
+        was attached before
+        """
+        if self.get_switch_by_dpid(dpid) is None:
+            return False
+        host = self.get_host_by_macaddr(macaddr) or self.__add_host(macaddr)
+        for link in self.topo.out_links(host.id):
+            self.__remove_switch_to_host_connection(host, link)
+        self.__add_switch_to_host_connection(dpid, port, macaddr)
+        self.__topology_changed()
+        return True
+
+    def add_link(self, dpid1, port1, dpid2, port2):
+        """
+        Add the link from port1 on dpid1 to port2 on dpid2
+        """
+        if not self.__add_switch_to_switch_connection(dpid1,
+                                                      dpid2,
+                                                      port1,
+                                                      port2):
+            return False
+        self.__topology_changed()
+        return True
+
+    def remove_link(self, dpid1, port1, dpid2, port2):
+        """
+        Drop the link from port1 on dpid1 to port2 on dpid2
+        """
+        if not self.__remove_switch_to_switch_connection(dpid1,
+                                                         dpid2,
+                                                         port1,
+                                                         port2):
+            return False
+        # Let the switches fail over before the full update
+        self.raiseEventNoErrors(LinkFailure,
+                                dpid1,
+                                port1,
+                                dpid2,
+                                port2,
+                                self.tree_ports)
+        self.__topology_changed()
+        return True
+
+    def link_ports(self, dpid):
+        """
+        Ports of switch dpid with a link to another switch
+        """
+        switch = self.get_switch_by_dpid(dpid)
+        if switch is None:
+            return set()
+        return set(link.port1 for link in self.topo.out_links(switch.id)
+                   if link.port2 is not None)
+
+    def export_state(self):
+        """
+        Switches, links, hosts and weight overrides as plain lists for a
+        warm restart. Links of the spanning tree come first, so adding
+        them back in order rebuilds the same tree.
+        """
+        links = []
+        for link in self.topo.links():
+            if link.port1 is None or link.port2 is None:
+                continue
+            key = Toponizer.link_key(link.source, link.port1,
+                                     link.target, link.port2)
+            links.append((not self.mst.is_tree_link(key),
+                          self.topo.node(link.source).dpid,
+                          link.port1,
+                          self.topo.node(link.target).dpid,
+                          link.port2))
+        links.sort()
+        return {
+            'switches': [(switch.dpid,
+                          sorted((port_no, str(hw_addr))
+                                 for (port_no, hw_addr)
+                                 in switch.ports.iteritems()))
+                         for switch in self.switches()],
+            'links': [link[1:] for link in links],
+            'hosts': [(str(host.macaddr),
+                       self.topo.node(link.target).dpid,
+                       link.port2)
+                      for host in self.hosts()
+                      for link in self.topo.out_links(host.id)],
+            'weights': [(dpid, port, weight) for ((dpid, port), weight)
+                        in self.__link_weights.iteritems()],
+        }
+
+    def restore_state(self, state):
+        """
+        Add the switches, links and hosts of an export_state snapshot
+        that are not known yet
+        """
+        for (dpid, ports) in state['switches']:
+            if dpid not in self.__switches_by_dpid:
+                self.__switches_by_dpid[dpid] = self.topo.add_node(
+                    Node.SWITCH,
+                    dpid=dpid,
+                    ports=dict((port_no, EthAddr(hw_addr))
+                               for (port_no, hw_addr) in ports))
+        for (dpid, port, weight) in state['weights']:
+            self.__link_weights.setdefault((dpid, port), weight)
+        for (dpid1, port1, dpid2, port2) in state['links']:
+            self.__add_switch_to_switch_connection(dpid1, dpid2, port1, port2)
+        for (macaddr, dpid, port) in state['hosts']:
+            macaddr = EthAddr(macaddr)
+            if not self.get_host_by_macaddr(macaddr):
+                self.__add_host(macaddr)
+            if (self.get_switch_by_dpid(dpid)
+                    and not self.__is_host_connected_to_switch(macaddr, dpid)):
+                self.__add_switch_to_host_connection(dpid, port, macaddr)
+        self.__topology_changed()
+
+    def switches(self):
+        return self.__switches_by_dpid.values()
+
+    def hosts(self):
+        return self.__hosts_by_macaddr.values()
+
+    def links(self):
+        return self.topo.links()
 
     def get_host_by_macaddr(self, macaddr):
-        hosts = self.hosts()
-        return self.__first_node_by_attribute('macaddr', macaddr, hosts)
+        return self.__hosts_by_macaddr.get(macaddr)
 
     def get_switch_by_dpid(self, dpid):
-        return self.__first_node_by_attribute('dpid', dpid, self.switches())
+        return self.__switches_by_dpid.get(dpid)
 
     # event handlers
 
     def _handle_ConnectionUp(self, event):
         connection = event.connection
         log.debug("Adding Switch <{}> to topology".format(connection.dpid))
+        # On a reconnect the node keeps its links, only the state taken
+        # from the connection is refreshed
         self.add_switch(connection)
 
+    @metrics.timed('LinkEvent')
     def _handle_LinkEvent(self, event):
         if(event.added):
             link = event.link
@@ -86,10 +392,7 @@ class Toponizer(EventMixin):
                               link.port1,
                               link.dpid2,
                               link.port2))
-            self.__add_switch_to_switch_connection(link.dpid1,
-                                                   link.dpid2,
-                                                   link.port1,
-                                                   link.port2)
+            self.add_link(link.dpid1, link.port1, link.dpid2, link.port2)
         elif(event.removed):
             link = event.link
             log.debug('Removing link between <s{}:p{}>'
@@ -98,127 +401,217 @@ class Toponizer(EventMixin):
                               link.port1,
                               link.dpid2,
                               link.port2))
-            self.__remove_switch_to_switch_connection(link.dpid1,
-                                                      link.dpid2,
-                                                      link.port1,
-                                                      link.port2)
+            self.remove_link(link.dpid1, link.port1, link.dpid2, link.port2)
         else:
             log.error('Unknown event on LinkEvent: {}'.format(event))
 
-        log.debug('Updating minimal spanning tree')
-        self.mst = self.__minimal_spanning_tree()
-        self.raiseEventNoErrors(TopoUpdate, self.mst, self.topo)
-
+    @metrics.timed('HostEvent')
     def _handle_HostEvent(self, event):
-        if event.join:
-            # I know, I'm  looping over the same array twice ...
+        if event.leave:
+            log.debug("Removing host <{}> from topology"
+                      .format(event.entry.macaddr))
+            self.remove_host(event.entry.macaddr)
+        elif event.move:
             entry = event.entry
-            if not self.get_host_by_macaddr(entry.macaddr):
-                log.debug("Adding host <{}> to topology".format(entry.macaddr))
-                self.add_host(entry)
-            if not self.__is_host_connected_to_switch(entry.macaddr,
-                                                      entry.dpid):
-                log.debug('Adding links between host <{}>'
-                          'and switch <s{}:p{}> to topology'
-                          .format(entry.macaddr, entry.dpid, entry.port))
-                self.__add_switch_to_host_connection(entry.dpid,
-                                                     entry.port,
-                                                     entry.macaddr)
-        log.debug('Updating minimal spanning tree')
-        self.mst = self.__minimal_spanning_tree()
-        self.raiseEventNoErrors(TopoUpdate, self.mst, self.topo)
+            log.debug('Moving host <{}> from <s{}:p{}> to <s{}:p{}>'
+                      .format(entry.macaddr, entry.dpid, entry.port,
+                              event.new_dpid, event.new_port))
+            self.move_host(entry.macaddr, event.new_dpid, event.new_port)
+        elif event.join:
+            entry = event.entry
+            self.attach_host(entry.macaddr, entry.dpid, entry.port)
+
+    def flush(self):
+        """
+        Raise the pending TopoUpdate right away
+        """
+        if self.__flush_timer is not None:
+            self.__flush_timer.cancel()
+            self.__flush_timer = None
+        (changes, self.__changes) = (self.__changes, TopoChanges())
+        (mst_changes, self.__mst_changes) = (self.__mst_changes, TreeDelta())
+        if not (changes or mst_changes):
+            return
+        log.debug('Raising TopoUpdate for {}'.format(changes))
+        if mst_changes:
+            log.debug('Spanning tree changed: +{} -{} links'
+                      .format(len(mst_changes.added),
+                              len(mst_changes.removed)))
+        self.raiseEventNoErrors(TopoUpdate,
+                                self.mst,
+                                self.topo,
+                                mst_changes,
+                                self.tree_ports,
+                                changes)
+        self.__prepare_replacements()
 
     # private methods
 
+    def __add_host(self, macaddr):
+        host = self.topo.add_node(Node.HOST, macaddr=macaddr)
+        self.__hosts_by_macaddr[macaddr] = host
+        return host
+
     def __add_switch_to_host_connection(self,
                                         dpid,
                                         port,
                                         macaddr,
-                                        weight=1,
-                                        graph=None):
-        (topo_id_s, _) = self.get_switch_by_dpid(dpid)
-        (topo_id_h, _) = self.get_host_by_macaddr(macaddr)
-        graph = graph if graph else self.topo
-        graph.add_edge(topo_id_s,
-                       topo_id_h,
-                       port1=port,
-                       port2=None,
-                       weight=weight)
-        graph.add_edge(topo_id_h,
-                       topo_id_s,
-                       port1=None,
-                       port2=port,
-                       weight=weight)
+                                        weight=1):
+        topo_id_s = self.get_switch_by_dpid(dpid).id
+        topo_id_h = self.get_host_by_macaddr(macaddr).id
+        weight_s = self.__link_weights.get((dpid, port), weight)
+        self.topo.add_link(topo_id_s, topo_id_h, port, None, weight_s)
+        self.topo.add_link(topo_id_h, topo_id_s, None, port, weight)
+        self.__changes.host_added((macaddr, dpid, port))
+        self.routing.edge_added(topo_id_s, topo_id_h, weight_s)
+        self.routing.edge_added(topo_id_h, topo_id_s, weight)
+        self.__add_link_to_spanning_tree(topo_id_s, port,
+                                         topo_id_h, None,
+                                         weight)
+
+    def __remove_switch_to_host_connection(self, host, link):
+        # link leads from the host to the switch
+        switch = self.topo.node(link.target)
+        port = link.port2
+        self.topo.remove_link(link.id)
+        self.routing.edge_removed(host.id, switch.id, None)
+        reverse = self.topo.find_link(switch.id, host.id, port, None)
+        if reverse is not None:
+            self.topo.remove_link(reverse.id)
+            self.routing.edge_removed(switch.id, host.id, port)
+        self.__changes.host_removed((host.macaddr, switch.dpid, port))
+        self.__remove_link_from_spanning_tree(
+            Toponizer.link_key(switch.id, port, host.id, None))
 
     def __add_switch_to_switch_connection(self,
                                           dpid1,
                                           dpid2,
                                           port1,
                                           port2,
-                                          weight=1,
-                                          graph=None):
-        (topo_id_s1, _) = self.get_switch_by_dpid(dpid1)
-        (topo_id_s2, _) = self.get_switch_by_dpid(dpid2)
-        graph = graph if graph else self.topo
-        graph.add_edge(topo_id_s1,
-                       topo_id_s2,
-                       port1=port1,
-                       port2=port2,
-                       weight=weight)
+                                          weight=1):
+        switch1 = self.get_switch_by_dpid(dpid1)
+        switch2 = self.get_switch_by_dpid(dpid2)
+        if switch1 is None or switch2 is None:
+            return False
+        (topo_id_s1, topo_id_s2) = (switch1.id, switch2.id)
+        # Already known, e.g. restored from a snapshot
+        if self.topo.find_link(topo_id_s1, topo_id_s2, port1, port2):
+            return False
+        routing_weight = self.__link_weights.get((dpid1, port1), weight)
+        self.topo.add_link(topo_id_s1,
+                           topo_id_s2,
+                           port1,
+                           port2,
+                           routing_weight)
+        self.__changes.link_added((dpid1, port1, dpid2, port2))
+        self.routing.edge_added(topo_id_s1, topo_id_s2, routing_weight)
+        # Like to_undirected(reciprocal=True), a link only becomes part of
+        # the undirected topology once both directions are known
+        if self.topo.find_link(topo_id_s2, topo_id_s1, port2, port1):
+            self.__add_link_to_spanning_tree(topo_id_s1, port1,
+                                             topo_id_s2, port2,
+                                             weight)
+        return True
 
     def __remove_switch_to_switch_connection(self,
                                              dpid1,
                                              dpid2,
                                              port1,
-                                             port2,
-                                             weight=1,
-                                             graph=None):
-        (topo_id_s1, _) = self.get_switch_by_dpid(dpid1)
-        (topo_id_s2, _) = self.get_switch_by_dpid(dpid2)
-        graph = graph if graph else self.topo
-        graph.remove_edge(topo_id_s1,
-                          topo_id_s2)
-        self.raiseEventNoErrors(TopoUpdate, self.mst, self.topo)
-
-
-    def __filter_by_attribute(self,
-                              attribute,
-                              value,
-                              filter_list=None):
-        filter_list = (filter_list if filter_list
-                       else self.topo.nodes(data=True))
-        return filter(lambda (x, y): y[attribute] == value, filter_list)
-
-    def __first_node_by_attribute(self, attribute, value, nodes=None):
-        nodes = nodes if nodes else self.topo.nodes(data=True)
-        try:
-            node = next((n, attr)
-                        for (n, attr) in nodes
-                        if attribute in attr and attr[attribute] == value)
-        except StopIteration as e:
-            node = None
-        return node
-
-    def __is_host_connected_to_switch(self, macaddr, dpid, graph=None):
-        graph = graph if graph else self.topo
-        (topo_id_h, _) = self.get_host_by_macaddr(macaddr)
-        (topo_id_s, _) = self.get_switch_by_dpid(dpid)
-        return graph.has_edge(topo_id_h, topo_id_s)
-
-    def __minimal_spanning_tree(self):
-        undirected_graph = self.topo.to_undirected(reciprocal=True)
-        # Unfortunatly the theMultiDiGraph.to_undirected selects arbitrary
-        # attributes for the edge. Needs to be corrected manually.
-        # http://networkx.readthedocs.io/en/stable/_modules/networkx/classes/multidigraph.html#MultiDiGraph.to_undirected
-        for (topo_id1, topo_id2) in undirected_graph.edges():
-            links = self.topo[topo_id1][topo_id2]
-            attributes = undirected_graph[topo_id1][topo_id2][0]
-            if 'port1' in attributes:
-                attributes['port1'] = links[0]['port1']
-            if 'port2' in attributes:
-                attributes['port2'] = links[0]['port2']
-        return nx.minimum_spanning_tree(undirected_graph)
-
-
-def launch():
-    core.registerNew(Toponizer)
+                                             port2):
+        switch1 = self.get_switch_by_dpid(dpid1)
+        switch2 = self.get_switch_by_dpid(dpid2)
+        if switch1 is None or switch2 is None:
+            return False
+        (topo_id_s1, topo_id_s2) = (switch1.id, switch2.id)
+        link = self.topo.find_link(topo_id_s1, topo_id_s2, port1, port2)
+        if link is None:
+            log.debug('No link between <s{}:p{}> and <s{}:p{}> to remove'
+                      .format(dpid1, port1, dpid2, port2))
+            return False
+        self.topo.remove_link(link.id)
+        self.__changes.link_removed((dpid1, port1, dpid2, port2))
+        self.routing.edge_removed(topo_id_s1, topo_id_s2, port1)
+        self.__remove_link_from_spanning_tree(
+            Toponizer.link_key(topo_id_s1, port1, topo_id_s2, port2))
+        return True
+
+    def __remove_node(self, node):
+        self.topo.remove_node(node.id)
+        self.routing.node_removed(node.id)
+        self.__remove_node_from_spanning_tree(node.id)
+        self.__topology_changed()
+
+    def __is_host_connected_to_switch(self, macaddr, dpid):
+        topo_id_h = self.get_host_by_macaddr(macaddr).id
+        topo_id_s = self.get_switch_by_dpid(dpid).id
+        return self.topo.has_link(topo_id_h, topo_id_s)
+
+    @metrics.timed('spanning_tree')
+    def __add_link_to_spanning_tree(self,
+                                    topo_id1,
+                                    port1,
+                                    topo_id2,
+                                    port2,
+                                    weight):
+        key = Toponizer.link_key(topo_id1, port1, topo_id2, port2)
+        self.__apply_mst_changes(
+            self.mst.add_link(key, topo_id1, topo_id2, weight))
+
+    @metrics.timed('spanning_tree')
+    def __remove_link_from_spanning_tree(self, key):
+        self.__apply_mst_changes(self.mst.remove_link(key))
+
+    @metrics.timed('spanning_tree')
+    def __remove_node_from_spanning_tree(self, topo_id):
+        self.__apply_mst_changes(self.mst.remove_node(topo_id))
+
+    @metrics.timed('spanning_tree')
+    def __prepare_replacements(self):
+        # Computed while the topology is quiet, so removing a tree link
+        # takes its replacement from the table
+        self.mst.replacements()
+
+    def __apply_mst_changes(self, changes):
+        for key in changes.removed:
+            for (dpid, port) in self.__switch_ports(key):
+                self.tree_ports.get(dpid, set()).discard(port)
+        for key in changes.added:
+            for (dpid, port) in self.__switch_ports(key):
+                self.tree_ports.setdefault(dpid, set()).add(port)
+        self.__mst_changes.merge(changes)
+
+    def __switch_ports(self, key):
+        for (topo_id, port) in key:
+            node = self.topo.node(topo_id)
+            if node is not None and node.type == Node.SWITCH:
+                yield (node.dpid, port)
+
+    def __topology_changed(self):
+        now = time.time()
+        self.__last_change = now
+        if self.__changes.since is None:
+            self.__changes.since = now
+            self.__changes.trace_id = next(self.__trace_ids)
+        if self.quiet_period <= 0:
+            self.flush()
+        elif self.__flush_timer is None:
+            self.__flush_timer = core.callDelayed(self.quiet_period,
+                                                  self.__flush_when_quiet)
+
+    def __flush_when_quiet(self):
+        self.__flush_timer = None
+        if self.__changes.since is None:
+            self.flush()
+            return
+        deadline = min(self.__last_change + self.quiet_period,
+                       self.__changes.since + self.max_delay)
+        delay = deadline - time.time()
+        if delay > 0:
+            self.__flush_timer = core.callDelayed(delay,
+                                                  self.__flush_when_quiet)
+            return
+        self.flush()
+
+
+def launch(quiet_period=0.1, max_delay=1.0):
+    core.registerNew(Toponizer, float(quiet_period), float(max_delay))
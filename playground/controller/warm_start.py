@@ -0,0 +1,198 @@
+import json
+import os
+import time
+import zlib
+from pox.core import core
+import pox.openflow.libopenflow_01 as of
+from playground.controller.flow_table import ShadowFlowTable
+from playground.controller.loop_discovery import LoopDiscovery
+
+log = core.getLogger()
+
+
+class WarmStart(object):
+    """
+    Snapshots the Toponizer topology, its spanning tree and a digest of
+    the flows installed on every switch to a file, and restores them on
+    startup so a controller restart does not cost a flooding blackout.
+
+    Restored switches are checked when they reconnect: restored links on
+    ports that are gone or down are dropped, and the flows they report
+    are compared with the digest. A switch whose flows differ has them
+    all reinstalled. Forwarding resumes from the restored state while
+    LLDP confirms the links. Links still unconfirmed and switches
+    that did not come back after grace seconds are removed.
+    """
+
+    _core_name = 'warm_start'
+
+    # Bumped when the snapshot layout changes, older files are ignored
+    FORMAT = 1
+
+    def __init__(self, path, interval=10.0, grace=30.0, cookie=0):
+        self.path = path
+        self.interval = interval
+        self.grace = grace
+        # Cookie of the flows the digest covers
+        self.cookie = cookie
+        # Switches from the snapshot, until grace is over
+        self.__restored = set()
+        # Links from the snapshot LLDP has not confirmed yet
+        self.__unconfirmed = set()
+        # dpid -> (flow count, digest) from the snapshot
+        self.__flows = {}
+        # dpid -> xid of the flow stats request the digest is checked on
+        self.__requests = {}
+        state = self.load()
+        if state is not None:
+            self.__restore(state)
+        core.openflow.addListeners(self)
+        core.openflow_discovery.addListeners(self)
+        if interval > 0:
+            core.callDelayed(interval, self.__save_periodically)
+        core.addListenerByName('GoingDownEvent', self.__going_down)
+
+    def is_restored(self, dpid):
+        """
+        Whether switch dpid comes from the snapshot and has not been
+        verified against live discovery yet
+        """
+        return dpid in self.__restored
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, 'rb') as f:
+                state = json.loads(zlib.decompress(f.read()))
+        except (IOError, ValueError, zlib.error) as e:
+            log.warning('Ignoring unreadable snapshot {}: {}'
+                        .format(self.path, e))
+            return None
+        if state.get('format') != WarmStart.FORMAT:
+            log.warning('Ignoring snapshot {} of format {}'
+                        .format(self.path, state.get('format')))
+            return None
+        return state
+
+    def save(self):
+        state = core.toponizer.export_state()
+        state['format'] = WarmStart.FORMAT
+        state['saved_at'] = time.time()
+        state['flows'] = [(dpid, len(flow_table), flow_table.digest())
+                          for (dpid, flow_table) in self.__flow_tables()]
+        # Readers never see a half written file
+        temporary = self.path + '.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(zlib.compress(json.dumps(state, separators=(',', ':'))))
+        os.rename(temporary, self.path)
+        return state
+
+    # event handlers
+
+    def _handle_ConnectionUp(self, event):
+        if event.dpid not in self.__restored:
+            return
+        if event.dpid in self.__flows:
+            request = of.ofp_stats_request(body=of.ofp_flow_stats_request())
+            self.__requests[event.dpid] = request.xid
+            event.connection.send(request)
+        ports = event.connection.ports
+        for link in list(self.__unconfirmed):
+            (dpid1, port1, dpid2, port2) = link
+            if dpid1 == event.dpid:
+                port_no = port1
+            elif dpid2 == event.dpid:
+                port_no = port2
+            else:
+                continue
+            if (port_no in ports
+                    and not ports[port_no].state & of.OFPPS_LINK_DOWN):
+                continue
+            log.info('Dropping restored link <s{}:p{}> -> <s{}:p{}>, '
+                     'port {} is gone'.format(dpid1, port1, dpid2, port2,
+                                              port_no))
+            self.__unconfirmed.discard(link)
+            core.toponizer.remove_link(dpid1, port1, dpid2, port2)
+
+    def _handle_ConnectionDown(self, event):
+        self.__requests.pop(event.dpid, None)
+
+    def _handle_FlowStatsReceived(self, event):
+        dpid = event.connection.dpid
+        if self.__requests.get(dpid) != event.ofp[0].xid:
+            return
+        del self.__requests[dpid]
+        expected = self.__flows.pop(dpid, None)
+        if expected is None:
+            return
+        flow_table = ShadowFlowTable(dpid, cookie=self.cookie)
+        flow_table.resync(event.stats)
+        found = (len(flow_table), flow_table.digest())
+        if found == expected:
+            log.info('<s{}> kept its {} flows'.format(dpid, found[0]))
+        else:
+            log.info('<s{}> reports {} flows instead of {}, reinstalling'
+                     .format(dpid, found[0], expected[0]))
+            if core.hasComponent('LoopDiscovery'):
+                core.LoopDiscovery.reinstall(dpid)
+
+    def _handle_LinkEvent(self, event):
+        link = event.link
+        self.__unconfirmed.discard(
+            (link.dpid1, link.port1, link.dpid2, link.port2))
+
+    # private methods
+
+    def __restore(self, state):
+        log.info('Restoring {} switches, {} links and {} hosts from {}, '
+                 'saved {:.0f}s ago'
+                 .format(len(state['switches']), len(state['links']),
+                         len(state['hosts']), self.path,
+                         time.time() - state['saved_at']))
+        core.toponizer.restore_state(state)
+        self.__restored = set(dpid for (dpid, _) in state['switches'])
+        self.__unconfirmed = set(tuple(link) for link in state['links'])
+        self.__flows = dict((dpid, (count, digest))
+                            for (dpid, count, digest) in state['flows'])
+        core.callDelayed(self.grace, self.__expire)
+
+    def __expire(self):
+        toponizer = core.toponizer
+        for (dpid1, port1, dpid2, port2) in self.__unconfirmed:
+            log.info('Dropping restored link <s{}:p{}> -> <s{}:p{}>, '
+                     'not confirmed by discovery'
+                     .format(dpid1, port1, dpid2, port2))
+            toponizer.remove_link(dpid1, port1, dpid2, port2)
+        for dpid in self.__restored:
+            if core.openflow.getConnection(dpid) is None:
+                log.info('Dropping restored switch <s{}>, it did not '
+                         'reconnect'.format(dpid))
+                toponizer.remove_switch(dpid)
+        self.__unconfirmed.clear()
+        self.__restored.clear()
+        self.__flows.clear()
+        self.__requests.clear()
+
+    def __flow_tables(self):
+        if not core.hasComponent('LoopDiscovery'):
+            return []
+        return core.LoopDiscovery.flow_tables.items()
+
+    def __save_periodically(self):
+        self.save()
+        core.callDelayed(self.interval, self.__save_periodically)
+
+    def __going_down(self, event):
+        self.save()
+
+
+def launch(file='topology.snapshot', interval=10, grace=30):
+    def start():
+        core.registerNew(WarmStart,
+                         file,
+                         interval=float(interval),
+                         grace=float(grace),
+                         cookie=LoopDiscovery.FLOW_COOKIE)
+
+    core.call_when_ready(start, ['toponizer'])
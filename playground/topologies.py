@@ -0,0 +1,186 @@
+"""
+Topology generators shared by the Mininet topologies in ring.py and the
+offline benchmarks.
+
+Every generator returns a Topology, which can be written out and read
+back as a plain edge list, so both sides can run on the exact same
+graph:
+
+  $ python -m playground.topologies fattree 8 > fattree8.edges
+"""
+import sys
+
+import networkx as nx
+
+
+class Topology(object):
+    """
+    Switches, hosts and the links between them. Nodes are named like in
+    Mininet, 's1' for switches and 'h1' for hosts, links are (node, node)
+    tuples in the order they are added. Mininet numbers ports in that
+    order too.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.switches = []
+        self.hosts = []
+        self.links = []
+
+    def __repr__(self):
+        return '<Topology {} {} switches, {} hosts, {} links>'.format(
+            self.name, len(self.switches), len(self.hosts), len(self.links))
+
+    def add_switch(self, name=None):
+        name = name if name else 's{}'.format(len(self.switches) + 1)
+        self.switches.append(name)
+        return name
+
+    def add_host(self, switch=None, name=None):
+        name = name if name else 'h{}'.format(len(self.hosts) + 1)
+        self.hosts.append(name)
+        if switch is not None:
+            self.add_link(name, switch)
+        return name
+
+    def add_link(self, node1, node2):
+        self.links.append((node1, node2))
+
+    def edges(self):
+        return list(self.links)
+
+    def edge_list(self):
+        """
+        The links as 'node1 node2' lines. Nodes without links are listed
+        on their own line.
+        """
+        linked = set(node for link in self.links for node in link)
+        lines = ['{} {}'.format(node1, node2)
+                 for (node1, node2) in self.links]
+        lines.extend(node
+                     for node in self.switches + self.hosts
+                     if node not in linked)
+        return '\n'.join(lines) + '\n'
+
+
+def from_edge_list(lines, name='edges'):
+    """
+    Topology from 'node1 node2' lines as written by Topology.edge_list.
+    Nodes starting with 'h' are hosts, all others switches.
+    """
+    topo = Topology(name)
+    known = set()
+
+    def node(name):
+        if name not in known:
+            known.add(name)
+            if name.startswith('h'):
+                topo.add_host(name=name)
+            else:
+                topo.add_switch(name=name)
+        return name
+    for line in lines:
+        line = line.split('#', 1)[0].split()
+        if len(line) == 1:
+            node(line[0])
+        elif len(line) == 2:
+            topo.add_link(node(line[0]), node(line[1]))
+    return topo
+
+
+def ring(n=3, hosts_per_switch=1):
+    """
+    n switches in a circle
+    """
+    topo = Topology('ring')
+    switches = [topo.add_switch() for _ in range(n)]
+    for i in range(n if n > 2 else n - 1):
+        topo.add_link(switches[i], switches[(i + 1) % n])
+    for switch in switches:
+        for _ in range(hosts_per_switch):
+            topo.add_host(switch)
+    return topo
+
+
+def fat_tree(k=4):
+    """
+    k-ary fat-tree: (k/2)^2 core switches and k pods of k/2 aggregation
+    and k/2 edge switches with k/2 hosts each
+    """
+    if k % 2:
+        raise ValueError('fat tree arity has to be even, got {}'.format(k))
+    half = k // 2
+    topo = Topology('fattree')
+    cores = [topo.add_switch() for _ in range(half * half)]
+    for _ in range(k):
+        aggregations = [topo.add_switch() for _ in range(half)]
+        edges = [topo.add_switch() for _ in range(half)]
+        for (i, aggregation) in enumerate(aggregations):
+            for j in range(half):
+                topo.add_link(aggregation, cores[i * half + j])
+            for edge in edges:
+                topo.add_link(edge, aggregation)
+        for edge in edges:
+            for _ in range(half):
+                topo.add_host(edge)
+    return topo
+
+
+def leaf_spine(leaves=4, spines=2, oversubscription=1.0, hosts_per_leaf=None):
+    """
+    Every leaf connected to every spine. Without hosts_per_leaf, each leaf
+    gets oversubscription times as many host ports as it has uplinks.
+    """
+    if hosts_per_leaf is None:
+        hosts_per_leaf = int(round(oversubscription * spines))
+    topo = Topology('leafspine')
+    spine_switches = [topo.add_switch() for _ in range(spines)]
+    for _ in range(leaves):
+        leaf = topo.add_switch()
+        for spine in spine_switches:
+            topo.add_link(leaf, spine)
+        for _ in range(hosts_per_leaf):
+            topo.add_host(leaf)
+    return topo
+
+
+def random_regular(n=10, degree=3, seed=0, hosts_per_switch=1):
+    """
+    Random graph in which every switch has degree neighbours, the same
+    seed always gives the same graph
+    """
+    if n * degree % 2 or degree >= n:
+        raise ValueError('no {}-regular graph with {} nodes'.format(degree, n))
+    graph = nx.random_regular_graph(degree, n, seed=seed)
+    pairs = set(tuple(sorted(edge)) for edge in graph.edges())
+    topo = Topology('random')
+    switches = [topo.add_switch() for _ in range(n)]
+    for (i, j) in sorted(pairs):
+        topo.add_link(switches[i], switches[j])
+    for switch in switches:
+        for _ in range(hosts_per_switch):
+            topo.add_host(switch)
+    return topo
+
+
+topologies = {'ring': ring,
+              'fattree': fat_tree,
+              'leafspine': leaf_spine,
+              'random': random_regular}
+
+
+def numeric(value):
+    for convert in (int, float):
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    return value
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in topologies:
+        sys.exit('usage: python -m playground.topologies {} [args...]'
+                 .format('|'.join(sorted(topologies))))
+    topo = topologies[sys.argv[1]](*[numeric(a) for a in sys.argv[2:]])
+    sys.stdout.write(topo.edge_list())
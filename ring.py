@@ -9,9 +9,14 @@ from mininet.cli import CLI
 from mininet.log import setLogLevel
 
 import os
+import sys
 
 CURRENT_DIR = os.path.dirname(os.path.realpath('__file__'))
 
+# mn --custom does not put this directory on the path
+sys.path.insert(0, CURRENT_DIR)
+from playground import topologies
+
 # http://mininet.org/blog/2013/06/03/automating-controller-startup/
 class LoopController(Controller):
     def __init__(self,
@@ -30,30 +35,62 @@ class LoopController(Controller):
 controllers = { 'loop_controller': LoopController }
 
 
-def create_network(net=Mininet(controller=LoopController)):
-    # Add hosts
-    h1 = net.addHost('h1')
-    h2 = net.addHost('h2')
-    h3 = net.addHost('h3')
+class EdgeListTopo(Topo):
+    """
+    Mininet topology built from a playground.topologies.Topology, so Mininet
+    runs and the offline benchmarks share the same graph
+    """
+    def build(self, topology):
+        for switch in topology.switches:
+            self.addSwitch(switch)
+        for host in topology.hosts:
+            self.addHost(host)
+        for (node1, node2) in topology.edges():
+            self.addLink(node1, node2)
+
+
+def ring_topo(n=3, hosts_per_switch=1):
+    return EdgeListTopo(topologies.ring(n, hosts_per_switch))
+
+
+def fat_tree_topo(k=4):
+    return EdgeListTopo(topologies.fat_tree(k))
+
+
+def leaf_spine_topo(leaves=4, spines=2, oversubscription=1.0):
+    return EdgeListTopo(topologies.leaf_spine(leaves,
+                                              spines,
+                                              oversubscription))
+
+
+def random_topo(n=10, degree=3, seed=0, hosts_per_switch=1):
+    return EdgeListTopo(topologies.random_regular(n,
+                                                  degree,
+                                                  seed,
+                                                  hosts_per_switch))
+
+
+def edge_list_topo(path):
+    with open(path) as f:
+        return EdgeListTopo(topologies.from_edge_list(f))
+
+# --topo ring,100 / fattree,8 / leafspine,16,4,3 / random,200,4,7 / edges,x.edges
+topos = { 'ring': ring_topo,
+          'fattree': fat_tree_topo,
+          'leafspine': leaf_spine_topo,
+          'random': random_topo,
+          'edges': edge_list_topo }
+
+
+def create_network(topo=None, net=None):
+    # The default is the 3 switch triangle with one host per switch
+    topo = topo if topo else ring_topo()
+    net = net if net else Mininet(topo=topo, controller=None)
 
     #Add controller
     #c1 = net.addController('c1', controller=LoopController)
     c1 = net.addController('c1', controller=RemoteController)
 
-    # Add switches
-    s1 = net.addSwitch('s1')
-    s2 = net.addSwitch('s2')
-    s3 = net.addSwitch('s3')
-
-    # Add links
-    net.addLink(s1, s2)
-    net.addLink(s1, s3)
-    net.addLink(s2, s3)
-    net.addLink(h1, s1)
-    #net.addLink(h1, s2)
-    net.addLink(h2, s2)
-    net.addLink(h3, s3)
-
     return net
 
 
@@ -63,7 +100,12 @@ def provision_nodes(net):
 
 if __name__ == '__main__':
     setLogLevel('info')
-    net = create_network()
+    # ./ring.py [name [args...]], e.g. ./ring.py fattree 4
+    topo = None
+    if len(sys.argv) > 1:
+        args = [topologies.numeric(arg) for arg in sys.argv[2:]]
+        topo = topos[sys.argv[1]](*args)
+    net = create_network(topo)
     net.start()
     provision_nodes(net)
     CLI(net)
@@ -0,0 +1,10 @@
+import unittest
+
+try:
+    import pox.lib.revent
+    HAS_POX = True
+except ImportError:
+    HAS_POX = False
+
+# For the test cases that need POX on the path, like the controller
+requires_pox = unittest.skipUnless(HAS_POX, 'POX is not installed')
@@ -0,0 +1,104 @@
+import unittest
+
+from tests import HAS_POX, requires_pox
+
+if HAS_POX:
+    import pox.openflow.libopenflow_01 as of
+    from pox.lib.addresses import EthAddr
+
+    from playground.controller.flow_table import (FlowEntry,
+                                                  FlowPlan,
+                                                  ShadowFlowTable)
+
+COOKIE = 0x10
+
+
+def entry(host, port):
+    return FlowEntry(of.ofp_match(dl_dst=EthAddr('00:00:00:00:00:{:02x}'
+                                                 .format(host))),
+                     [of.ofp_action_output(port=port)],
+                     cookie=COOKIE)
+
+
+def flows(*entries):
+    return dict((flow.key, flow) for flow in entries)
+
+
+@requires_pox
+class ShadowFlowTableTest(unittest.TestCase):
+
+    def test_reconcile_sends_only_changes(self):
+        table = ShadowFlowTable(1, cookie=COOKIE)
+        flow_mods = table.reconcile(flows(entry(1, 1), entry(2, 2)))
+        self.assertEqual([msg.command for msg in flow_mods],
+                         [of.OFPFC_ADD] * 2)
+        self.assertEqual(table.reconcile(flows(entry(1, 1), entry(2, 2))),
+                         [])
+        changes = table.diff(flows(entry(1, 3), entry(3, 1)))
+        self.assertEqual(sorted((command, flow.key)
+                                for (command, flow) in changes),
+                         sorted([(of.OFPFC_MODIFY_STRICT, entry(1, 3).key),
+                                 (of.OFPFC_ADD, entry(3, 1).key),
+                                 (of.OFPFC_DELETE_STRICT, entry(2, 2).key)]))
+        # Deletes go last
+        self.assertEqual(changes[-1][0], of.OFPFC_DELETE_STRICT)
+
+    def test_diff_limited_to_keys(self):
+        table = ShadowFlowTable(1)
+        table.reconcile(flows(entry(1, 1), entry(2, 2)))
+        desired = flows(entry(1, 4), entry(3, 3))
+        changes = table.diff(desired, keys=[entry(2, 2).key])
+        self.assertEqual([(command, flow.key) for (command, flow) in changes],
+                         [(of.OFPFC_DELETE_STRICT, entry(2, 2).key)])
+
+    def test_resync_keeps_own_cookie_only(self):
+        table = ShadowFlowTable(1, cookie=COOKIE)
+        table.reconcile(flows(entry(1, 1)))
+        digest = table.digest()
+        ours = entry(2, 2)
+        theirs = entry(3, 3)
+        stats = [of.ofp_flow_stats(match=flow.match,
+                                   priority=flow.priority,
+                                   cookie=cookie,
+                                   actions=flow.actions)
+                 for (flow, cookie) in ((ours, COOKIE), (theirs, 0))]
+        table.resync(stats)
+        self.assertEqual(list(table), [ours])
+        self.assertNotEqual(table.digest(), digest)
+        table.resync([of.ofp_flow_stats(match=entry(1, 1).match,
+                                        priority=entry(1, 1).priority,
+                                        cookie=COOKIE,
+                                        actions=entry(1, 1).actions)])
+        self.assertEqual(table.digest(), digest)
+
+
+@requires_pox
+class FlowPlanTest(unittest.TestCase):
+
+    def test_update_replaces_destinations(self):
+        plan = FlowPlan()
+        plan.add(1, entry(1, 1), destination='h1')
+        plan.add(1, entry(2, 2), port=2, backup=entry(2, 3),
+                 destination='h2')
+        plan.add(2, entry(2, 1), destination='h2')
+        other = FlowPlan()
+        other.add(1, entry(2, 4), destination='h2')
+        touched = plan.update(other, ['h2'])
+        self.assertEqual(touched, {1: set([entry(2, 2).key]),
+                                   2: set([entry(2, 1).key])})
+        self.assertEqual(plan.flows[1], flows(entry(1, 1), entry(2, 4)))
+        self.assertEqual(plan.flows[2], {})
+        self.assertEqual(plan.backups[(1, 2)], {})
+        self.assertEqual(sorted(plan.destinations()), ['h1', 'h2'])
+
+    def test_fail_over(self):
+        plan = FlowPlan()
+        plan.add(1, entry(1, 2), port=2, backup=entry(1, 3),
+                 destination='h1')
+        self.assertTrue(plan.fail_over(1, 2))
+        self.assertEqual(plan.flows[1], flows(entry(1, 3)))
+        self.assertFalse(plan.fail_over(1, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+
+from playground.controller.labels import LabelAllocator
+
+
+class LabelAllocatorTest(unittest.TestCase):
+
+    def test_label_is_stable(self):
+        labels = LabelAllocator()
+        self.assertEqual(labels.label(10), LabelAllocator.FIRST)
+        self.assertEqual(labels.label(20), LabelAllocator.FIRST + 1)
+        self.assertEqual(labels.label(10), LabelAllocator.FIRST)
+        self.assertEqual(labels.get(30), None)
+
+    def test_released_labels_are_reused(self):
+        labels = LabelAllocator()
+        for dpid in range(1, 4):
+            labels.label(dpid)
+        self.assertEqual(labels.release(2), 2)
+        self.assertNotIn(2, labels)
+        self.assertEqual(labels.label(4), 2)
+
+    def test_runs_out(self):
+        labels = LabelAllocator(first=1, last=2)
+        self.assertEqual([labels.label(dpid) for dpid in range(3)],
+                         [1, 2, None])
+        self.assertEqual(len(labels), 2)
+
+    def test_retain(self):
+        labels = LabelAllocator()
+        for dpid in range(1, 5):
+            labels.label(dpid)
+        labels.retain([2, 4])
+        self.assertEqual(labels.labels(), {2: 2, 4: 4})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import unittest
+
+from tests import HAS_POX, requires_pox
+
+if HAS_POX:
+    from pox.lib.addresses import EthAddr, IPAddr
+    from pox.lib.packet.arp import arp
+    from pox.lib.packet.ethernet import ethernet
+    from pox.lib.packet.ipv4 import ipv4
+    from pox.lib.packet.vlan import vlan
+
+    from playground.controller import packet_headers
+
+    HOST1 = EthAddr('00:00:00:00:00:01')
+    HOST2 = EthAddr('00:00:00:00:00:02')
+    IP1 = IPAddr('10.0.0.1')
+    IP2 = IPAddr('10.0.0.2')
+
+
+def arp_request(vlan_id=None):
+    request = arp(opcode=arp.REQUEST,
+                  hwsrc=HOST1,
+                  hwdst=ethernet.ETHER_ANY,
+                  protosrc=IP1,
+                  protodst=IP2)
+    return frame(request, ethernet.ARP_TYPE, ethernet.ETHER_BROADCAST,
+                 vlan_id)
+
+
+def frame(payload, type, dst, vlan_id=None):
+    packet = ethernet(src=HOST1, dst=dst)
+    if vlan_id is None:
+        packet.type = type
+        packet.set_payload(payload)
+    else:
+        tag = vlan(id=vlan_id, pcp=5, eth_type=type)
+        tag.set_payload(payload)
+        packet.type = ethernet.VLAN_TYPE
+        packet.set_payload(tag)
+    return packet.pack()
+
+
+@requires_pox
+class ParseTest(unittest.TestCase):
+    """
+    parse() against pox.lib.packet on the same frames
+    """
+
+    def assertSameEthernet(self, headers, data):
+        packet = ethernet(data)
+        self.assertEqual(headers.dst, packet.dst.toRaw())
+        self.assertEqual(headers.src, packet.src.toRaw())
+        tag = packet.find('vlan')
+        if tag is None:
+            self.assertEqual(headers.type, packet.type)
+            self.assertIsNone(headers.tci)
+        else:
+            self.assertEqual(headers.type, tag.eth_type)
+            self.assertEqual(headers.tci & 0xfff, tag.id)
+            self.assertEqual(headers.tci >> 13, tag.pcp)
+
+    def assertSameArp(self, headers, data):
+        request = ethernet(data).find('arp')
+        self.assertTrue(headers.is_arp)
+        self.assertEqual(headers.arp_opcode, request.opcode)
+        self.assertEqual(headers.arp_hwsrc, request.hwsrc.toRaw())
+        self.assertEqual(headers.arp_hwdst, request.hwdst.toRaw())
+        self.assertEqual(headers.arp_protosrc, request.protosrc.toRaw())
+        self.assertEqual(headers.arp_protodst, request.protodst.toRaw())
+
+    def test_arp(self):
+        for vlan_id in (None, 42):
+            data = arp_request(vlan_id)
+            headers = packet_headers.parse(data)
+            self.assertSameEthernet(headers, data)
+            self.assertSameArp(headers, data)
+
+    def test_ipv4(self):
+        payload = ipv4(protocol=ipv4.UDP_PROTOCOL, srcip=IP1, dstip=IP2)
+        for vlan_id in (None, 7):
+            data = frame(payload, ethernet.IP_TYPE, HOST2, vlan_id)
+            headers = packet_headers.parse(data)
+            self.assertSameEthernet(headers, data)
+            self.assertFalse(headers.is_arp)
+
+    def test_truncated(self):
+        self.assertIsNone(packet_headers.parse(b'\x00' * 13))
+        data = arp_request(vlan_id=3)
+        self.assertIsNone(packet_headers.parse(data[:16]))
+        # A cut off ARP payload leaves the Ethernet fields
+        headers = packet_headers.parse(arp_request()[:30])
+        self.assertEqual(headers.type, packet_headers.ARP_TYPE)
+        self.assertFalse(headers.is_arp)
+
+    def test_is_multicast(self):
+        self.assertTrue(packet_headers.is_multicast(
+            ethernet.ETHER_BROADCAST.toRaw()))
+        self.assertTrue(packet_headers.is_multicast(
+            EthAddr('01:80:c2:00:00:0e').toRaw()))
+        self.assertFalse(packet_headers.is_multicast(HOST1.toRaw()))
+
+
+@requires_pox
+class ArpReplyTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        for vlan_id in (None, 42):
+            headers = packet_headers.parse(arp_request(vlan_id))
+            packet = ethernet(packet_headers.arp_reply(headers,
+                                                       HOST2.toRaw()))
+            self.assertEqual(packet.src, HOST2)
+            self.assertEqual(packet.dst, HOST1)
+            tag = packet.find('vlan')
+            if vlan_id is None:
+                self.assertIsNone(tag)
+            else:
+                self.assertEqual((tag.id, tag.pcp), (vlan_id, 5))
+            reply = packet.find('arp')
+            self.assertEqual(reply.opcode, arp.REPLY)
+            self.assertEqual(reply.hwsrc, HOST2)
+            self.assertEqual(reply.protosrc, IP2)
+            self.assertEqual(reply.hwdst, HOST1)
+            self.assertEqual(reply.protodst, IP1)
+
+
+if __name__ == '__main__':
+    unittest.main()
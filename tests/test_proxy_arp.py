@@ -0,0 +1,92 @@
+import unittest
+
+from tests import HAS_POX, requires_pox
+
+if HAS_POX:
+    from pox.lib.addresses import EthAddr, IPAddr
+    from pox.lib.packet.arp import arp
+    from pox.lib.packet.ethernet import ethernet
+
+    from playground.controller import packet_headers
+    from playground.controller.proxy_arp import (ArpCache,
+                                                 FloodLimiter,
+                                                 arp_reply)
+
+    HOST1 = EthAddr('00:00:00:00:00:01')
+    HOST2 = EthAddr('00:00:00:00:00:02')
+    IP1 = IPAddr('10.0.0.1')
+    IP2 = IPAddr('10.0.0.2')
+
+
+@requires_pox
+class ArpCacheTest(unittest.TestCase):
+
+    def test_entries_expire_after_ttl(self):
+        cache = ArpCache(ttl=10)
+        cache.learn(IP1, HOST1, now=100)
+        self.assertEqual(cache.lookup(IP1, now=109), HOST1)
+        self.assertIsNone(cache.lookup(IP1, now=110))
+        self.assertEqual(len(cache), 0)
+
+    def test_relearning_extends_ttl(self):
+        cache = ArpCache(ttl=10)
+        cache.learn(IP1, HOST1, now=100)
+        cache.learn(IP2, HOST2, now=105)
+        cache.learn(IP1, HOST1, now=108)
+        self.assertEqual(cache.expire(now=116), 1)
+        self.assertIsNone(cache.lookup(IP2, now=116))
+        self.assertEqual(cache.lookup(IP1, now=116), HOST1)
+
+    def test_forget_macaddr(self):
+        cache = ArpCache()
+        cache.learn(IP1, HOST1, now=0)
+        cache.learn(IP2, HOST1, now=0)
+        cache.forget_macaddr(HOST1)
+        self.assertEqual(len(cache), 0)
+
+
+@requires_pox
+class FloodLimiterTest(unittest.TestCase):
+
+    def test_burst_then_rate(self):
+        limiter = FloodLimiter(rate=2.0, burst=3)
+        self.assertEqual([limiter.allow(HOST1, now=0) for _ in range(4)],
+                         [True, True, True, False])
+        # Other sources have their own bucket
+        self.assertTrue(limiter.allow(HOST2, now=0))
+        self.assertFalse(limiter.allow(HOST1, now=0.4))
+        self.assertTrue(limiter.allow(HOST1, now=0.5))
+        self.assertFalse(limiter.allow(HOST1, now=0.5))
+
+    def test_expire_drops_full_buckets(self):
+        limiter = FloodLimiter(rate=1.0, burst=2)
+        limiter.allow(HOST1, now=0)
+        limiter.allow(HOST1, now=0)
+        limiter.expire(now=1)
+        self.assertFalse(limiter.allow(HOST1, now=1) and
+                         limiter.allow(HOST1, now=1))
+        limiter.expire(now=10)
+        self.assertTrue(limiter.allow(HOST1, now=10))
+        self.assertTrue(limiter.allow(HOST1, now=10))
+
+
+@requires_pox
+class ArpReplyTest(unittest.TestCase):
+
+    def test_matches_header_only_reply(self):
+        request = arp(opcode=arp.REQUEST,
+                      hwsrc=HOST1,
+                      hwdst=ethernet.ETHER_ANY,
+                      protosrc=IP1,
+                      protodst=IP2)
+        packet = ethernet(type=ethernet.ARP_TYPE,
+                          src=HOST1,
+                          dst=ethernet.ETHER_BROADCAST)
+        packet.set_payload(request)
+        headers = packet_headers.parse(packet.pack())
+        self.assertEqual(arp_reply(packet, request, HOST2).pack(),
+                         packet_headers.arp_reply(headers, HOST2.toRaw()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,188 @@
+import heapq
+import random
+import unittest
+
+from playground.controller.graph import Node, TopologyGraph
+from playground.controller.routing import RoutingEngine, shortest_path_tree
+
+
+def distances_to(graph, root):
+    """
+    Cost of the cheapest path from every switch to root, computed from
+    scratch. Hosts never forward traffic.
+    """
+    distances = {root: 0}
+    heap = [(0, root)]
+    done = set()
+    while heap:
+        (distance, topo_id) = heapq.heappop(heap)
+        if topo_id in done:
+            continue
+        done.add(topo_id)
+        for link in graph.in_links(topo_id):
+            if graph.node(link.source).is_host:
+                continue
+            candidate = distance + link.weight
+            if candidate < distances.get(link.source, candidate + 1):
+                distances[link.source] = candidate
+                heapq.heappush(heap, (candidate, link.source))
+    return distances
+
+
+class Fabric(object):
+    """
+    Switches and hosts in a TopologyGraph, with the RoutingEngine told
+    about every change the way Toponizer does
+    """
+
+    def __init__(self, switches):
+        self.graph = TopologyGraph()
+        self.routing = RoutingEngine(self.graph)
+        self.switches = [self.graph.add_node(Node.SWITCH, dpid=dpid).id
+                         for dpid in range(1, switches + 1)]
+        self.hosts = []
+        self.ports = dict((topo_id, 0) for topo_id in self.switches)
+
+    def add_link(self, topo_id1, topo_id2, weight):
+        (port1, port2) = (self.__port(topo_id1), self.__port(topo_id2))
+        for (source, target, port) in ((topo_id1, topo_id2, port1),
+                                       (topo_id2, topo_id1, port2)):
+            self.graph.add_link(source, target, port, None, weight)
+            self.routing.edge_added(source, target, weight)
+
+    def remove_link(self, link):
+        self.graph.remove_link(link.id)
+        self.routing.edge_removed(link.source, link.target, link.port1)
+
+    def set_weight(self, link, weight):
+        self.graph.set_weight(link.id, weight)
+        self.routing.edge_weight_changed(link.source,
+                                         link.target,
+                                         link.port1,
+                                         weight)
+
+    def add_host(self, topo_id_s):
+        topo_id_h = self.graph.add_node(Node.HOST,
+                                        macaddr=len(self.hosts)).id
+        self.hosts.append(topo_id_h)
+        port = self.__port(topo_id_s)
+        self.graph.add_link(topo_id_s, topo_id_h, port, None, 1)
+        self.routing.edge_added(topo_id_s, topo_id_h, 1)
+        self.graph.add_link(topo_id_h, topo_id_s, None, port, 1)
+        self.routing.edge_added(topo_id_h, topo_id_s, 1)
+
+    def remove_host(self, topo_id_h):
+        self.hosts.remove(topo_id_h)
+        self.graph.remove_node(topo_id_h)
+        self.routing.node_removed(topo_id_h)
+
+    def switch_links(self):
+        return [link for link in self.graph.links()
+                if not (self.graph.node(link.source).is_host
+                        or self.graph.node(link.target).is_host)]
+
+    def __port(self, topo_id):
+        self.ports[topo_id] += 1
+        return self.ports[topo_id]
+
+
+def backup_costs(graph, tree):
+    """
+    Cost of the loop free alternate of every node of tree
+    """
+    costs = {}
+    for (topo_id, (next_id, port)) in tree.backups.iteritems():
+        (link,) = [link for link in graph.links_between(topo_id, next_id)
+                   if link.port1 == port]
+        costs[topo_id] = tree.distances[next_id] + link.weight
+    return costs
+
+
+class RoutingEngineTest(unittest.TestCase):
+
+    def assertShortest(self, fabric):
+        graph = fabric.graph
+        for root in fabric.switches:
+            expected = distances_to(graph, root)
+            tree = fabric.routing.tree(root)
+            self.assertEqual(tree.distances, expected)
+            fresh = shortest_path_tree(graph.reverse_adjacency(), root)
+            self.assertEqual(backup_costs(graph, tree),
+                             backup_costs(graph, fresh))
+            for (topo_id, (next_id, port)) in tree.hops.iteritems():
+                links = [link for link in graph.links_between(topo_id, next_id)
+                         if link.port1 == port]
+                self.assertEqual(len(links), 1)
+                self.assertEqual(expected[next_id] + links[0].weight,
+                                 expected[topo_id])
+        for topo_id_h in fabric.hosts:
+            (topo_id_r,) = graph.successors(topo_id_h)
+            expected = distances_to(graph, topo_id_r)
+            for topo_id_s in fabric.switches:
+                port = fabric.routing.next_hop(topo_id_s, topo_id_h)
+                if topo_id_s not in expected:
+                    self.assertIsNone(port)
+                    continue
+                if topo_id_s == topo_id_r:
+                    self.assertEqual(
+                        graph.links_between(topo_id_s, topo_id_h)[0].port1,
+                        port)
+                    continue
+                (link,) = [link for link in graph.out_links(topo_id_s)
+                           if link.port1 == port]
+                self.assertEqual(expected[link.target] + link.weight,
+                                 expected[topo_id_s])
+
+    def test_routes_match_fresh_dijkstra_after_mutations(self):
+        rng = random.Random(3)
+        fabric = Fabric(16)
+        for _ in range(30):
+            (topo_id1, topo_id2) = rng.sample(fabric.switches, 2)
+            fabric.add_link(topo_id1, topo_id2, rng.randint(1, 4))
+        for topo_id_s in fabric.switches[:8]:
+            fabric.add_host(topo_id_s)
+        self.assertShortest(fabric)
+        for _ in range(200):
+            action = rng.random()
+            links = fabric.switch_links()
+            if action < 0.3 and links:
+                fabric.remove_link(rng.choice(links))
+            elif action < 0.6 and links:
+                fabric.set_weight(rng.choice(links), rng.randint(1, 4))
+            elif action < 0.8:
+                (topo_id1, topo_id2) = rng.sample(fabric.switches, 2)
+                fabric.add_link(topo_id1, topo_id2, rng.randint(1, 4))
+            elif action < 0.9 and fabric.hosts:
+                fabric.remove_host(rng.choice(fabric.hosts))
+            else:
+                fabric.add_host(rng.choice(fabric.switches))
+            self.assertShortest(fabric)
+
+    def test_changes_name_dropped_trees(self):
+        fabric = Fabric(3)
+        (a, b, c) = fabric.switches
+        fabric.add_link(a, b, 1)
+        fabric.add_link(b, c, 1)
+        for root in fabric.switches:
+            fabric.routing.tree(root)
+        self.assertIsNone(fabric.routing.take_changes())
+        (link,) = fabric.graph.links_between(b, c)
+        fabric.remove_link(link)
+        (roots, hosts) = fabric.routing.take_changes()
+        # Only the trees routing from b to c are affected
+        self.assertEqual(roots, set([c]))
+        self.assertEqual(hosts, set())
+
+    def test_adopt_refuses_outdated_snapshot(self):
+        fabric = Fabric(2)
+        (a, b) = fabric.switches
+        fabric.add_link(a, b, 1)
+        snapshot = fabric.routing.snapshot()
+        snapshot.trees[a] = shortest_path_tree(snapshot.adjacency, a)
+        fabric.add_host(a)
+        self.assertFalse(fabric.routing.adopt(snapshot))
+        self.assertNotIn(fabric.routing.tree(a), snapshot.trees.values())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import random
+import unittest
+
+from playground.controller.spanning_tree import SpanningTree, TreeDelta
+
+
+def kruskal_weight(links):
+    """
+    Weight of a minimum spanning forest of links, key -> (node1, node2,
+    weight), computed from scratch
+    """
+    parents = {}
+
+    def find(node):
+        while parents.get(node, node) != node:
+            node = parents[node]
+        return node
+
+    total = 0
+    for (node1, node2, weight) in sorted(links.itervalues(),
+                                         key=lambda link: link[2]):
+        (root1, root2) = (find(node1), find(node2))
+        if root1 != root2:
+            parents[root1] = root2
+            total += weight
+    return total
+
+
+def components(links):
+    parents = {}
+
+    def find(node):
+        while parents.get(node, node) != node:
+            node = parents[node]
+        return node
+
+    nodes = set()
+    for (node1, node2, _) in links.itervalues():
+        nodes.update((node1, node2))
+        (root1, root2) = (find(node1), find(node2))
+        if root1 != root2:
+            parents[root1] = root2
+    return len(set(find(node) for node in nodes)), len(nodes)
+
+
+class TreeDeltaTest(unittest.TestCase):
+
+    def test_merge_cancels_out(self):
+        delta = TreeDelta(added=[1, 2], removed=[3])
+        delta.merge(TreeDelta(added=[3], removed=[2]))
+        self.assertEqual(delta.added, set([1]))
+        self.assertEqual(delta.removed, set())
+
+    def test_empty_is_false(self):
+        self.assertFalse(TreeDelta())
+        self.assertTrue(TreeDelta(removed=[1]))
+
+
+class SpanningTreeTest(unittest.TestCase):
+
+    def assertMinimal(self, tree, links):
+        tree_links = set(tree.tree_links())
+        self.assertTrue(tree_links <= set(links))
+        self.assertEqual(sum(links[key][2] for key in tree_links),
+                         kruskal_weight(links))
+        (count, nodes) = components(links)
+        self.assertEqual(len(tree_links), nodes - count)
+
+    def test_replaces_heavier_tree_link(self):
+        tree = SpanningTree()
+        tree.add_link('ab', 'a', 'b', 1)
+        tree.add_link('bc', 'b', 'c', 5)
+        delta = tree.add_link('ac', 'a', 'c', 2)
+        self.assertEqual(delta.added, set(['ac']))
+        self.assertEqual(delta.removed, set(['bc']))
+        self.assertFalse(tree.is_tree_link('bc'))
+
+    def test_removing_non_tree_link_keeps_tree(self):
+        tree = SpanningTree()
+        tree.add_link('ab', 'a', 'b', 1)
+        tree.add_link('bc', 'b', 'c', 1)
+        tree.add_link('ac', 'a', 'c', 3)
+        self.assertFalse(tree.remove_link('ac'))
+        self.assertEqual(set(tree.tree_links()), set(['ab', 'bc']))
+
+    def test_replacements_are_cheapest_reconnecting_links(self):
+        tree = SpanningTree()
+        for (key, node1, node2, weight) in (('ab', 'a', 'b', 1),
+                                            ('bc', 'b', 'c', 1),
+                                            ('cd', 'c', 'd', 1),
+                                            ('ad', 'a', 'd', 4),
+                                            ('bd', 'b', 'd', 2)):
+            tree.add_link(key, node1, node2, weight)
+        self.assertEqual(tree.replacements(),
+                         {'ab': 'ad', 'bc': 'bd', 'cd': 'bd'})
+
+    def test_random_updates_match_kruskal(self):
+        rng = random.Random(7)
+        for with_replacements in (False, True):
+            tree = SpanningTree()
+            links = {}
+            for step in range(600):
+                if links and rng.random() < 0.4:
+                    key = rng.choice(sorted(links))
+                    del links[key]
+                    if with_replacements:
+                        tree.replacements()
+                    tree.remove_link(key)
+                elif links and rng.random() < 0.05:
+                    node = rng.randrange(30)
+                    for (key, (node1, node2, _)) in links.items():
+                        if node in (node1, node2):
+                            del links[key]
+                    tree.remove_node(node)
+                else:
+                    link = (rng.randrange(30), rng.randrange(30),
+                            rng.randint(1, 5))
+                    links[step] = link
+                    tree.add_link(step, *link)
+                self.assertEqual(set(tree.links()), set(links))
+                self.assertMinimal(tree, dict((key, link)
+                                              for (key, link)
+                                              in links.iteritems()
+                                              if link[0] != link[1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
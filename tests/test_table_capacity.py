@@ -0,0 +1,113 @@
+import itertools
+import unittest
+
+from tests import HAS_POX, requires_pox
+
+if HAS_POX:
+    from bench import fakepox
+
+    # Components bind pox.core.core on import, so the stand-in core has
+    # to be in place first
+    core = fakepox.install()
+
+    import pox.openflow.libopenflow_01 as of
+    from pox.lib.addresses import EthAddr
+
+    from playground.controller.flow_table import FlowEntry, flow_key
+    from playground.controller.table_capacity import TableCapacity
+
+TABLE_SIZE = 20
+
+dpids = itertools.count(1)
+
+
+def tutorial_flow(host):
+    # Like the flows of_tutorial installs
+    msg = of.ofp_flow_mod()
+    msg.match = of.ofp_match(dl_dst=EthAddr('00:00:00:00:01:{:02x}'
+                                            .format(host)))
+    msg.idle_timeout = 10
+    msg.flags = of.OFPFF_SEND_FLOW_REM
+    msg.actions.append(of.ofp_action_output(port=1))
+    return msg
+
+
+@requires_pox
+class TableCapacityTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dpid = next(dpids)
+        self.connection = fakepox.FakeConnection(
+            core, self.dpid, [fakepox.port(1, self.dpid)], TABLE_SIZE)
+        self.tables = TableCapacity(policy='evict', interval=0)
+        core.openflow.connect(self.connection)
+        core.run()
+
+    def tearDown(self):
+        core.openflow.disconnect(self.dpid)
+
+    def install(self, n):
+        for host in range(n):
+            self.connection.send(tutorial_flow(host))
+            self.tables.installed(self.dpid)
+        core.run()
+
+    def remove_as_switch(self, msg):
+        # The FlowRemoved the switch sends for a flow with
+        # OFPFF_SEND_FLOW_REM
+        self.connection.flows.pop(flow_key(msg.match, msg.priority), None)
+        core.deliver(self.connection, fakepox.FlowRemoved(
+            self.connection,
+            of.ofp_flow_removed(match=msg.match,
+                                priority=msg.priority,
+                                reason=of.OFPRR_DELETE)))
+        core.run()
+
+    def test_seeded_from_table_stats(self):
+        usage = self.tables.usage(self.dpid)
+        self.assertEqual((usage.capacity, usage.active), (TABLE_SIZE, 0))
+
+    def test_has_room_does_not_evict(self):
+        self.install(19)
+        self.assertFalse(self.tables.has_room(self.dpid))
+        self.assertFalse(self.connection.inbox)
+        self.assertEqual(self.tables.usage(self.dpid).active, 19)
+
+    def test_count_across_evict_and_flow_removed(self):
+        self.install(19)
+        # Flow counters to pick the idle flows by
+        self.connection.send(of.ofp_stats_request(
+            body=of.ofp_flow_stats_request()))
+        core.run()
+        self.assertTrue(self.tables.make_room(self.dpid))
+        evicted = [msg for msg in map(self.__unpack, self.connection.inbox)
+                   if msg.command == of.OFPFC_DELETE_STRICT]
+        self.assertTrue(evicted)
+        core.run()
+        usage = self.tables.usage(self.dpid)
+        self.assertEqual(usage.active, len(self.connection.flows))
+        # The switch reports the evicted flows as deleted
+        for msg in evicted:
+            self.remove_as_switch(msg)
+        self.assertEqual(usage.active, len(self.connection.flows))
+        # Flows removed for other reasons still count
+        self.remove_as_switch(next(self.connection.flows.itervalues()))
+        self.assertEqual(usage.active, len(self.connection.flows))
+
+    def test_admit_keeps_below_high_water(self):
+        desired = dict((flow.key, flow)
+                       for flow in (FlowEntry(tutorial_flow(host).match,
+                                              [of.ofp_action_output(port=1)])
+                                    for host in range(30)))
+        admitted = self.tables.admit(self.dpid, desired)
+        self.assertEqual(len(admitted), int(TABLE_SIZE * 0.95))
+
+    @staticmethod
+    def __unpack(data):
+        msg = of.ofp_flow_mod()
+        msg.unpack(data)
+        return msg
+
+
+if __name__ == '__main__':
+    unittest.main()
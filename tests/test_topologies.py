@@ -0,0 +1,59 @@
+import unittest
+from collections import Counter
+
+from playground import topologies
+
+
+def degrees(topo):
+    switches = set(topo.switches)
+    return Counter(node
+                   for link in topo.links
+                   if set(link) <= switches
+                   for node in link)
+
+
+class TopologiesTest(unittest.TestCase):
+
+    def test_ring(self):
+        topo = topologies.ring(5)
+        self.assertEqual(len(topo.switches), 5)
+        self.assertEqual(len(topo.hosts), 5)
+        self.assertEqual(set(degrees(topo).values()), set([2]))
+
+    def test_fat_tree(self):
+        k = 6
+        topo = topologies.fat_tree(k)
+        self.assertEqual(len(topo.switches), 5 * k * k // 4)
+        self.assertEqual(len(topo.hosts), k ** 3 // 4)
+        self.assertEqual(len(topo.links), 3 * k ** 3 // 4)
+        self.assertRaises(ValueError, topologies.fat_tree, 3)
+
+    def test_leaf_spine(self):
+        topo = topologies.leaf_spine(leaves=4, spines=2, oversubscription=2)
+        self.assertEqual(len(topo.switches), 6)
+        self.assertEqual(len(topo.hosts), 16)
+
+    def test_random_regular(self):
+        topo = topologies.random_regular(200, 8, seed=1)
+        self.assertEqual(len(topo.switches), 200)
+        self.assertEqual(set(degrees(topo).values()), set([8]))
+        switch_links = [tuple(sorted(link)) for link in topo.links
+                        if link[0].startswith('s') and link[1].startswith('s')]
+        self.assertEqual(len(switch_links), len(set(switch_links)))
+        self.assertTrue(all(node1 != node2
+                            for (node1, node2) in switch_links))
+        self.assertEqual(topologies.random_regular(200, 8, seed=1).links,
+                         topo.links)
+        self.assertRaises(ValueError, topologies.random_regular, 5, 3)
+
+    def test_edge_list_round_trip(self):
+        topo = topologies.fat_tree(4)
+        topo.add_switch()
+        copy = topologies.from_edge_list(topo.edge_list().splitlines())
+        self.assertEqual(copy.links, topo.links)
+        self.assertEqual(sorted(copy.switches), sorted(topo.switches))
+        self.assertEqual(sorted(copy.hosts), sorted(topo.hosts))
+
+
+if __name__ == '__main__':
+    unittest.main()